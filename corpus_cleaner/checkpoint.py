@@ -60,6 +60,7 @@ class Checkpoint:
     def declare_as_cleaned(self):
         self.args.done = True
         self.args.logger = None
+        self.args.time_budget = None
         if not self.args.only_reduce:
             with open(os.path.join(self.output_path, 'args.json'), 'w') as f:
                 json.dump(self.args.__dict__, f, indent=2)
@@ -1,12 +1,15 @@
 from corpus_cleaner.components.a_data_parser.data_parser import DataParser
 from corpus_cleaner.components.a_data_parser.data_parser_factory import DataParserFactory
+from corpus_cleaner.components.a_data_parser.document_chunker import ChunkReassembler
 from corpus_cleaner.components.b_encoding_fixer.encoding_fixer import EncodingFixer
 from corpus_cleaner.components.c_pre_filterer.pre_filterer import PreFilterer
+from corpus_cleaner.components.c_pre_filterer.pre_screener import PreScreener
 from corpus_cleaner.components.d_sentence_splitter_component.sentence_splitter_component import \
     SentenceSplitterComponent
 from corpus_cleaner.components.e_sentence_filter.sentence_filter import SentenceFilter
 from corpus_cleaner.components.f_normalizer.normalizer import Normalizer
 from corpus_cleaner.components.g_document_filter.document_filter import DocumentFilter
+from corpus_cleaner.components.g_document_filter.minhash_document_filter import MinHashDocumentFilter
 from corpus_cleaner.components.h_document_organizer.document_organizer import DocumentOrganizer
 from corpus_cleaner.components.i_output_formatter.output_formatter import OutputFormatter
 from corpus_cleaner.components.i_output_formatter.output_formatter_factory import OutputFormatterFactory
@@ -14,6 +17,7 @@ from typing import Iterable, List, Tuple
 from corpus_cleaner.components.cleaner_component import CleanerComponent
 from corpus_cleaner.document import Document
 from corpus_cleaner.checkpoint import Checkpoint
+from corpus_cleaner.time_budget import TimeBudget
 from collections import OrderedDict
 from corpus_cleaner.par_utils import MappingPipeline, PipelineLogger
 from corpus_cleaner.components.cleaner_component_reducer import DummyReducer
@@ -29,6 +33,7 @@ MAPPERS = [
     SentenceSplitterComponent, SentenceFilter, Normalizer
 ]
 REDUCER = DocumentFilter
+REDUCERS = [DocumentFilter, MinHashDocumentFilter]
 
 POSTMAPPERS = [DocumentOrganizer]
 
@@ -37,8 +42,8 @@ class Cleaner:
 
     @staticmethod
     def get_components_classes() -> List:
-        return [DataParser, EncodingFixer, PreFilterer, SentenceSplitterComponent, SentenceFilter, Normalizer,
-                DocumentFilter, DocumentOrganizer, OutputFormatter]
+        return [DataParser, PreScreener, EncodingFixer, PreFilterer, SentenceSplitterComponent, SentenceFilter,
+                Normalizer, DocumentFilter, MinHashDocumentFilter, DocumentOrganizer, OutputFormatter]
 
     @staticmethod
     def get_valid_input_output_formats() -> Tuple:
@@ -48,8 +53,14 @@ class Cleaner:
         self.args = args
         self.logger = PipelineLogger(logger)
         self.args.logger = self.logger
+        self.args.time_budget = TimeBudget(
+            document_budget=args.document_time_budget, component_budget=args.component_time_budget,
+            quarantine_dir=os.path.join(args.output_path, 'quarantine') if args.quarantine else None)
         self.mappers = MAPPERS
         self.tmp_dir = os.path.join(args.output_path, 'tmp')
+        # The debug reducer concatenates the onion files as they are; otherwise, the compact shards are only converted
+        # to onion's vertical format while feeding the document filter
+        self.tmp_format = 'onion' if args.debug else 'compact'
         if not checkpoint.resume:
             os.makedirs(self.tmp_dir)
         if args.components is not None:
@@ -57,6 +68,12 @@ class Cleaner:
             for comp in MAPPERS:
                 if comp.__name__ in args.components:
                     self.mappers.append(comp)
+        if PreFilterer in self.mappers and not args.debug and not args.no_pre_screening:
+            # Cheap first pass of the PreFilterer rejections, before the encoding fixer
+            self.mappers = [PreScreener] + self.mappers
+        if args.reassemble_chunks and not args.debug:
+            # Chunks of large documents (--max-document-chars) are joined back before being written
+            self.mappers = self.mappers + [ChunkReassembler]
         if not self.args.only_reduce:
             if self.args.no_reduce:
                 # set only mappers
@@ -67,8 +84,9 @@ class Cleaner:
             else:           
                 self.mappers = [lambda x: DataParserFactory.get_parser_mapper(x)] + self.mappers +\
                                [lambda x: OutputFormatterFactory.get_output_formatter_mapper(
-                                args=x, output_format='onion',
-                                output_path=os.path.join(self.tmp_dir, os.uname()[1] + '-' + str(os.getpid()) + '.onion'))]
+                                args=x, output_format=self.tmp_format,
+                                output_path=os.path.join(self.tmp_dir, os.uname()[1] + '-' + str(os.getpid()) + '.' +
+                                                         self.tmp_format))]
         else:
             class SentencePacker(CleanerComponentMapper):
 
@@ -78,8 +96,9 @@ class Cleaner:
 
             self.mappers = [lambda x: DataParserFactory.get_parser_mapper(x)] + [SentencePacker] + \
                            [lambda x: OutputFormatterFactory.get_output_formatter_mapper(
-                            args=self.args, output_format='onion',
-                            output_path=os.path.join(self.tmp_dir,  os.uname()[1] + '-' + str(os.getpid()) + '.onion'))]
+                            args=self.args, output_format=self.tmp_format,
+                            output_path=os.path.join(self.tmp_dir,  os.uname()[1] + '-' + str(os.getpid()) + '.' +
+                                                     self.tmp_format))]
 
         self.reducer = DummyReducer if (args.debug or args.no_reduce) else REDUCER
 
@@ -87,8 +106,9 @@ class Cleaner:
         if args.components is not None and not self.args.debug:
             self.reducer = None
             for comp in args.components:
-                if comp == REDUCER.__name__:
-                    self.reducer = REDUCER
+                reducers = [reducer for reducer in REDUCERS if reducer.__name__ == comp]
+                if len(reducers) > 0:
+                    self.reducer = reducers[0]
                     break
                 
         self.postmappers = POSTMAPPERS
@@ -105,6 +125,9 @@ class Cleaner:
     def add_args(parser: argparse.ArgumentParser):
         parser.add_argument('--components', type=str, help='Elements of the pipeline', nargs='+',
                             default=list(map(lambda x: x.__name__, MAPPERS + [REDUCER] + POSTMAPPERS)))
+        parser.add_argument('--dedup', type=str, choices=['onion', 'minhash'], default='onion',
+                            help='Document deduplication: near-exact n-gram overlap (onion, DocumentFilter) or fuzzy '
+                                 'duplicates (minhash, MinHashDocumentFilter); it replaces the reducer in --components')
         parser.add_argument('--parallel', action='store_true', help='Run the cleaner in parallel')
         parser.add_argument('--log-every-iter', type=int, default=-1, help='Log the pipeline every N iterations'
                                                                            '(-1, silent)')
@@ -115,11 +138,26 @@ class Cleaner:
                             help='Activate the debug error mode to compare the original and cleaned sentences')
         parser.add_argument('--no-reduce', action='store_true',
                             help='suppress document filter component')
+        parser.add_argument('--document-time-budget', type=float, default=-1,
+                            help='Maximum time (seconds) spent by the mappers on a document; documents exceeding it are'
+                                 ' dropped (-1 for no limit)')
+        parser.add_argument('--component-time-budget', type=float, default=-1,
+                            help='Maximum time (seconds) spent by any mapper on a document; documents exceeding it are'
+                                 ' dropped (-1 for no limit)')
+        parser.add_argument('--quarantine', action='store_true',
+                            help='Write the documents dropped for exceeding a time budget, with the reason, to '
+                                 'OUTPUT_PATH/quarantine (JSON lines, one file per process)')
 
     @staticmethod
     def check_args(args: argparse.Namespace):
+        if args.dedup == 'minhash' or MinHashDocumentFilter.__name__ in args.components:
+            # The default components include DocumentFilter; swap it for MinHashDocumentFilter (only one reducer runs)
+            args.dedup = 'minhash'
+            components = [MinHashDocumentFilter.__name__ if comp == DocumentFilter.__name__ else comp
+                          for comp in args.components]
+            args.components = [comp for idx, comp in enumerate(components) if comp not in components[:idx]]
         for comp in args.components:
-            if comp not in list(map(lambda x: x.__name__, MAPPERS + [REDUCER] + POSTMAPPERS)):
+            if comp not in list(map(lambda x: x.__name__, MAPPERS + REDUCERS + POSTMAPPERS)):
                 raise Exception('Unknown component', comp)
         assert args.log_every_iter == -1 or args.log_every_iter >= 1
         # TODO: add more checks (eg. sentence splitting requirement for other components
@@ -184,7 +222,7 @@ class Cleaner:
                 for idx, c in enumerate(self.mappers):
                     if idx not in [0, len(self.mappers) - 1]:
                         components_str += c.__name__ + ' -> '
-                components_str += 'onion'
+                components_str += self.tmp_format
                 self.logger.logger.info(components_str)
                 pipeline = MappingPipeline(streams=self._get_paths(),
                                            mappers_factory=self._create_pipeline_mappers,
@@ -213,5 +251,6 @@ class Cleaner:
                                            checkpoint_path=None)
                 pipeline.run()
             else:
-                self._output(self.reducer.get_documents()[0])
+                # The reduced file is parsed in chunks by a process pool, and written in order
+                self._output(self.reducer.get_documents(processes=os.cpu_count() if self.args.parallel else 1)[0])
 
@@ -3,9 +3,11 @@ from .wikipedia_parser import WikipediaParser
 from .bsc_crawl_json_parser import BSCCrawlJSONParser
 from .data_parser_factory import DataParserFactory
 from .onion_parser import OnionParser
+from .compact_parser import CompactParser
 from .fairseq_lm_parser import FairseqLMParser
 from .sentence_parser import SentenceParser
 from .document_parser import DocumentParser
+from .document_chunker import ChunkReassembler
 
-__all__ = ['DataParser', 'WikipediaParser', 'BSCCrawlJSONParser', 'OnionParser', 'FairseqLMParser', 'DataParserFactory',
-           'SentenceParser', 'DocumentParser']
+__all__ = ['DataParser', 'WikipediaParser', 'BSCCrawlJSONParser', 'OnionParser', 'CompactParser', 'FairseqLMParser', 'DataParserFactory',
+           'SentenceParser', 'DocumentParser', 'ChunkReassembler']
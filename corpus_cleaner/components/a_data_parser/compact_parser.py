@@ -0,0 +1,70 @@
+from .data_parser import DataParser
+from typing import Iterable, List
+from corpus_cleaner.document import Document
+from typing import TextIO
+from typing import Tuple
+import argparse
+from typing import Optional
+from corpus_cleaner.compression import open_text
+
+
+def read_compact(fd: TextIO, path: Optional[str] = None) -> Iterable[Tuple[str, List[str]]]:
+    """
+    Reads a file written by CompactOutputFormatter.
+    :param fd: Text file object.
+    :param path: Path of the file, for error messages (by default, the name of the file object).
+    :return: Iterable of (attributes string, sentences) tuples, one per document.
+    :raise ValueError: If the file is truncated or malformed.
+    """
+    for header in fd:
+        n_sentences, sep, attrs = header.rstrip('\n').partition('\t')
+        if not sep or not n_sentences.isdecimal():
+            raise ValueError(f'Malformed compact file {path or getattr(fd, "name", None)}: bad document header '
+                             f'{header.rstrip()!r}')
+        sentences = []
+        for _ in range(int(n_sentences)):
+            line = fd.readline()
+            if not line:
+                raise ValueError(f'Truncated compact file {path or getattr(fd, "name", None)}: document '
+                                 f'{header.rstrip()!r} ends after {len(sentences)} of {n_sentences} sentences')
+            sentences.append(line.rstrip('\n'))
+        yield attrs, sentences
+
+
+def read_compact_files(paths: List[str]) -> Iterable[Tuple[str, List[str]]]:
+    """
+    :param paths: Paths of (possibly compressed) files written by CompactOutputFormatter.
+    :return: Iterable of (attributes string, sentences) tuples of all the files, in order.
+    """
+    for path in paths:
+        with open_text(path) as fd:
+            yield from read_compact(fd, path)
+
+
+def compact_to_vertical(fd: TextIO, path: Optional[str] = None) -> Iterable[str]:
+    """
+    Streams a compact file as onion's vertical format (one word per line, an empty line between sentences, and
+    <doc>...</doc> around every document), so that the vertical representation never needs to be stored on disk.
+    :param fd: Text file object of a file written by CompactOutputFormatter.
+    :param path: Path of the file, for error messages.
+    :return: Iterable of strings with the vertical format of every document.
+    """
+    for attrs, sentences in read_compact(fd, path):
+        # Words in compact sentences are separated by single spaces
+        yield f'<doc {attrs}>\n' + '\n'.join(sentence.replace(' ', '\n') + '\n' for sentence in sentences) + \
+              '</doc>\n'
+
+
+class CompactParser(DataParser):
+    def __init__(self, args: argparse.Namespace, extensions: List[str] = ['.compact'],
+                 input_path: Optional[str] = None,
+                 **kwargs):
+        super(CompactParser, self).__init__(args, encoding='utf-8',
+                                            input_path=args.output_path if input_path is None else input_path,
+                                            extensions=extensions, **kwargs)
+
+    def _parse_file(self, fd: TextIO, relative_filepath: str, idx_filepath: int) -> Iterable[Document]:
+        for attrs, sentences in read_compact(fd, relative_filepath):
+            doc = Document.parse_str(attrs) if len(attrs) > 0 else Document(content='')
+            doc.sentences = sentences
+            yield doc
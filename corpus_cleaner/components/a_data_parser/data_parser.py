@@ -5,15 +5,37 @@ import os
 from typing import Tuple
 import glob
 from corpus_cleaner.components.cleaner_component import CleanerComponent
+from corpus_cleaner.compression import COMPRESSION_EXTENSIONS, open_binary, open_text, strip_compression_extension
+from .document_chunker import chunk_document
 import argparse
 from typing import Iterable, List, Optional
-import gzip
 from urllib.parse import urlparse
 import re
 from typing import Dict
 import time
 
 TIMEOUT_ENCODING_GUESSING = 5.0
+# <doc ...> headers whose attribute values don't need any XML processing (no entities, no characters that ElementTree
+# rejects or normalizes), so that their values are the same with or without an XML parser
+SIMPLE_DOC_HEADER_RE = re.compile(r'<doc((?:[ \t]+[A-Za-z_][A-Za-z0-9_.-]*="[^"&<\\\x00-\x1f\ufffe\uffff]*")*)[ \t]*>')
+SIMPLE_ATTR_RE = re.compile(r'([A-Za-z_][A-Za-z0-9_.-]*)="([^"]*)"')
+
+
+def simple_doc_attributes(header: str) -> Optional[Dict[str, str]]:
+    """
+    Parses the attributes of a <doc ...> header with a regular expression, instead of building an XML element.
+    :param header: Header line, without trailing whitespace.
+    :return: Attributes, or None if the header is not simple enough (eg. it has entities or repeated attributes) and
+    must be parsed as XML.
+    """
+    match = SIMPLE_DOC_HEADER_RE.fullmatch(header)
+    if match is None:
+        return None
+    attributes = SIMPLE_ATTR_RE.findall(match.group(1))
+    res = dict(attributes)
+    if len(res) != len(attributes):
+        return None
+    return res
 
 
 class DataParser(CleanerComponent):
@@ -29,17 +51,30 @@ class DataParser(CleanerComponent):
         parser.add_argument('--url-doc', type=str, help='Path to a url list (plain text, one url per line)'
                                                         'that should be filtered and processed', default=None)
         parser.add_argument('--warc-warn', action='store_true', help='Enable warnings of WARC parser')
+        parser.add_argument('--max-document-chars', type=int,
+                            help='Split documents longer than this number of characters into paragraph-aligned chunks, '
+                                 'which are processed as independent documents (default: no limit)', default=None)
+        parser.add_argument('--reassemble-chunks', action='store_true',
+                            help='Join the chunks of the documents split with --max-document-chars before writing them '
+                                 '(ignored in debug mode)')
+        parser.add_argument('--compressed-input', action='store_true',
+                            help='Also read the gzip and zstd compressed variants of the input extensions (eg. '
+                                 'output.txt.gz for .txt). If both a file and its compressed variant exist, only the '
+                                 'uncompressed one is read')
 
     @staticmethod
     def check_args(args: argparse.Namespace):
         # TODO check custom args
         if args.url_doc is not None and args.input_format not in ['bsc-crawl-json', 'warc']:
             raise RuntimeError('--url-doc can only be used with --input-format bsc-crawl-json or warc')
+        if args.reassemble_chunks and (args.max_document_chars is None or args.max_document_chars <= 0):
+            raise RuntimeError('--reassemble-chunks can only be used with --max-document-chars')
 
     def __init__(self, args: argparse.Namespace, input_path: Optional[str] = None,
                  extensions: Optional[List[str]] = None,
                  encoding: str = 'auto', encoding_threshold: float = 0.9, encoding_error_policy: str = 'ignore',
-                 bytes_: bool = False, url_filter: Optional[str] = None, done_paths: Iterable[str] = ()):
+                 bytes_: bool = False, url_filter: Optional[str] = None, done_paths: Iterable[str] = (),
+                 max_document_chars: int = -1, compressed_input: bool = False):
         # TODO: Revisit defaults
         super().__init__(args)
         self.input_path = input_path if input_path is not None else args.input_path
@@ -61,6 +96,9 @@ class DataParser(CleanerComponent):
                         self.url_filter[idx] = 'http://' + url
                 self.url_filter = [urlparse(url) for url in self.url_filter]
         self.done_paths = set(done_paths)
+        self.max_document_chars = args.max_document_chars if args.max_document_chars is not None else \
+            max_document_chars
+        self.compressed_input = args.compressed_input if args.compressed_input is not None else compressed_input
 
     def _check_url(self, url: Optional[str]) -> bool:
         def url_belongs_to(u1, u2):
@@ -94,31 +132,24 @@ class DataParser(CleanerComponent):
         if self.bytes:
             with open(abs_path, 'rb') as f:
                 for idx, doc in enumerate(self._parse_binary_file(f, relative_filepath, idx_filepath)):
+                    if self.debug:
+                        doc.keep_original()
                     if self.url_filter is not None:
                         url = doc.url
                         if self._check_url(url):
-                            yield doc
+                            yield from chunk_document(doc, self.max_document_chars, idx, keep_original=self.debug)
                     else:
-                        yield doc
+                        yield from chunk_document(doc, self.max_document_chars, idx, keep_original=self.debug)
         else:
-            gz = False
-            extension = os.path.splitext(relative_filepath)[1][1:].strip()
-            if extension == 'gz':
-                gz = True
-            enc, confidence_ok = self._guess_encoding(abs_path, gz=gz) if self.encoding == 'auto' else (self.encoding,
-                                                                                                        True)
-            if not gz:
-                with open(abs_path, 'r', encoding=enc, errors=self.encoding_error_policy) as f:
-                    for idx, doc in enumerate(self._parse_file(f, relative_filepath, idx_filepath)):
-                        if enc != 'utf-8':
-                            pass  # TODO: Check possible problems when the original file was not utf-8
-                        yield doc
-            else:
-                with gzip.open(abs_path, 'rt', encoding=enc, errors=self.encoding_error_policy) as f:
-                    for idx, doc in enumerate(self._parse_file(f, relative_filepath, idx_filepath)):
-                        if enc != 'utf-8':
-                            pass  # TODO: Check possible problems when the original file was not utf-8
-                        yield doc
+            enc, confidence_ok = self._guess_encoding(abs_path) if self.encoding == 'auto' else (self.encoding, True)
+            with open_text(abs_path, encoding=enc, errors=self.encoding_error_policy) as f:
+                for idx, doc in enumerate(self._parse_file(f, relative_filepath, idx_filepath)):
+                    if enc != 'utf-8':
+                        pass  # TODO: Check possible problems when the original file was not utf-8
+                    if self.debug:
+                        # The original content is only needed to compare it with the cleaned one
+                        doc.keep_original()
+                    yield from chunk_document(doc, self.max_document_chars, idx, keep_original=self.debug)
 
     def _parse(self) -> List[Iterable[Document]]:
         parse_iterables = []
@@ -137,39 +168,41 @@ class DataParser(CleanerComponent):
     def _get_relative_filepaths(self) -> Iterable[str]:
         self.logger.logger.info('Getting relative filepaths')
         relative_paths = []
+        patterns = []
         for extension in self.extensions:
-            for path in glob.glob(
-                    os.path.join(self.input_path, '**', f'*{extension}' if '*' not in extension else extension),
-                    recursive=True):
+            patterns.append(f'*{extension}' if '*' not in extension else extension)
+            # Compressed outputs of previous runs (eg. output.txt.gz) can be read directly by text parsers
+            if self.compressed_input and not self.bytes and '*' not in extension:
+                patterns.extend(f'*{extension}{compressed_extension}'
+                                for compressed_extension in COMPRESSION_EXTENSIONS.values())
+        for pattern in patterns:
+            for path in glob.glob(os.path.join(self.input_path, '**', pattern), recursive=True):
                 if os.path.isfile(path) and path not in self.done_paths:
                     relative_paths.append(path)
+        relative_paths = set(relative_paths)
+        if self.compressed_input:
+            # A file and its compressed copy (eg. a backup) would be cleaned twice
+            for path in sorted(relative_paths):
+                stripped_path = strip_compression_extension(path)
+                if stripped_path != path and stripped_path in relative_paths:
+                    self.logger.logger.warning(f'Skipping {path}, since {stripped_path} is also in the input')
+                    relative_paths.remove(path)
         return sorted(relative_paths)
 
-    def _guess_encoding(self, path: str, gz: bool):
+    def _guess_encoding(self, path: str):
         # https://stackoverflow.com/questions/46037058/using-chardet-to-find-encoding-of-very-large-file/49621821
         self.detector.reset()
         t0 = time.process_time()
         timeout = False
-        if not gz:
-            with open(path, 'rb') as f:
-                for row in f:
-                    self.detector.feed(row)
-                    if self.detector.done :
-                        break
-                    t1 = time.process_time()
-                    if t1 - t0 > TIMEOUT_ENCODING_GUESSING:
-                        timeout = True
-                        break
-        else:
-            with gzip.open(path, 'rb') as f:
-                for row in f:
-                    self.detector.feed(row)
-                    if self.detector.done:
-                        break
-                    t1 = time.process_time()
-                    if t1 - t0 > TIMEOUT_ENCODING_GUESSING:
-                        timeout = True
-                        break
+        with open_binary(path) as f:
+            for row in f:
+                self.detector.feed(row)
+                if self.detector.done:
+                    break
+                t1 = time.process_time()
+                if t1 - t0 > TIMEOUT_ENCODING_GUESSING:
+                    timeout = True
+                    break
         self.detector.close()
         if timeout:
             encoding = 'utf-8'
@@ -3,6 +3,7 @@ from .bsc_crawl_json_parser import BSCCrawlJSONParser
 from .fairseq_lm_parser import FairseqLMParser
 from .sentence_parser import SentenceParser
 from .onion_parser import OnionParser
+from .compact_parser import CompactParser
 from .warc_parser import WARCParser
 from .data_parser import DataParser
 from .data_parser_mapper import DataParserMapper
@@ -41,6 +42,9 @@ class DataParserFactory:
             if input_format == 'onion':
                 args.encoding = 'utf-8'
                 return OnionParser(args, input_path=input_path, **kwargs)
+            elif input_format == 'compact':
+                args.encoding = 'utf-8'
+                return CompactParser(args, input_path=input_path, **kwargs)
             raise NotImplementedError()
 
     @staticmethod
@@ -0,0 +1,101 @@
+from corpus_cleaner.document import Document
+from corpus_cleaner.components.cleaner_component import CleanerComponent
+import argparse
+from typing import Iterable, List, Optional
+
+
+def split_chunks(content: str, max_chars: int) -> List[str]:
+    """
+    Splits a text into chunks of at most max_chars characters, aligned to paragraphs: every chunk ends at the last
+    newline that fits, or at the last whitespace character if there is none, or at max_chars if there is none either.
+    Joining the chunks gives back the text.
+    :param content: Text.
+    :param max_chars: Maximum number of characters of a chunk.
+    :return: Chunks.
+    """
+    chunks = []
+    start = 0
+    while len(content) - start > max_chars:
+        end = content.rfind('\n', start, start + max_chars)
+        if end == -1:
+            end = start + max_chars - 1
+            while end > start and not content[end].isspace():
+                end -= 1
+        if end <= start:
+            end = start + max_chars - 1
+        chunks.append(content[start:end + 1])
+        start = end + 1
+    chunks.append(content[start:])
+    return chunks
+
+
+def chunk_document(document: Document, max_chars: int, ordinal: int, keep_original: bool = False) -> \
+        Iterable[Document]:
+    """
+    :param document: Parsed document (before sentence splitting).
+    :param max_chars: Maximum number of characters of a document (-1 for no limit).
+    :param ordinal: Index of the document in its file, which identifies its chunks (ids may be missing or repeated).
+    :param keep_original: Whether the chunks must keep their original content (debug mode).
+    :return: The document itself, if it is not longer than max_chars, or its chunks (see split_chunks), with the
+    attributes of the document and (ordinal, index, number of chunks) in the chunk attribute.
+    """
+    if max_chars <= 0 or len(document.content) <= max_chars or document.sentences:
+        yield document
+        return
+    chunks = split_chunks(document.content, max_chars)
+    for idx, content in enumerate(chunks):
+        yield Document(content=content, filename=document.filename, title=document.title, url=document.url,
+                       id_=document.id, keywords=document.keywords, heads=document.heads, language=document.language,
+                       chunk=(ordinal, idx, len(chunks)), keep_original=keep_original)
+
+
+class ChunkReassembler(CleanerComponent):
+    @staticmethod
+    def add_args(parser: argparse.ArgumentParser):
+        pass
+
+    @staticmethod
+    def check_args(args: argparse.Namespace):
+        pass
+
+    def __init__(self, args: argparse.Namespace):
+        """
+        Joins the chunks of the documents split by the data parser (--max-document-chars) back into a single document,
+        with the sentences of the chunks that were not discarded, in order. Chunks of the same document are consecutive
+        in the stream of a file, so only the chunks of one document are kept in memory. Chunks are matched by file and
+        document ordinal, so the chunks of a document are never joined to the ones of another document, even if some of
+        them have been discarded.
+        """
+        super().__init__(args)
+
+    @staticmethod
+    def _join(chunks: List[Document]) -> Document:
+        document = chunks[0]
+        if len(chunks) > 1:
+            document.content = ''.join(chunk.content for chunk in chunks)
+            document.sentences = [sentence for chunk in chunks for sentence in (chunk.sentences or [])]
+        document.chunk = None
+        return document
+
+    @staticmethod
+    def _same_document(chunk: Document, previous: Document) -> bool:
+        return chunk.filename == previous.filename and chunk.chunk[0] == previous.chunk[0] and \
+            chunk.chunk[1] > previous.chunk[1]
+
+    def __call__(self, documents: Iterable[Optional[Document]]) -> Iterable[Optional[Document]]:
+        chunks = []
+        for document in documents:
+            if document is None:
+                continue
+            if chunks and (document.chunk is None or not self._same_document(document, chunks[-1])):
+                yield self._join(chunks)
+                chunks = []
+            if document.chunk is None:
+                yield document
+                continue
+            chunks.append(document)
+            if document.chunk[1] == document.chunk[2] - 1:
+                yield self._join(chunks)
+                chunks = []
+        if chunks:
+            yield self._join(chunks)
@@ -1,8 +1,8 @@
-from .data_parser import DataParser
+from .data_parser import DataParser, simple_doc_attributes
 from typing import Iterable, List
 from corpus_cleaner.document import Document
 from typing import TextIO
-from typing import Tuple
+from typing import Optional, Tuple
 import argparse
 import xml.etree.ElementTree as ET
 from xml.sax.saxutils import escape, unescape
@@ -15,49 +15,46 @@ class DocumentParser(DataParser):
         self.url = re.compile('(url=\")(.*)(\"\s)')
         self.tags = re.compile('<.*?>')
 
+    def _parse_header(self, header: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        :param header: First line of a document.
+        :return: (url, id) tuple of the document (both None if the header has no url).
+        """
+        url_search = self.url.search(header)
+        if not url_search:
+            return None, None
+        attribs = simple_doc_attributes(header)
+        if attribs is not None and 'url' in attribs and 'id' in attribs:
+            return attribs['url'], attribs['id']
+        # Fallback for headers with entities or characters that must go through the XML parser
+        url = url_search.group(2)
+        escaped_url = escape(url)
+        header = self.url.sub('\\1' + escaped_url + '\\3', header)
+        tree = ET.fromstring(header + '</doc>')
+        return unescape(tree.attrib['url']), tree.attrib['id']
+
+    def _parse_document(self, raw: List[str], relative_filepath: str) -> Document:
+        ls = ''.join(raw).splitlines()
+        url, id_ = self._parse_header(ls[0])
+        # Lines are accumulated in lists, since repeated concatenation is quadratic for big documents
+        content = ''.join(self.tags.sub('', l) + '\n' for l in ls[1:-1] if l.startswith('<p'))
+        return Document(content=content, sentences=None, filename=relative_filepath, title=None, url=url, id_=id_,
+                        keywords=None, heads=None, language=None)
+
     def _parse_file(self, fd: TextIO, relative_filepath: str, idx_filepath: int) -> Iterable[Document]:
-        raw = ''
+        raw = []
         for line in fd:
             if line[0:4] == '<doc':
                 if len(raw) > 0:
                     try:
-                        ls = raw.splitlines()
-                        l1 = ls[0]
-                        url_search = self.url.search(l1)
-                        if url_search:
-                            url = url_search.group(2)
-                            escaped_url = escape(url)
-                            l1 = self.url.sub('\\1' + escaped_url + '\\3', l1)
-                            tree = ET.fromstring(l1 + '</doc>')
-                            sentences = None
-                            filename = relative_filepath
-                            title = None
-                            url = unescape(tree.attrib['url'])
-                            id_ = tree.attrib['id']
-                            keywords = None
-                            heads = None
-                            language = None
-                        else:
-                            sentences = None
-                            filename = relative_filepath
-                            title = None
-                            url = None
-                            id_ = None
-                            keywords = None
-                            heads = None
-                            language = None
-                        content = ''
-                        for l in ls[1:-1]:
-                            if l.startswith('<p'):
-                                content += self.tags.sub('', l) + '\n'
+                        document = self._parse_document(raw, relative_filepath)
                     except BaseException as e:
                         self.logger.logger.info(e)
-                        raw = ''
+                        raw = []
                         continue
 
-                    yield Document(content=content, sentences=sentences, filename=filename, title=title, url=url,
-                                   id_=id_, keywords=keywords, heads=heads, language=language)
+                    yield document
 
-                raw = line
+                raw = [line]
             else:
-                raw += line
+                raw.append(line)
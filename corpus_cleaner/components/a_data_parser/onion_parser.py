@@ -1,52 +1,192 @@
 from .data_parser import DataParser
 from typing import Iterable, List
 from corpus_cleaner.document import Document
-from typing import TextIO
+from corpus_cleaner.compression import compression_from_path, open_binary
+from typing import BinaryIO
 from typing import Tuple
+from collections import deque
 import argparse
+import itertools
+import multiprocessing
+import os
 from typing import Optional
 
+# Size (in bytes) of the chunks parsed in parallel by OnionParser.parse_parallel
+CHUNK_SIZE = 64 * 1024 * 1024
+# Size (in bytes) of the blocks read at once by read_line_blocks
+READ_SIZE = 16 * 1024 * 1024
+DOC_END_LINES = (b'</doc>\n', b'0\t</doc>\n', b'1\t</doc>\n')
+CORPORA_TAGS = (b'<corpora>', b'</corpora>')
+LT = ord('<')
+ZERO = ord('0')
+
+
+def read_line_blocks(fd: BinaryIO, size: Optional[int] = None) -> Iterable[List[bytes]]:
+    """
+    Reads a binary file in large blocks, and splits every block into lines at once.
+    :param fd: Binary file object.
+    :param size: Number of bytes to read from the current position (None, until the end of the file).
+    :return: Iterable of lists of lines, without line breaks.
+    """
+    rest = b''
+    while size is None or size > 0:
+        block = fd.read(READ_SIZE if size is None else min(READ_SIZE, size))
+        if len(block) == 0:
+            break
+        if size is not None:
+            size -= len(block)
+        lines = (rest + block).split(b'\n')
+        rest = lines.pop()
+        yield lines
+    if len(rest) > 0:
+        yield [rest]
+
+
+def _encode_lines(lines: Iterable[str], block_lines: int = 65536) -> Iterable[List[bytes]]:
+    # Same blocks as read_line_blocks, from text lines
+    lines = iter(lines)
+    while True:
+        block = [(line[:-1] if line.endswith('\n') else line).encode('utf-8')
+                 for line in itertools.islice(lines, block_lines)]
+        if len(block) == 0:
+            break
+        yield block
+
+
+def _parse_header(token: bytes, parse_metadata: bool, errors: str) -> Document:
+    attrs = token[len(b'<doc'):-1] if token.endswith(b'>') else token[len(b'<doc'):]
+    if not parse_metadata or len(attrs.strip()) == 0:
+        return Document(content='')
+    return Document.parse_str(attrs.decode('utf-8', errors=errors).strip())
+
+
+def parse_onion_blocks(blocks: Iterable[List[bytes]], debug: bool, parse_metadata: bool = True,
+                       errors: str = 'strict') -> Iterable[Document]:
+    """
+    Parses onion's output format (or the debug reducer's one, without the duplicate marks). Lines are handled as bytes,
+    and only the words of kept lines (marked 0) are decoded, once per sentence.
+    :param blocks: Iterable of lists of lines without line breaks (see read_line_blocks).
+    :param debug: Whether the lines come from the debug reducer (no duplicate marks).
+    :param parse_metadata: Whether to parse the attributes of the <doc ...> headers.
+    :param errors: Encoding error policy.
+    :return: Iterable of the (non-duplicate) documents.
+    """
+    doc_sentences = []
+    par_words: List[bytes] = []
+    doc = Document(content='')
+    # Tokens start after the duplicate mark ("0\t" or "1\t")
+    start = 0 if debug else 2
+    for lines in blocks:
+        for line in lines:
+            token = line[start:]
+            # Word lines (by far the most common ones) are checked first
+            if len(token) > 0 and token[0] != LT:
+                if debug or line[0] == ZERO:
+                    par_words.append(token)
+            # An empty line closes a paragraph, and </doc> closes both the paragraph and the document
+            elif len(token) == 0 or token == b'</doc>':
+                if par_words:
+                    doc_sentences.append(b' '.join(par_words).decode('utf-8', errors=errors))
+                    par_words = []
+                # The last paragraph may have been removed (paragraph-level deduplication) while the previous ones
+                # were kept, so the document is closed regardless
+                if len(token) > 0:
+                    if doc_sentences:
+                        doc.sentences = doc_sentences
+                        yield doc
+                    doc_sentences = []
+            elif token.startswith(b'<doc'):
+                doc = _parse_header(token, parse_metadata, errors)
+            elif token in CORPORA_TAGS:
+                continue
+            elif debug or line[0] == ZERO:
+                par_words.append(token)
+
+
+def split_onion_file(path: str, chunk_size: int = CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """
+    :param path: Path of an (uncompressed) file in onion's output format.
+    :param chunk_size: Approximate size of the chunks, in bytes.
+    :return: (start, end) byte offsets of consecutive chunks, each one ending right after a </doc> line.
+    """
+    size = os.path.getsize(path)
+    chunks = []
+    start = 0
+    with open(path, 'rb') as fd:
+        while start < size:
+            fd.seek(start + chunk_size)
+            if fd.tell() >= size:
+                chunks.append((start, size))
+                break
+            # Skips the (possibly partial) line at the seek position
+            fd.readline()
+            for line in fd:
+                if line in DOC_END_LINES:
+                    break
+            end = fd.tell()
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def _parse_chunk(args: Tuple[str, int, Optional[int], bool, bool, str]) -> List[Document]:
+    path, start, end, debug, parse_metadata, errors = args
+    with open_binary(path) as fd:
+        if start > 0:
+            fd.seek(start)
+        return list(parse_onion_blocks(read_line_blocks(fd, None if end is None else end - start), debug,
+                                       parse_metadata, errors))
+
 
 class OnionParser(DataParser):
     def __init__(self, args: argparse.Namespace, extensions: List[str] = ['.dedup'],
-                 input_path: Optional[str] = None,
+                 input_path: Optional[str] = None, parse_metadata: bool = True,
                  **kwargs):
+        """
+        :param parse_metadata: Whether to parse the document attributes (eg. not needed if only the sentences are
+        written).
+        """
         super(OnionParser, self).__init__(args, encoding='utf-8',
                                           input_path=args.output_path if input_path is None else input_path,
                                           extensions=extensions, **kwargs)
+        self.parse_metadata = parse_metadata
 
-    def _parse_file(self, fd: TextIO, relative_filepath: str, idx_filepath: int) -> Iterable[Document]:
-        doc_sentences = []
-        par_words : List[str] = []
-        doc = Document(content='')
-        for line in fd:
-            if not self.debug:
-                line_index = line.split('\t')[0]
-                line = '\t'.join(line.split('\t')[1:])
-
-            # ignore the first two lines with the start tags
-            if line.startswith('<doc'):
-                sp = line.split()
-                if len(sp) > 2:
-                    doc = Document.parse_str(sp[1:-1])
-                else:
-                    doc = Document(content='')
-
-            # If words in paragraph, merge words of paragraphs to create the sentence paragraph
-            # based on \n as document boundary and empty the list of words.
-            # Empty the document sentences list when a new document is reached (</p> tag) and return the document object
-            elif line  in ['</doc>\n', '\n']:
-                if par_words:
-                    par_sentence = ' '.join(par_words)
-                    doc_sentences.append(par_sentence)
-                    par_words = []
-                    if line == '</doc>\n':
-                        doc.sentences = doc_sentences
-                        yield doc
-                        doc_sentences = []
-            elif line in ['<corpora>\n', '</corpora>\n', '<doc>\n']:
-                continue
+    def parse_stream(self, lines: Iterable[str]) -> Iterable[Document]:
+        """
+        :param lines: Lines in onion's output format (eg. piped from onion instead of read from a file).
+        :return: Iterable of documents, as parsed from the files.
+        """
+        return parse_onion_blocks(_encode_lines(lines), self.debug, self.parse_metadata, self.encoding_error_policy)
+
+    def parse_parallel(self, processes: int, chunk_size: int = CHUNK_SIZE) -> List[Iterable[Document]]:
+        """
+        Same as parse, but every file is split into chunks at document boundaries (see split_onion_file) and the chunks
+        are parsed in a process pool. Documents are returned in the same order.
+        :param processes: Number of processes.
+        :param chunk_size: Approximate size of the chunks, in bytes.
+        :return: List of iterables of documents, one per file.
+        """
+        return [self._parse_file_parallel(path, processes, chunk_size)
+                for path in sorted(self._get_relative_filepaths())]
+
+    def _parse_file_parallel(self, path: str, processes: int, chunk_size: int) -> Iterable[Document]:
+        if compression_from_path(path) != 'none':
+            # Compressed files can't be split without decompressing them
+            chunks = [(0, None)]
+        else:
+            chunks = split_onion_file(path, chunk_size)
+        # Bounded number of chunks in flight, so that the parsed documents don't pile up in memory
+        with multiprocessing.Pool(processes) as pool:
+            pending = deque()
+            for start, end in chunks:
+                pending.append(pool.apply_async(_parse_chunk, ((path, start, end, self.debug, self.parse_metadata,
+                                                                self.encoding_error_policy),)))
+                if len(pending) >= 2 * processes:
+                    yield from pending.popleft().get()
+            while pending:
+                yield from pending.popleft().get()
 
-            else:
-                if self.debug or line_index == '0':
-                    par_words.append(line.strip('\n'))
+    def _treat_file(self, idx_filepath: int, relative_filepath: str) -> Iterable[Document]:
+        with open_binary(relative_filepath) as fd:
+            yield from parse_onion_blocks(read_line_blocks(fd), self.debug, self.parse_metadata,
+                                          self.encoding_error_policy)
@@ -1,4 +1,4 @@
-from .data_parser import DataParser
+from .data_parser import DataParser, simple_doc_attributes
 from typing import Iterable, List
 from corpus_cleaner.document import Document
 import xml.etree.ElementTree as ET
@@ -20,13 +20,15 @@ class WikipediaParser(DataParser):
         title = ''
         first = True
         for line in fd:
-            parsed_line = line.split()
+            # Only the first token is needed
+            parsed_line = line.split(maxsplit=1)
             if len(parsed_line) == 0:
                 continue
             if parsed_line[0] == '<doc':
                 first = True
-                root = ET.fromstring(line + '</doc>')
-                attribs = root.attrib
+                attribs = simple_doc_attributes(line.rstrip())
+                if attribs is None:
+                    attribs = ET.fromstring(line + '</doc>').attrib
                 doc_id = attribs['id']
                 url = attribs['url']
                 title = attribs['title']
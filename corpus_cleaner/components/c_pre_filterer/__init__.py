@@ -1,3 +1,4 @@
 from .pre_filterer import PreFilterer
+from .pre_screener import PreScreener
 
-__all__ = ['PreFilterer']
+__all__ = ['PreFilterer', 'PreScreener']
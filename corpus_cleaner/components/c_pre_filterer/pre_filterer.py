@@ -1,5 +1,9 @@
 from typing import List, Set, Union, Tuple, Optional
 from corpus_cleaner.document import Document
+from functools import wraps
+from corpus_cleaner.operations import operation_code
+from corpus_cleaner.filter_order import AdaptiveFilterOrder
+from corpus_cleaner.transforms import EmailReplacer, TagRemover, UrlReplacer
 from alphabet_detector import AlphabetDetector
 from textnorm import normalize_space
 from corpus_cleaner.components.cleaner_component_mapper import CleanerComponentMapper
@@ -11,16 +15,32 @@ from corpus_cleaner.configs.langs import langs
 import regex
 
 
+HEAD_ERROR_TOKENS = ['found', '404', 'robots.txt', 'error', 'trouvée']
+
+
+def find_error_head(heads: Optional[str]) -> Optional[str]:
+    """
+    :param heads: HTTP heads of a crawled document (or None).
+    :return: The first token of a common HTTP error found in the heads, or None.
+    """
+    if heads is not None:
+        for token in HEAD_ERROR_TOKENS:
+            if re.search(token, heads, re.IGNORECASE):
+                return token
+    return None
+
+
 # TODO: implement decorator that register the name of the operation (replace/filter) applied to each sentence
 #       That information will be used to list the operations applied to the sentences during the cleaning process
 def debug_filter(func):
+    @wraps(func)
     def debug(self, doc):
         if self.debug:
             keep, value = func(self, doc)
             if not keep:
                 class_name = self.__class__.__name__
                 filter_name = func.__name__
-                doc.operations.append(f"{class_name}-{filter_name}:{value}")
+                doc.operations.add(operation_code(f"{class_name}-{filter_name}"), value=value)
                 doc.content = ''
             return keep, value
         else:
@@ -69,16 +89,27 @@ class PreFilterer(CleanerComponentMapper):
                                                                                 'threshold for the initial lang'
                                                                                 'identifier',
                             default=0.3)
+        parser.add_argument('--lang-filter-window-size', type=int, default=0,
+                            help='If --lang-filter-document is set, identify the language of long documents on '
+                                 '--lang-filter-windows evenly spaced windows of this number of characters (from the '
+                                 'head to the tail) instead of the whole text, which is only used if the windows '
+                                 'disagree (0 to always use the whole text)')
+        parser.add_argument('--lang-filter-windows', type=int, default=3,
+                            help='Number of windows of --lang-filter-window-size')
         parser.add_argument('--dictionary-filter-doc', type=str, help='Path to dictionary (plain text, one term per'
                                                                       'line of terms that should not appear in a'
                                                                       'document',
                             default=None)
         parser.add_argument('--seg-sentences', action='store_true', help='Segment wrongfully concatenated sentences.')
+        parser.add_argument('--filter-order-sample', type=int, default=500,
+                            help='Number of documents (PreFilterer) or sentences (SentenceFilter) evaluated by all the '
+                                 'filters to measure their cost and rejection rate, before reordering the filters to '
+                                 'minimize the expected cost (0 to keep the default order). Ignored in debug mode')
 
     @staticmethod
     def check_args(args: argparse.Namespace):
         # TODO check custom args
-        pass
+        assert args.lang_filter_windows >= 1
 
     def __init__(self, args: argparse.Namespace,
                  lang_filter_document: bool = False,
@@ -98,9 +129,12 @@ class PreFilterer(CleanerComponentMapper):
                  alphabet_filter: Union[Tuple[str], None] = ('LATIN',), 
                  lang_filter: Union[Tuple[str], None] = None,
                  initial_lang_filter_threshold: float = 0.3,
+                 lang_filter_window_size: int = 0,
+                 lang_filter_windows: int = 3,
                  dictionary_filter: Optional[str] = None,
                  seg_sentences: bool = False,
-                 none_filter: bool = False):
+                 none_filter: bool = False,
+                 filter_order_sample: int = 500):
         super().__init__(args)
         self.lang_filter_document = args.lang_filter_document or lang_filter_document
         self.language_normalization = args.language_normalization or language_normalization
@@ -124,6 +158,10 @@ class PreFilterer(CleanerComponentMapper):
             self.lang_chars = ("".join(char for char in self.alphabet if char.isalpha()))
         self.initial_lang_filter_threshold = args.fast_lang_filter_threshold if args.initial_lang_filter_threshold is not \
                                                                                 None else initial_lang_filter_threshold
+        self.lang_filter_window_size = args.lang_filter_window_size if args.lang_filter_window_size is not None \
+            else lang_filter_window_size
+        self.lang_filter_windows = args.lang_filter_windows if args.lang_filter_windows is not None \
+            else lang_filter_windows
         self.dictionary_filter = \
             args.dictionary_filter_doc if args.dictionary_filter_doc is not None else dictionary_filter
         if self.dictionary_filter is not None:
@@ -137,6 +175,11 @@ class PreFilterer(CleanerComponentMapper):
         self._build_filters()
         if not self.do_filter:
             self.filters = []
+        self.filter_order_sample = args.filter_order_sample if args.filter_order_sample is not None \
+            else filter_order_sample
+        # In debug mode, the order is kept so that documents are always tagged with the same filter
+        self.filter_order = AdaptiveFilterOrder(self.filters, 0 if self.debug else self.filter_order_sample,
+                                                self.__class__.__name__, getattr(args, 'logger', None))
 
     # TODO: move the remove operations to a new component called CharFilter
     def _language_normalization(self, langs, text):
@@ -151,8 +194,7 @@ class PreFilterer(CleanerComponentMapper):
         return text, bool(subs)
 
     def _replace_emails(self, text):
-        replace = ' [EMAIL] '
-        text, subs = self.emails_pattern.subn(replace, text)
+        text, subs = self.email_replacer.replace(text)
         return text, bool(subs)
 
     def _remove_hashtags_mentions(self, text):
@@ -160,7 +202,7 @@ class PreFilterer(CleanerComponentMapper):
         return text, bool(subs)
 
     def _remove_tags(self, text):
-        text, subs = self.tags_pattern.subn(' ', self.p_tags_pattern.sub('\n', text))
+        text, subs = self.tag_remover.remove(text)
         return text, bool(subs)
 
     def _space_normalization(self, text):
@@ -178,17 +220,22 @@ class PreFilterer(CleanerComponentMapper):
         subs_all.append(subs)
         return text, any(subs_all)
 
+    def _regex_timeout(self) -> Optional[float]:
+        # Time left of the time budget (see TimeBudget), for the patterns of the regex module
+        time_budget = getattr(self.args, 'time_budget', None)
+        return time_budget.remaining() if time_budget is not None else None
+
     def _seg_sentences(self, text):
         subs_all = []
-        text, subs = self.final_sentence_pattern1.subfn("{1}{2}{3}\n{4}{5}{6}", text)
+        text, subs = self.final_sentence_pattern1.subfn("{1}{2}{3}\n{4}{5}{6}", text, timeout=self._regex_timeout())
         subs_all.append(subs)
-        text, subs = self.final_sentence_pattern2.subfn("{1}{2}{3}\n{4}{5}{6}{7}", text)
+        text, subs = self.final_sentence_pattern2.subfn("{1}{2}{3}\n{4}{5}{6}{7}", text,
+                                                        timeout=self._regex_timeout())
         subs_all.append(subs)
         return text, any(subs_all)
 
     def _replace_urls(self, text):
-        replace = ' [URL] '
-        text, subs = self.urls_pattern2.subn(replace, self.urls_pattern.sub(replace, text))
+        text, subs = self.url_replacer.replace(text)
         return text, bool(subs)
 
     def _build_filters(self):
@@ -199,21 +246,19 @@ class PreFilterer(CleanerComponentMapper):
             self.geminate_l_pattern = re.compile(r'l\.l')
         # https://www.tutorialspoint.com/Extracting-email-addresses-using-regular-expressions-in-Python
         if self.replace_emails:
-            self.emails_pattern = re.compile(
-                rf'[{self.lang_chars}0-9_.+-]+@[a-zA-Z0-9-]+\.[a-z0-9-.]+')
-            # allows language specific characters in the first part of the email
+            # Same as replacing rf'[{self.lang_chars}0-9_.+-]+@[a-zA-Z0-9-]+\.[a-z0-9-.]+' (language specific
+            # characters are allowed in the first part of the email), scanning only around '@'
+            self.email_replacer = EmailReplacer(self.lang_chars, ' [EMAIL] ')
         # https://stackoverflow.com/questions/8376691/how-to-remove-hashtag-user-link-of-a-tweet-using-regular-expression
         if self.remove_hashtags_mentions:
             self.remove_hashtags_pattern = re.compile('(@[A-Za-z0-9_]+)|(#[\w_]+)')
         if self.remove_tags:
-            self.tags_pattern = re.compile(' *(<.*?> ?)+ *')
-            self.p_tags_pattern = re.compile('(\s*)(<p>)+')
+            # Same as replacing '(\s*)(<p>)+' by '\n' and ' *(<.*?> ?)+ *' by ' ', in linear time
+            self.tag_remover = TagRemover()
         if self.replace_urls:
-            # slightly modified from:
+            # Pattern slightly modified from (see UrlReplacer), scanning only after '(':
             # https://stackoverflow.com/questions/6718633/python-regular-expression-again-match-url
-            self.urls_pattern = re.compile(
-                rf'\((@)?((http|https)://)?([{self.lang_chars}0-9./?\\\\@\-—_=#])+\.[a-z]{{2,6}}([{self.lang_chars}0-9&/\\\\+~*?%:!@—_=#()-])*')
-            self.urls_pattern2 = re.compile('(\[URL\]\.?\w*\s*)+')
+            self.url_replacer = UrlReplacer(self.lang_chars, ' [URL] ')
         if self.char_length_filter_document > 0:
             self.filters.append(self._filter_by_char_len)
         if self.head_filter:
@@ -237,6 +282,9 @@ class PreFilterer(CleanerComponentMapper):
                     "((\w+):\/\/)?[-a-zA-Z0-9@:%._\+~#=]{2,256}\.[a-z]{2,6}\b([-a-zA-Z0-9@:%_\+.~#?&//=]*)"
                 )
             self.no_eols_pattern = re.compile('\n')
+            # Windows don't start or end with a partial word
+            self.window_start_pattern = re.compile(r'\s')
+            self.window_end_pattern = re.compile(r'\s\S*$')
             self.fasttext_lid = fasttext.load_model(os.path.join('lib', 'lid.176.bin'))
             self.filters.append(self._filter_by_lang)
         if self.dictionary_filter is not None:
@@ -266,12 +314,9 @@ class PreFilterer(CleanerComponentMapper):
 
     @debug_filter
     def _filter_by_heads(self, doc: Document):
-        value = []
-        if doc.heads is not None:
-            for token in ['found', '404', 'robots.txt', 'error', 'trouvée']:
-                if re.search(token, doc.heads, re.IGNORECASE):
-                    value.append(token)
-                    return False, value
+        token = find_error_head(doc.heads)
+        if token is not None:
+            return False, [token]
         return True, None
 
     @debug_filter
@@ -315,15 +360,43 @@ class PreFilterer(CleanerComponentMapper):
             return True, None
         return True, None
 
-    @debug_filter
-    def _filter_by_lang(self, doc: Document):
-        content = self.url_placeholder_pattern.sub('', doc.content)
+    def _identify_lang(self, text: str) -> Tuple[str, float]:
+        content = self.url_placeholder_pattern.sub('', text)
         content = self.no_eols_pattern.sub('. ', content)
         res = self.fasttext_lid.predict(content)
-        lang = res[0][0][-2:]
-        conf = res[1][0]
+        return res[0][0][-2:], res[1][0]
+
+    def _lang_windows(self, text: str) -> List[str]:
+        size = self.lang_filter_window_size
+        last_start = len(text) - size
+        windows = []
+        for idx in range(self.lang_filter_windows):
+            start = last_start * idx // (self.lang_filter_windows - 1) if self.lang_filter_windows > 1 else 0
+            window = text[start:start + size]
+            if start > 0:
+                match = self.window_start_pattern.search(window)
+                window = window[match.end():] if match is not None else window
+            if start < last_start:
+                match = self.window_end_pattern.search(window)
+                window = window[:match.start()] if match is not None else window
+            windows.append(window)
+        return windows
+
+    def _identify_document_lang(self, text: str) -> Tuple[str, float]:
+        # Long documents are identified by windows, and the whole text is only needed when their votes disagree
+        if self.lang_filter_window_size <= 0 or len(text) <= self.lang_filter_window_size * self.lang_filter_windows:
+            return self._identify_lang(text)
+        votes = [self._identify_lang(window) for window in self._lang_windows(text)]
+        if len(set(lang for lang, _ in votes)) == 1:
+            return votes[0][0], sum(conf for _, conf in votes) / len(votes)
+        return self._identify_lang(text)
+
+    @debug_filter
+    def _filter_by_lang(self, doc: Document):
+        lang, conf = self._identify_document_lang(doc.content)
         if lang in self.lang_filter and conf > self.initial_lang_filter_threshold:
             doc.language = lang
+            doc.language_confidence = float(conf)
             return True, None
         value = f"({round(conf, 2)}, {lang})"
         return False, value
@@ -340,44 +413,48 @@ class PreFilterer(CleanerComponentMapper):
         if self.language_normalization:
             document.content, subs = self._language_normalization(self.lang_filter, document.content)
             if self.debug and subs:
-                document.operations.append(f"{self.__class__.__name__}-{self._language_normalization.__name__}")
+                document.operations.add(
+                    operation_code(f"{self.__class__.__name__}-{self._language_normalization.__name__}"))
         if self.replace_emails:
             document.content, subs = self._replace_emails(document.content)
             if self.debug and subs:
-                document.operations.append(f"{self.__class__.__name__}-{self._replace_emails.__name__}")
+                document.operations.add(
+                    operation_code(f"{self.__class__.__name__}-{self._replace_emails.__name__}"))
         if self.remove_hashtags_mentions:
             document.content, subs = self._remove_hashtags_mentions(document.content)
             if self.debug and subs:
-                document.operations.append(f"{self.__class__.__name__}-{self._remove_hashtags_mentions.__name__}")
+                document.operations.add(
+                    operation_code(f"{self.__class__.__name__}-{self._remove_hashtags_mentions.__name__}"))
         if self.remove_tags:
             document.content, subs = self._remove_tags(document.content)
             if self.debug and subs:
-                document.operations.append(f"{self.__class__.__name__}-{self._remove_tags.__name__}")
+                document.operations.add(
+                    operation_code(f"{self.__class__.__name__}-{self._remove_tags.__name__}"))
         if self.replace_urls:
             document.content, subs = self._replace_urls(document.content)
             if self.debug and subs:
-                document.operations.append(f"{self.__class__.__name__}-{self._replace_urls.__name__}")
+                document.operations.add(
+                    operation_code(f"{self.__class__.__name__}-{self._replace_urls.__name__}"))
         if self.space_normalization:
             document.content, subs = self._space_normalization(document.content)
             if self.debug and subs:
-                document.operations.append(f"{self.__class__.__name__}-{self._space_normalization.__name__}")
+                document.operations.add(
+                    operation_code(f"{self.__class__.__name__}-{self._space_normalization.__name__}"))
         if self.seg_sentences:
             document.content, subs = self._seg_sentences(document.content)
             if self.debug and subs:
-                document.operations.append(f"{self.__class__.__name__}-{self._seg_sentences.__name__}")
+                document.operations.add(
+                    operation_code(f"{self.__class__.__name__}-{self._seg_sentences.__name__}"))
         if self.remove_citations:
             document.content, subs = self._remove_citations(document.content)
             if self.debug and subs:
-                document.operations.append(f"{self.__class__.__name__}-{self._remove_citations.__name__}")
+                document.operations.add(
+                    operation_code(f"{self.__class__.__name__}-{self._remove_citations.__name__}"))
 
         if len(document.content.split()) == 0:
             return None
 
-        keep = True
-        for filter_ in self.filters:
-            keep, _ = filter_(document)
-            if not keep:
-                break
+        keep, _, _ = self.filter_order(document)
         if keep or self.debug:
             return document
         return None
@@ -0,0 +1,67 @@
+from corpus_cleaner.document import Document
+from corpus_cleaner.components.cleaner_component_mapper import CleanerComponentMapper
+from .pre_filterer import find_error_head
+import argparse
+from typing import Optional
+
+# Maximum number of characters a single character can become after NFKC normalization (U+FDFA)
+NFKC_MAX_EXPANSION = 18
+
+
+class PreScreener(CleanerComponentMapper):
+    @staticmethod
+    def add_args(parser: argparse.ArgumentParser):
+        parser.add_argument('--no-pre-screening', action='store_true',
+                            help="Don't run PreScreener in front of EncodingFixer when PreFilterer is in the components")
+
+    @staticmethod
+    def check_args(args: argparse.Namespace):
+        # TODO check custom args
+        pass
+
+    def __init__(self, args: argparse.Namespace):
+        """
+        Applies the PreFilterer rejections that don't depend on the rewrites of EncodingFixer and PreFilterer on the
+        raw text, before them, so that most discarded documents never go through ftfy and the regular expressions.
+        It only rejects documents that PreFilterer would reject anyway, so it doesn't change the output:
+            - Documents without words (if they are ASCII, or without EncodingFixer).
+            - Documents with HTTP errors in the heads (--head-filter).
+            - Documents shorter than --char-length-filter-document even in the worst case, if none of the configured
+              rewrites can make the text longer. Only ftfy's NFKC normalization and HTML entities can, which are
+              bounded with the number of non-ASCII characters and ampersands.
+        The cleaner adds it in front of the mappers whenever PreFilterer is in the components (unless --no-pre-screening
+        is set). It doesn't do anything in debug mode (PreFilterer keeps the rejected documents) or without PreFilterer.
+        """
+        super().__init__(args)
+        components = args.components if args.components is not None else []
+        self.active = 'PreFilterer' in components and not self.debug
+        self.encoding_fixer = 'EncodingFixer' in components
+        # Same condition as PreFilterer for applying its filters
+        filters = bool(args.none_filter)
+        self.head_filter = filters and args.head_filter
+        growing_rewrites = args.replace_emails or args.replace_urls or args.space_normalization or args.seg_sentences
+        self.char_length_filter_document = args.char_length_filter_document \
+            if filters and not growing_rewrites and args.char_length_filter_document is not None else 0
+
+    def _max_length(self, content: str) -> int:
+        # Upper bound of the length of the content after the rewrites
+        if not self.encoding_fixer:
+            return len(content)
+        expandable = len(content) - len(content.encode('ascii', 'ignore')) + content.count('&')
+        return len(content) + (NFKC_MAX_EXPANSION - 1) * expandable
+
+    def _reject(self, document: Document) -> bool:
+        content = document.content
+        if len(content.split()) == 0 and (content.isascii() or not self.encoding_fixer):
+            return True
+        if self.head_filter and find_error_head(document.heads) is not None:
+            return True
+        if len(content) < self.char_length_filter_document and \
+                self._max_length(content) < self.char_length_filter_document:
+            return True
+        return False
+
+    def apply(self, document: Document) -> Optional[Document]:
+        if self.active and self._reject(document):
+            return None
+        return document
@@ -2,6 +2,7 @@ import argparse
 from corpus_cleaner.document import Document
 from typing import Optional, Iterable
 from . import CleanerComponent
+from corpus_cleaner.time_budget import TimeBudget, TimeBudgetExceeded
 
 
 class CleanerComponentMapper(CleanerComponent):
@@ -17,7 +18,34 @@ class CleanerComponentMapper(CleanerComponent):
     def apply(self, document: Document) -> Optional[Document]:
         raise NotImplementedError()
 
+    def _apply_within_budget(self, document: Document, time_budget: TimeBudget) -> Optional[Document]:
+        try:
+            with time_budget.component(document, self.__class__.__name__):
+                return self.apply(document)
+        except TimeBudgetExceeded as e:
+            # Documents exceeding the time budget are dropped (and quarantined, if requested)
+            time_budget.quarantine(document, e)
+            logger = getattr(self.args, 'logger', None)
+            if logger is not None:
+                logger.logger.warning(f'Dropped document {document.id} of {document.filename}: {e}')
+            return None
+
     def __call__(self, documents: Iterable[Optional[Document]]) -> Iterable[Optional[Document]]:
-        for document in documents:
-            if document is not None:
-                yield self.apply(document)
+        time_budget = getattr(self.args, 'time_budget', None) if self.args is not None else None
+        if time_budget is None or not time_budget.active:
+            for document in documents:
+                if document is not None:
+                    yield self.apply(document)
+            return
+        if not time_budget.interruptible and not time_budget.warned:
+            time_budget.warned = True
+            logger = getattr(self.args, 'logger', None)
+            if logger is not None:
+                logger.logger.warning('The mappers are not running in the main thread, so the time budgets are only '
+                                      'checked after every component')
+        try:
+            for document in documents:
+                if document is not None:
+                    yield self._apply_within_budget(document, time_budget)
+        finally:
+            time_budget.stop()
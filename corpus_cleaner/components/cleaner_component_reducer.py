@@ -17,8 +17,9 @@ class CleanerComponentReducer(CleanerComponent):
         self.format = format_
         self.tmp_file = tmp_file
         self.final_path = final_path
+        # The reduced documents are only written as sentences, so their attributes are not parsed
         self.data_parser = DataParserFactory.get_parser(args, input_format=self.format, input_path=input_path,
-                                                        extensions=extensions)
+                                                        extensions=extensions, parse_metadata=False)
 
     @staticmethod
     def add_args(parser: argparse.ArgumentParser):
@@ -34,7 +35,13 @@ class CleanerComponentReducer(CleanerComponent):
     def reduce(self):
         self._reduce()
 
-    def get_documents(self):
+    def get_documents(self, processes: int = 1):
+        """
+        :param processes: Number of processes parsing the reduced files (in chunks, see OnionParser.parse_parallel).
+        :return: List of iterables of documents, one per reduced file.
+        """
+        if processes > 1:
+            return self.data_parser.parse_parallel(processes)
         return self.data_parser.parse()
 
     def output(self, documents: List[Document]):
@@ -1,4 +1,6 @@
 from corpus_cleaner.document import Document
+from corpus_cleaner.operations import operation_code
+from corpus_cleaner.sentence_spans import SentenceSpans
 from typing import Dict, Optional
 import sentence_splitter
 from corpus_cleaner.components.cleaner_component_mapper import CleanerComponentMapper
@@ -59,7 +61,7 @@ class SentenceSplitterComponent(CleanerComponentMapper):
                 document.sentences_orig = [sent for sent in splitter.split(document.content_orig)]
 
                 if len(document.sentences) > 1:
-                    document.operations.append(f'{self.__class__.__name__}-_sentence_splitter')
+                    document.operations.add(operation_code(f'{self.__class__.__name__}-_sentence_splitter'))
 
                 # If the original sentences are not aligned to the cleaned ones, place the whole document on the first
                 # line to allow manual alignment
@@ -70,10 +72,10 @@ class SentenceSplitterComponent(CleanerComponentMapper):
                         document.sentences_orig.extend(['UNALIGNED:'] * (len(document.sentences) - len(document.sentences_orig)))
                     else:
                         return None
-            # add operations for each sentence in the document
-            document.operations = [document.operations.copy() for _ in range(len(document.sentences))]
         else:
-            document.sentences = [sent for sent in splitter.split(document.content)]
+            # Sentences are stored as offsets into the content (or into their own backing string, in the documents where
+            # the splitter collapsed repeated spaces)
+            document.sentences = SentenceSpans.from_text(document.content, splitter.split(document.content))
         return document
 
     def apply(self, document: Document) -> Optional[Document]:
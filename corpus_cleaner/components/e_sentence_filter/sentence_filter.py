@@ -1,9 +1,15 @@
 from corpus_cleaner.document import Document
-from typing import Callable, Union, Tuple, Optional
+from corpus_cleaner.operations import operation_code, WHOLE_DOCUMENT
+from corpus_cleaner.filter_order import AdaptiveFilterOrder
+from corpus_cleaner.sentence_spans import SentenceSpans
+from collections import Counter
+from typing import Callable, Iterable, Union, Tuple, Optional
 from corpus_cleaner.components.cleaner_component_mapper import CleanerComponentMapper
 from langid.langid import LanguageIdentifier, model
 import argparse
 import fasttext
+import math
+import numpy as np
 import os
 import re
 
@@ -30,6 +36,14 @@ class SentenceFilter(CleanerComponentMapper):
                             help='Applying language filter on sentences')
         parser.add_argument('--lang-filter-sentence_src_tgt', action='store_true',
                             help='Applying language filter on sentences with "src=" pattern')
+        parser.add_argument('--lang-skip-sentence-threshold', type=float, default=-1,
+                            help='If --lang-filter-sentence is set, skip the language filter on the sentences of '
+                                 'documents identified as one of --lang-filter with at least this confidence by '
+                                 '--lang-filter-document (-1 to deactivate)')
+        parser.add_argument('--lang-skip-sample-every', type=int, default=0,
+                            help='In the documents of --lang-skip-sentence-threshold, still filter one out of every N '
+                                 'sentences by language, to estimate the number of wrong sentences that are kept (0 to '
+                                 'skip all of them)')
 
         parser.add_argument('--code-threshold', type=float, help='Threshold (percentage) of code-like chars and tokens'
                                                                  'to filter a sentence (-1 to deactivate)',
@@ -40,11 +54,18 @@ class SentenceFilter(CleanerComponentMapper):
                             default=None)
         parser.add_argument('--dedup-same-doc-sentences', action='store_true',
                             help='Deduplicate sentences inside the same document.')
+        parser.add_argument('--max-rejected-sentence-ratio', type=float, default=-1,
+                            help='Filter whole documents when the proportion of sentences rejected by the sentence '
+                                 'filters exceeds this ratio (-1 to deactivate). The document is discarded as soon as '
+                                 'the ratio is certain to be exceeded, without evaluating the remaining sentences')
+        parser.add_argument('--min-sentences-rejected-ratio', type=int, default=10,
+                            help='Minimum number of sentences of a document for --max-rejected-sentence-ratio to apply')
 
     @staticmethod
     def check_args(args: argparse.Namespace):
         # TODO check custom args
-        pass
+        if args.max_rejected_sentence_ratio != -1:
+            assert 0 <= args.max_rejected_sentence_ratio < 1
 
     def __init__(self, args: argparse.Namespace, 
                  char_length_filter_sentence: int = 30,
@@ -58,7 +79,12 @@ class SentenceFilter(CleanerComponentMapper):
                  profanity_check: bool = False, 
                  dictionary_filter: Optional[str] = None,
                  dedup_same_doc_sentences: bool = False,
-                 src_tag_filter: bool = False):
+                 src_tag_filter: bool = False,
+                 max_rejected_sentence_ratio: float = -1,
+                 min_sentences_rejected_ratio: int = 10,
+                 filter_order_sample: int = 500,
+                 lang_skip_sentence_threshold: float = -1,
+                 lang_skip_sample_every: int = 0):
         # TODO: Review way of setting defaults, thresholds will never be None!
         super().__init__(args)
         self.char_length_filter_sentence = args.char_length_filter_sentence if args.char_length_filter_sentence is not \
@@ -82,20 +108,43 @@ class SentenceFilter(CleanerComponentMapper):
             with open(self.dictionary_filter, 'r') as f:
                 self.dictionary_filter = [line.strip() for line in f.readlines()]
         self.filters = []
+        self.batch_filters = []
         self.code_keywords_pattern = re.compile('\\b(var|function|const|if|else|script)\\b')
         self.code_chars_pattern = re.compile('[;=&\[\](){}/\\\\]')
         self.dedup_same_doc_sentences = args.dedup_same_doc_sentences or dedup_same_doc_sentences
+        self.max_rejected_sentence_ratio = args.max_rejected_sentence_ratio \
+            if args.max_rejected_sentence_ratio is not None else max_rejected_sentence_ratio
+        self.min_sentences_rejected_ratio = args.min_sentences_rejected_ratio \
+            if args.min_sentences_rejected_ratio is not None else min_sentences_rejected_ratio
+        self.filter_order_sample = args.filter_order_sample if args.filter_order_sample is not None \
+            else filter_order_sample
+        self.lang_skip_sentence_threshold = args.lang_skip_sentence_threshold \
+            if args.lang_skip_sentence_threshold is not None else lang_skip_sentence_threshold
+        self.lang_skip_sample_every = args.lang_skip_sample_every if args.lang_skip_sample_every is not None \
+            else lang_skip_sample_every
+        # Whether the current document is confidently in one of the languages, and statistics of the skipped sentences
+        self.lang_confident = False
+        self.lang_skip_documents = 0
+        self.lang_skip_sentences = 0
+        self.lang_skip_sampled = 0
+        self.lang_skip_sampled_rejected = 0
         self.debug = args.debug
 
         self._get_filters()
+        # In debug mode, the order is kept so that sentences are always tagged with the same filter
+        self.filter_order = AdaptiveFilterOrder(self.filters, 0 if self.debug else self.filter_order_sample,
+                                                self.__class__.__name__, getattr(args, 'logger', None))
 
     def _get_filters(self):
+        # Filters based on counts score all the sentences of a document at once, and the rest run sentence by sentence
+        # (only on the sentences kept by the batch filters, which always run first). The order of the latter is adapted
+        # to their measured cost (see AdaptiveFilterOrder)
         if self.char_length_filter_sentence is not None:
-            self.filters.append(self._filter_by_len)
+            self.batch_filters.append(self._filter_by_len)
         if self.code_threshold != -1:
-            self.filters.append(self._filter_by_code)
+            self.batch_filters.append(self._filter_by_code)
         if self.digits_filter_sentence > 0:
-            self.filters.append(self._filter_by_digits)
+            self.batch_filters.append(self._filter_by_digits)
         if self.lang_filter is not None and self.lang_filter_sentence:
             self.fasttext_lid = fasttext.load_model(os.path.join('lib', 'lid.176.bin'))
             self.lang_id = LanguageIdentifier.from_modelstring(model, norm_probs=True)
@@ -110,35 +159,51 @@ class SentenceFilter(CleanerComponentMapper):
             self.src_tag_pattern = re.compile('src=')
             self.filters.append(self._filter_by_src_tag)
 
-    def _filter_by_len(self, sentence: str):
-        len_sentence = len(sentence)
-        len_words = len(sentence.split(' '))
-        if len_sentence > self.char_length_filter_sentence and len_words > self.word_length_filter_sentence:
-            return True, None
-        value = f"({round(len_sentence)} chars, {len_words} words)"
-        return False, value
+    # Batch filters receive the sentences of a document and return the keep mask, and a function giving the value
+    # (reason) of a rejected sentence for the debug mode
 
-    def _filter_by_code(self, sentence: str):
-        value = (len(re.findall(self.code_keywords_pattern, sentence)) / len(sentence.split())) \
-                + len(re.findall(self.code_chars_pattern, sentence)) / len(sentence)
-        if value > self.code_threshold:
-            return False, round(value, 2)
-        return True, None
+    def _filter_by_len(self, sentences: SentenceSpans) -> Tuple[np.ndarray, Callable[[int], str]]:
+        keep = (sentences.lengths > self.char_length_filter_sentence) & \
+               (sentences.space_tokens > self.word_length_filter_sentence)
+        return keep, lambda idx: f"({sentences.lengths[idx]} chars, {sentences.space_tokens[idx]} words)"
 
-    def _filter_by_digits(self, sentence):
-        sentence_chars = ''.join(sentence.split())
-        value = sum(c.isdigit() for c in sentence_chars) / len(sentence_chars)
-        if value >= self.digits_filter_sentence:
-            return False, round(value, 2)
-        return True, None
+    def _filter_by_code(self, sentences: SentenceSpans) -> Tuple[np.ndarray, Callable[[int], float]]:
+        # Sentences without words (or characters) are kept, since the ratio is undefined
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = sentences.count_matches(self.code_keywords_pattern) / sentences.words + \
+                     sentences.count_matches(self.code_chars_pattern) / sentences.lengths
+        return ~(values > self.code_threshold), lambda idx: round(float(values[idx]), 2)
+
+    def _filter_by_digits(self, sentences: SentenceSpans) -> Tuple[np.ndarray, Callable[[int], float]]:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = sentences.digits / sentences.non_space
+        return ~(values >= self.digits_filter_sentence), lambda idx: round(float(values[idx]), 2)
 
-    def _filter_by_src_tag(self, sentence):
+    # Sentence filters receive the index of the sentence in self.sentences (the sentences of the current document)
+
+    def _filter_by_src_tag(self, idx: int):
+        sentence = self.sentences[idx]
         found = self.src_tag_pattern.search(sentence)
         if found is None:
             return True, None
         return False, found.span()
 
-    def _filter_by_lang(self, sentence: str):
+    def _filter_by_lang(self, idx: int):
+        if not self.lang_confident:
+            return self._identify_lang(idx)
+        # While the filter order is being sampled, every filter sees every sentence, so they are not counted
+        count = not self.filter_order.sampling
+        if self.lang_skip_sample_every == 0 or idx % self.lang_skip_sample_every != 0:
+            self.lang_skip_sentences += count
+            return True, None
+        keep, value = self._identify_lang(idx)
+        self.lang_skip_sampled += count
+        if not keep:
+            self.lang_skip_sampled_rejected += count
+        return keep, value
+
+    def _identify_lang(self, idx: int):
+        sentence = self.sentences[idx]
         res = self.fasttext_lid.predict(sentence.lower())
         lang = res[0][0][-2:]
         conf = res[1][0]
@@ -156,50 +221,111 @@ class SentenceFilter(CleanerComponentMapper):
         value = f"({round(conf, 2)}, {lang})"
         return False, value
 
-    def _filter_by_dict(self, sentence: str):
-        if self.dictionary_filter_pattern.search(sentence):
+    def _filter_by_dict(self, idx: int):
+        if self.dictionary_filter_pattern.search(self.sentences[idx]):
             return False, None
         return True, None
 
-    def _filter_by_duplicate(self, sentence: str):
-        if sentence in self.sentences_duplicate:
+    def _filter_by_duplicate(self, idx: int):
+        if self.sentences[idx] in self.sentences_duplicate:
             return False, None
         return True, None
 
+    def _is_lang_confident(self, document: Document) -> bool:
+        if self.lang_skip_sentence_threshold == -1 or self.lang_filter is None or document.language_confidence is None:
+            return False
+        return document.language in self.lang_filter and document.language_confidence >= self.lang_skip_sentence_threshold
+
+    def _log_lang_skip_stats(self):
+        # Logged (and reset) after every input file
+        logger = getattr(self.args, 'logger', None)
+        if self.lang_skip_documents > 0 and logger is not None:
+            logger.logger.info(self._lang_skip_stats_message())
+        self.lang_skip_documents = 0
+        self.lang_skip_sentences = 0
+        self.lang_skip_sampled = 0
+        self.lang_skip_sampled_rejected = 0
+
+    def _lang_skip_stats_message(self) -> str:
+        msg = f'{self.__class__.__name__}: skipped the language filter on {self.lang_skip_sentences} sentences of ' \
+              f'{self.lang_skip_documents} documents above --lang-skip-sentence-threshold in the last file'
+        if self.lang_skip_sampled > 0:
+            rejected_rate = self.lang_skip_sampled_rejected / self.lang_skip_sampled
+            msg += f'; {self.lang_skip_sampled_rejected} out of {self.lang_skip_sampled} sampled sentences were ' \
+                   f'rejected ({rejected_rate:.2%}), so about {round(rejected_rate * self.lang_skip_sentences)} ' \
+                   f'of the skipped sentences would have been rejected'
+        return msg
+
+    def _max_rejected(self, num_sentences: int) -> float:
+        """
+        :param num_sentences: Number of sentences of the document.
+        :return: Number of rejected sentences above which the whole document is rejected (inf if the rule doesn't apply).
+        """
+        if self.max_rejected_sentence_ratio == -1 or num_sentences < self.min_sentences_rejected_ratio:
+            return math.inf
+        return self.max_rejected_sentence_ratio * num_sentences
+
+    def _reject_document(self, document: Document, num_rejected: int) -> Optional[Document]:
+        if self.debug:
+            # The remaining sentences are not evaluated, so the operation is registered for the whole document
+            document.operations.add(operation_code(f"{self.__class__.__name__}-_filter_by_rejected_ratio"),
+                                    WHOLE_DOCUMENT, round(num_rejected / len(self.sentences), 2))
+            document.sentences = [''] * len(self.sentences)
+            return document
+        return None
+
     # TODO: add decorators to register the filters
     def _filter(self, document: Optional[Document]) -> Optional[Document]:
-        sentences = []
+        self.sentences = SentenceSpans.from_sentences(document.sentences)
+        self.lang_confident = self._is_lang_confident(document)
+        if self.lang_confident:
+            self.lang_skip_documents += 1
         # For each document, get the set of duplicate sentences to remove
-        self.sentences_duplicate = set(sentence for sentence in document.sentences
-                                       if document.sentences.count(sentence) > 1)
-        for sentence_idx, sentence in enumerate(document.sentences):
-            keep = True
-            for filter_ in self.filters:
-                keep, value = filter_(sentence)
-                if not keep:
-                    # if debug, keep an empty sentence as cleaned
-                    if self.debug:
-                        # register operation only if the sentence is not empty
-                        if sentence:
-                            class_name = self.__class__.__name__
-                            filter_name = filter_.__name__
-                            document.operations[sentence_idx].append(f"{class_name}-{filter_name}:{value}")
-                        sentences.append('')
-                    break
-            if keep:
-                sentences.append(sentence)
+        if self.dedup_same_doc_sentences:
+            self.sentences_duplicate = set(sentence for sentence, count in Counter(self.sentences).items()
+                                           if count > 1)
+        keep_mask = np.ones(len(self.sentences), dtype=bool)
+        for filter_ in self.batch_filters:
+            keep, value = filter_(self.sentences)
+            if self.debug:
+                # register operation only if the sentence is not empty, and only for the first filter rejecting it
+                code = operation_code(f"{self.__class__.__name__}-{filter_.__name__}")
+                for sentence_idx in np.flatnonzero(keep_mask & ~keep & (self.sentences.lengths > 0)).tolist():
+                    document.operations.add(code, sentence_idx, value(sentence_idx))
+            keep_mask &= keep
+        # Early rejection of documents with too many rejected sentences
+        max_rejected = self._max_rejected(len(self.sentences))
+        num_rejected = len(self.sentences) - int(np.count_nonzero(keep_mask))
+        if num_rejected > max_rejected:
+            return self._reject_document(document, num_rejected)
+        for sentence_idx in np.flatnonzero(keep_mask).tolist():
+            keep, filter_, value = self.filter_order(sentence_idx)
+            if not keep:
+                keep_mask[sentence_idx] = False
+                num_rejected += 1
+                # register operation only if the sentence is not empty (in debug mode)
+                if self.debug and self.sentences.lengths[sentence_idx] > 0:
+                    class_name = self.__class__.__name__
+                    filter_name = filter_.__name__
+                    document.operations.add(operation_code(f"{class_name}-{filter_name}"), sentence_idx, value)
+            if num_rejected > max_rejected:
+                return self._reject_document(document, num_rejected)
+        if self.debug:
+            # if debug, keep an empty sentence as cleaned, and return also documents without sentences
+            document.sentences = [sentence if keep else '' for sentence, keep in zip(self.sentences, keep_mask)]
+            return document
+        sentences = self.sentences.select(keep_mask)
         # In normal model, return the document only when all the sentences are not empty
-        if not '' in sentences and len(sentences) > 0:
+        if len(sentences) > 0 and not (sentences.lengths == 0).any():
             document.sentences = sentences
             return document
-        else:
-            # if debug mode is on, return also document with
-            if self.debug:
-                document.sentences = sentences
-                return document
         return None
 
     def apply(self, document: Optional[Document]) -> Optional[Document]:
         return self._filter(document)
 
+    def __call__(self, documents: Iterable[Optional[Document]]) -> Iterable[Optional[Document]]:
+        yield from super().__call__(documents)
+        self._log_lang_skip_stats()
+
 # TODO: UDP. homoglyphs in prefilterer
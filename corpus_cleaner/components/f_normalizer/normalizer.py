@@ -1,4 +1,5 @@
 from corpus_cleaner.document import Document
+from corpus_cleaner.operations import operation_code
 from typing import Union, Dict, Optional
 from corpus_cleaner.components.cleaner_component_mapper import CleanerComponentMapper
 from sacremoses import MosesPunctNormalizer
@@ -38,7 +39,7 @@ class Normalizer(CleanerComponentMapper):
                 if self.debug and sent_norm:
                     if sent_norm != sent:
                         class_name = self.__class__.__name__
-                        document.operations[idx_sent].append(f"{class_name}-{normalizer.__name__}")
+                        document.operations.add(operation_code(f"{class_name}-{normalizer.__name__}"), idx_sent)
             sent_norms.append(sent_norm)
         document.sentences = sent_norms
         return document
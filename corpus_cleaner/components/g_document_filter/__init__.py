@@ -1,3 +1,4 @@
 from .document_filter import DocumentFilter
+from .minhash_document_filter import MinHashDocumentFilter
 
-__all__ = ['DocumentFilter']
+__all__ = ['DocumentFilter', 'MinHashDocumentFilter']
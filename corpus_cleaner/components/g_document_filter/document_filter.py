@@ -1,16 +1,30 @@
 import subprocess
 import argparse
 import os
+import threading
 from ..cleaner_component_reducer import CleanerComponentReducer
-from typing import Optional
+from typing import Iterable, List, Optional, TextIO
 from glob import glob
+from corpus_cleaner.compression import COMPRESSION_EXTENSIONS, open_binary, open_text
+from corpus_cleaner.components.a_data_parser.compact_parser import compact_to_vertical, read_compact_files
+from corpus_cleaner.components.a_data_parser.onion_parser import parse_onion_blocks, read_line_blocks
+from corpus_cleaner.document import Document
+from .ngram_deduplicator import GRANULARITIES, NGramDeduplicator, marked_document
+from .repeated_sentence_filter import RepeatedSentenceFilter
+from corpus_cleaner.dedup_partitions import DEDUP_NGRAM, count_partition
 from corpus_cleaner.par_utils import MappingPipeline, PipelineLogger
 
+# n-gram length and unit of the per-shard deduplication of --only-reduce-ind-onion (onion -m -n 1, which works on
+# paragraphs, ie. sentences), for both backends
+IND_DEDUP_NGRAM = 1
+IND_DEDUP_GRANULARITY = 'paragraph'
+
 
 class DocumentFilter(CleanerComponentReducer):
     def __init__(self, args: argparse.Namespace, document_deduplication_threshold: float = 0.5,
-                 dedup_buffer: int = 16777216,
-                 remove_glob_rep_sen: int = 5, output_path: Optional[str] = None):
+                 dedup_buffer: int = 16777216, dedup_backend: str = 'onion', dedup_granularity: str = 'document',
+                 dedup_memory: int = 4000000000, glob_rep_sen_memory: int = 2000000000, dedup_partitions: int = 0,
+                 remove_glob_rep_sen: int = 5, streaming_reduce: bool = False, output_path: Optional[str] = None):
         # TODO: Modify "args.document_deduplication_threshold if args.document_deduplication_threshold is not None
         # else..." pattern
         self.only_reduce_ind_onion = args.only_reduce_ind_onion
@@ -36,6 +50,13 @@ class DocumentFilter(CleanerComponentReducer):
             if args.remove_glob_rep_sen is not None else remove_glob_rep_sen
         self.dedup_buffer = args.dedup_buffer \
             if args.dedup_buffer is not None else dedup_buffer
+        self.dedup_backend = args.dedup_backend if args.dedup_backend is not None else dedup_backend
+        self.dedup_granularity = args.dedup_granularity if args.dedup_granularity is not None else dedup_granularity
+        self.dedup_memory = args.dedup_memory if args.dedup_memory is not None else dedup_memory
+        self.glob_rep_sen_memory = args.glob_rep_sen_memory \
+            if args.glob_rep_sen_memory is not None else glob_rep_sen_memory
+        self.dedup_partitions = args.dedup_partitions if args.dedup_partitions is not None else dedup_partitions
+        self.streaming_reduce = args.streaming_reduce if args.streaming_reduce is not None else streaming_reduce
         self.onion_input_file = onion_input_file
         self.onion_output_file = onion_output_file
         self.onion_path = os.path.join('lib', 'onion-1.2', 'bin', 'onion')
@@ -57,107 +78,259 @@ class DocumentFilter(CleanerComponentReducer):
         parser.add_argument('--dedup-buffer', type=int, default=1000000000,
                             help='Deduplication buffer size, in bytes (default: 1000000000)')
         parser.add_argument('--only-reduce-ind-onion', action='store_true', help='Individually apply reduction')
+        parser.add_argument('--dedup-backend', type=str, choices=['onion', 'native'], default='onion',
+                            help='Near-duplicate detection implementation: the onion binary, or the built-in one (same '
+                                 'n-gram algorithm, parallel hashing, no external dependencies)')
+        parser.add_argument('--dedup-granularity', type=str, choices=GRANULARITIES, default='document',
+                            help='Unit removed by the native deduplication backend (paragraph = sentence). The '
+                                 'per-shard deduplication of --only-reduce-ind-onion always works on paragraphs, like '
+                                 'onion')
+        parser.add_argument('--dedup-memory', type=int, default=4000000000,
+                            help='Memory budget of the n-gram hash set of the native deduplication backend, in bytes')
+        parser.add_argument('--glob-rep-sen-memory', type=int, default=2000000000,
+                            help='Memory budget of --remove-glob-rep-sen, in bytes (sentence hashes are partitioned on '
+                                 'disk so that each partition can be counted within the budget)')
+        parser.add_argument('--dedup-partitions', type=int, default=0,
+                            help='Write the n-gram keys of the document filter to N hash partitions in the map phase, '
+                                 'so that --only-reduce-ind-onion deduplicates the partitions independently and still '
+                                 'gets the result of a global deduplication (requires --dedup-backend native; 0 to '
+                                 'deactivate)')
+        parser.add_argument('--streaming-reduce', action='store_true',
+                            help='Stream the deduplicated documents from the tmp shards to the output formatter, '
+                                 'without writing the deduplicated (vertical) corpus to disk')
 
     @staticmethod
     def check_args(args: argparse.Namespace):
         # TODO check custom args
-        pass
+        if args.dedup_granularity != 'document' and args.dedup_backend != 'native':
+            raise RuntimeError('--dedup-granularity can only be used with --dedup-backend native')
+        assert args.dedup_memory > 0
+        assert args.glob_rep_sen_memory > 0
+        assert args.dedup_partitions >= 0
+        if args.dedup_partitions > 0 and not (args.dedup_backend == 'native' and args.only_reduce_ind_onion):
+            raise RuntimeError('--dedup-partitions requires --dedup-backend native and --only-reduce-ind-onion')
+        if args.streaming_reduce and args.only_reduce_ind_onion:
+            raise RuntimeError('--streaming-reduce cannot be used with --only-reduce-ind-onion')
+
+    @staticmethod
+    def _write_vertical(stdin: TextIO, paths: List[str], corpora_tags: bool):
+        # The compact shards are converted to onion's vertical format on the fly and piped to onion's standard input,
+        # so the (several times larger) vertical corpus is never written to disk. Standard input is always closed, so
+        # that onion gets EOF even if a shard can't be read
+        try:
+            if corpora_tags:
+                stdin.write('<corpora>\n')
+            for path in paths:
+                with open_text(path) as fd:
+                    stdin.writelines(compact_to_vertical(fd, path))
+            if corpora_tags:
+                stdin.write('</corpora>\n')
+        except BrokenPipeError:
+            pass
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def _feed_onion(self, onion_command: str, paths: List[str], output_file: str, corpora_tags: bool):
+        with open(output_file, 'w') as out:
+            onion = subprocess.Popen(onion_command, shell=True, stdin=subprocess.PIPE, stdout=out,
+                                     universal_newlines=True, encoding='utf-8')
+            try:
+                self._write_vertical(onion.stdin, paths, corpora_tags)
+            except BaseException:
+                onion.kill()
+                onion.wait()
+                raise
+            if onion.wait() != 0:
+                raise subprocess.CalledProcessError(onion.returncode, onion_command)
+
+    def _stream_onion(self, onion_command: str, paths: List[str]) -> Iterable[str]:
+        # Onion's input is written from another thread, since onion starts writing its output before the end of the
+        # input and both pipes would otherwise fill up. Errors of the thread are raised here, once onion's output ends
+        onion = subprocess.Popen(onion_command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                 universal_newlines=True, encoding='utf-8')
+        errors = []
+
+        def feed():
+            try:
+                self._write_vertical(onion.stdin, paths, True)
+            except BaseException as e:
+                errors.append(e)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        completed = False
+        try:
+            yield from onion.stdout
+            completed = True
+        finally:
+            # If the consumer stops early, onion is killed (which also unblocks the feeder) and reaped
+            if not completed and onion.poll() is None:
+                onion.kill()
+            feeder.join()
+            onion.stdout.close()
+            onion.wait()
+        if errors:
+            raise errors[0]
+        if onion.returncode != 0:
+            raise subprocess.CalledProcessError(onion.returncode, onion_command)
+
+    def _run_native(self, paths: List[str], output_file: str, n: int, granularity: str, corpora_tags: bool,
+                    parallel: bool):
+        deduplicator = NGramDeduplicator(n=n, threshold=self.document_deduplication_threshold,
+                                         granularity=granularity, memory=self.dedup_memory,
+                                         processes=os.cpu_count() if parallel else 1)
+        deduplicator.deduplicate_files(paths, output_file, corpora_tags=corpora_tags)
 
     def _run_onion(self):
-        cat_command = "find " + self.onion_tmp + " -name '*.onion' -exec cat {} \; > " + self.onion_input_file
-        add_doc_tags = f"sed -i '1i <corpora>' {self.onion_input_file}; echo '</corpora>' >> {self.onion_input_file}"
-        subprocess.run(cat_command, shell=True, check=True, universal_newlines=True)
-        subprocess.run(add_doc_tags, shell=True, check=True, universal_newlines=True)
-        onion_command = f'{self.onion_path} -d "corpora" -p "doc" -t {self.document_deduplication_threshold} -n 5 -b {self.dedup_buffer} ' \
-                        f'{self.onion_input_file} > {self.onion_output_file}'
-        subprocess.run(onion_command, shell=True, check=True, universal_newlines=True)
+        if self.dedup_backend == 'native':
+            self._run_native(self.get_onion_files_paths(), self.onion_output_file, n=DEDUP_NGRAM,
+                             granularity=self.dedup_granularity, corpora_tags=True, parallel=self.args.parallel)
+            return
+        self._feed_onion(self._get_onion_command(), self.get_onion_files_paths(), self.onion_output_file,
+                         corpora_tags=True)
+
+    def _get_onion_command(self) -> str:
+        return f'{self.onion_path} -d "corpora" -p "doc" -t {self.document_deduplication_threshold} -n {DEDUP_NGRAM} ' \
+               f'-b {self.dedup_buffer}'
+
+    def _get_ind_onion_command(self) -> str:
+        return f'{self.onion_path} -m -n {IND_DEDUP_NGRAM} -t {self.document_deduplication_threshold} ' \
+               f'-b {self.dedup_buffer}'
+
+    def _marked_lines(self) -> Iterable[str]:
+        """
+        :return: Iterable over the lines of the deduplicated corpus, in onion's output format, as they are computed.
+        """
+        paths = self.get_onion_files_paths()
+        if self.dedup_backend == 'native':
+            deduplicator = NGramDeduplicator(n=DEDUP_NGRAM, threshold=self.document_deduplication_threshold,
+                                             granularity=self.dedup_granularity, memory=self.dedup_memory,
+                                             processes=os.cpu_count() if self.args.parallel else 1)
+            yield '0\t<corpora>\n'
+            for attrs, sentences, duplicates in deduplicator.deduplicate_documents(read_compact_files(paths)):
+                yield from marked_document(attrs, sentences, duplicates).splitlines(keepends=True)
+            yield '0\t</corpora>\n'
+        else:
+            yield from self._stream_onion(self._get_onion_command(), paths)
+
+    def _max_sentences(self) -> int:
+        # Upper bound of the number of sentences of the tmp shards (at least 2 bytes per sentence, and assuming a
+        # compression ratio below 10 for compressed shards)
+        size = 0
+        for path in self.get_onion_files_paths():
+            size += os.path.getsize(path) * (1 if path.endswith('.compact') else 10)
+        return size // 2 + 1
+
+    def _stream_documents(self) -> Iterable[Document]:
+        if self.remove_glob_rep_sen >= 2:
+            # Same condition as the final path of the non-streaming reduce (thresholds below 2 read the .dedup file).
+            # Deduplication runs once: its output is counted as it is computed, and spilled (compressed) for the pass
+            # that marks the repeated sentences
+            repeated_sentence_filter = RepeatedSentenceFilter(self.remove_glob_rep_sen, memory=self.glob_rep_sen_memory,
+                                                              processes=os.cpu_count() if self.args.parallel else 1,
+                                                              tmp_dir=self.output_path)
+            lines = repeated_sentence_filter.filter_stream(self._marked_lines(), self._max_sentences())
+        else:
+            lines = self._marked_lines()
+        yield from self.data_parser.parse_stream(lines)
+
+    def get_documents(self, processes: int = 1):
+        if self.streaming_reduce:
+            return [self._stream_documents()]
+        return super().get_documents(processes)
 
     def _remove_global_duplicate_sentences(self, threshold: int):
-        # First, remove format-control letters to prevent errors in the awk script
-        remove_format_modifiers_command = f"sed -i 's/%/___PERCENTAGE___/g' {self.onion_output_file}"
-        subprocess.run(remove_format_modifiers_command, shell=True, check=True, universal_newlines=True)
-
-        # Then, deduplicate with gawk command
-        awk = '''{
-                    switch($0)
-                    {
-                    case /0\t</:
-                        print
-                        break
-                    case /0\t/:
-                        seen[$0]++
-                        {if (seen[$0] <= ''' + str(threshold) + ''') {print} else {printf "1" "\t"; for (i=2; i<NF; i++) printf $i " "; print $NF}}
-                        break
-                    default:
-                        print
-                        break
-                    }
-                }
-        '''
-        awk_path = os.path.join(self.output_path, 'script.awk')
-        with open(awk_path, 'w') as f:
-            f.write(awk)
-        command = f"gawk -f {awk_path} {self.onion_output_file} > {self.onion_output_dedup_sentences_file}"
-        subprocess.run(command, shell=True, check=True, universal_newlines=True)
-        demask_command = f"sed -i 's/___PERCENTAGE___/%/g' {self.onion_output_dedup_sentences_file}"
-        subprocess.run(demask_command, shell=True, check=True, universal_newlines=True)
-        os.remove(awk_path)
+        repeated_sentence_filter = RepeatedSentenceFilter(threshold, memory=self.glob_rep_sen_memory,
+                                                          processes=os.cpu_count() if self.args.parallel else 1,
+                                                          tmp_dir=self.output_path)
+        repeated_sentence_filter.filter(self.onion_output_file, self.onion_output_dedup_sentences_file)
+
+    def _convert_onion_shard(self, path: str) -> str:
+        """
+        Converts a tmp shard in onion's vertical format (as written before the compact format, or with --no-reduce) to
+        the compact format, next to it. The conversion is only done once.
+        :param path: Path of the .onion shard.
+        :return: Path of the .compact shard.
+        """
+        compact_path = path[:-len('.onion')] + '.compact'
+        if os.path.exists(compact_path):
+            return compact_path
+        self.args.logger.logger.info(f'Converting the onion tmp shard {path} to the compact format')
+        # Written under another name and renamed, so that an interrupted conversion is never taken as a shard
+        partial_path = compact_path + '.partial'
+        with open_binary(path) as fd, open(partial_path, 'w', encoding='utf-8') as out:
+            # Tmp shards have no duplicate marks, like the debug output
+            for document in parse_onion_blocks(read_line_blocks(fd), debug=True):
+                attrs = document.attr_str().replace('\r', ' ')
+                out.write(f'{len(document.sentences)}\t{attrs}\n' +
+                          ''.join(f'{sentence}\n' for sentence in document.sentences))
+        os.replace(partial_path, compact_path)
+        return compact_path
 
     def get_onion_files_paths(self):
-        paths = []
-        for path in glob(os.path.join(self.onion_tmp, '*.onion')):
-            paths.append(path)
-        return paths
+        paths = set()
+        for pattern in ['*.compact'] + [f'*.compact{extension}' for extension in COMPRESSION_EXTENSIONS.values()]:
+            for path in glob(os.path.join(self.onion_tmp, pattern)):
+                paths.add(path)
+        for path in sorted(glob(os.path.join(self.onion_tmp, '*.onion'))):
+            paths.add(self._convert_onion_shard(path))
+        if not paths:
+            raise RuntimeError(f'No tmp shards (*.compact or *.onion) found in {self.onion_tmp}')
+        return sorted(paths)
 
     def run_single_onion_dedup_txt(self, path: str):
         # Onion
         onion_output_file = f'{path}.dedup'
-        onion_command = f'{self.onion_path} -m -n 1 -t {self.document_deduplication_threshold} -b {self.dedup_buffer} ' \
-                        f'{path} > {onion_output_file}'
-        subprocess.run(onion_command, shell=True, check=True, universal_newlines=True)
+        if self.dedup_partitions > 0:
+            # The partitions have already been resolved by count_dedup_partition
+            deduplicator = NGramDeduplicator(n=DEDUP_NGRAM, threshold=self.document_deduplication_threshold,
+                                             granularity=self.dedup_granularity)
+            deduplicator.deduplicate_shard(path, self.dedup_partitions, onion_output_file)
+        elif self.dedup_backend == 'native':
+            # Already running in the reducer pipeline processes
+            self._run_native([path], onion_output_file, n=IND_DEDUP_NGRAM, granularity=IND_DEDUP_GRANULARITY,
+                             corpora_tags=False, parallel=False)
+        else:
+            self._feed_onion(self._get_ind_onion_command(), [path], onion_output_file, corpora_tags=False)
 
-        # Awk
-        # First, remove format-control letters to prevent errors in the awk script
         if self.remove_glob_rep_sen != -1:
-            threshold = self.remove_glob_rep_sen
-            remove_format_modifiers_command = f"sed -i 's/%/___PERCENTAGE___/g' {onion_output_file}"
-            subprocess.run(remove_format_modifiers_command, shell=True, check=True, universal_newlines=True)
-
-            # Then, deduplicate with gawk command
-            awk = '''{
-                                switch($0)
-                                {
-                                case /0\t</:
-                                    print
-                                    break
-                                case /0\t/:
-                                    seen[$0]++
-                                    {if (seen[$0] <= ''' + str(threshold) + ''') {print} else {printf "1" "\t"; for (i=2; i<NF; i++) printf $i " "; print $NF}}
-                                    break
-                                default:
-                                    print
-                                    break
-                                }
-                            }
-                    '''
-            awk_path = os.path.join(self.output_path, f'script{str(os.getpid())}.awk')
-            with open(awk_path, 'w') as f:
-                f.write(awk)
-            onion_output_dedup_sentences_file = onion_output_file + '.sentences'
-            command = f"gawk -f {awk_path} {onion_output_file} > {onion_output_dedup_sentences_file}"
-            subprocess.run(command, shell=True, check=True, universal_newlines=True)
-            demask_command = f"sed -i 's/___PERCENTAGE___/%/g' {onion_output_dedup_sentences_file}"
-            subprocess.run(demask_command, shell=True, check=True, universal_newlines=True)
-            os.remove(awk_path)
+            # Already running in the reducer pipeline processes
+            repeated_sentence_filter = RepeatedSentenceFilter(self.remove_glob_rep_sen,
+                                                              memory=self.glob_rep_sen_memory, processes=1,
+                                                              tmp_dir=self.output_path)
+            repeated_sentence_filter.filter(onion_output_file, onion_output_file + '.sentences')
 
+    def count_dedup_partition(self, partition: int) -> int:
+        count_partition(self.get_onion_files_paths(), partition)
+        return partition
 
     def create_pipeline_reducer_mappers(self):
         return [self.run_single_onion_dedup_txt]
 
+    def create_pipeline_partition_mappers(self):
+        return [self.count_dedup_partition]
+
     def _reduce(self):
+        if self.streaming_reduce:
+            # Deduplication runs lazily, as the documents are consumed from get_documents
+            return
         if self.only_reduce_ind_onion:
             self.get_onion_files_paths()
             self.args.logger.logger.info('Distributed reduce')
+            if self.dedup_partitions > 0:
+                # Shuffle: every partition gathers the keys of all the shards, so that duplicates across shards are
+                # found as in a global deduplication
+                pipeline = MappingPipeline(streams=list(range(self.dedup_partitions)),
+                                           mappers_factory=self.create_pipeline_partition_mappers,
+                                           parallel=self.args.parallel,
+                                           logger=self.args.logger if self.args.log_every_iter != -1 else None,
+                                           log_every_iter=self.args.log_every_iter,
+                                           backend=self.args.backend,
+                                           checkpoint_path=None)
+                pipeline.run()
             pipeline = MappingPipeline(streams=self.get_onion_files_paths(),
                                        mappers_factory=self.create_pipeline_reducer_mappers,
                                        parallel=self.args.parallel,
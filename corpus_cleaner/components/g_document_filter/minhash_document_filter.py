@@ -0,0 +1,151 @@
+import argparse
+import os
+import numpy as np
+from typing import Iterable, List, Optional
+from corpus_cleaner.compression import strip_compression_extension
+from corpus_cleaner.components.a_data_parser.compact_parser import read_compact_files
+from corpus_cleaner.components.i_output_formatter.compact_output_formatter import MINHASH_EXTENSION
+from .document_filter import DocumentFilter
+from corpus_cleaner.hashing import NGRAM_BASE
+from .ngram_deduplicator import marked_document
+
+EMPTY_SIGNATURE = np.iinfo(np.uint32).max
+VERIFY_CHUNK_SIZE = 65536
+
+
+class MinHashDocumentFilter(DocumentFilter):
+    def __init__(self, args: argparse.Namespace, minhash_permutations: int = 128, minhash_bands: int = 16,
+                 minhash_threshold: float = 0.8, output_path: Optional[str] = None, **kwargs):
+        """
+        Fuzzy document deduplication with MinHash and banded LSH. The signatures are computed in the map phase (see
+        CompactOutputFormatter), so the reducer only needs --minhash-permutations * 4 bytes per document. Documents
+        sharing any band are candidates, and they are clustered if the fraction of equal signature values (an estimate
+        of the Jaccard similarity of their n-gram sets) is at least --minhash-threshold. The first document of every
+        cluster is kept.
+        """
+        super().__init__(args, output_path=output_path, **kwargs)
+        self.minhash_permutations = args.minhash_permutations \
+            if args.minhash_permutations is not None else minhash_permutations
+        self.minhash_bands = args.minhash_bands if args.minhash_bands is not None else minhash_bands
+        self.minhash_threshold = args.minhash_threshold if args.minhash_threshold is not None else minhash_threshold
+        self.keep = None
+
+    @staticmethod
+    def add_args(parser: argparse.ArgumentParser):
+        parser.add_argument('--minhash-permutations', type=int, default=128,
+                            help='Number of hash functions of the MinHash signatures (MinHashDocumentFilter)')
+        parser.add_argument('--minhash-bands', type=int, default=16,
+                            help='Number of LSH bands; it must divide --minhash-permutations (MinHashDocumentFilter)')
+        parser.add_argument('--minhash-ngram', type=int, default=5,
+                            help='Length of the word n-grams (shingles) hashed by MinHash (MinHashDocumentFilter)')
+        parser.add_argument('--minhash-threshold', type=float, default=0.8,
+                            help='Estimated Jaccard similarity above which two documents are near-duplicates '
+                                 '(MinHashDocumentFilter)')
+
+    @staticmethod
+    def check_args(args: argparse.Namespace):
+        assert args.minhash_permutations >= 1 and args.minhash_bands >= 1 and args.minhash_ngram >= 1
+        if args.minhash_permutations % args.minhash_bands != 0:
+            raise RuntimeError('--minhash-bands must divide --minhash-permutations')
+        if 'MinHashDocumentFilter' in args.components:
+            if args.only_reduce_ind_onion:
+                raise RuntimeError('--only-reduce-ind-onion cannot be used with MinHashDocumentFilter')
+
+    def _get_shard_paths(self) -> List[str]:
+        paths = self.get_onion_files_paths()
+        for path in paths:
+            if not os.path.exists(self._get_signatures_path(path)):
+                raise FileNotFoundError(f'Missing MinHash signatures of {path}')
+        return paths
+
+    @staticmethod
+    def _get_signatures_path(path: str) -> str:
+        return strip_compression_extension(path) + MINHASH_EXTENSION
+
+    def _load_signatures(self, paths: List[str]) -> np.ndarray:
+        signatures = [np.fromfile(self._get_signatures_path(path), dtype='<u4').reshape(-1, self.minhash_permutations)
+                      for path in paths]
+        if len(signatures) == 0:
+            return np.zeros((0, self.minhash_permutations), dtype=np.uint32)
+        return np.concatenate(signatures)
+
+    def _candidate_pairs(self, signatures: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        # For every band, each document is paired with the first document of its bucket
+        rows = self.minhash_permutations // self.minhash_bands
+        indices = np.flatnonzero(valid)
+        # Bands are hashed to 64 bits; collisions are discarded when verifying the candidates
+        powers = NGRAM_BASE ** np.arange(rows, dtype=np.uint64)
+        pairs = []
+        for band in range(self.minhash_bands):
+            with np.errstate(over='ignore'):
+                keys = (signatures[indices, band * rows:(band + 1) * rows].astype(np.uint64) * powers).sum(
+                    axis=1, dtype=np.uint64)
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            new_bucket = np.ones(len(order), dtype=bool)
+            new_bucket[1:] = sorted_keys[1:] != sorted_keys[:-1]
+            heads = order[np.flatnonzero(new_bucket)][np.cumsum(new_bucket) - 1]
+            members = ~new_bucket
+            pairs.append(np.stack([indices[order[members]], indices[heads[members]]], axis=1))
+        if len(pairs) == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        return np.unique(np.concatenate(pairs), axis=0)
+
+    def _verify(self, signatures: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+        similar = np.zeros(len(pairs), dtype=bool)
+        for start in range(0, len(pairs), VERIFY_CHUNK_SIZE):
+            chunk = pairs[start:start + VERIFY_CHUNK_SIZE]
+            similar[start:start + VERIFY_CHUNK_SIZE] = \
+                (signatures[chunk[:, 0]] == signatures[chunk[:, 1]]).mean(axis=1) >= self.minhash_threshold
+        return similar
+
+    @staticmethod
+    def _connected_components(n: int, edges: np.ndarray) -> np.ndarray:
+        # Vectorized label propagation: every document ends up labeled with the smallest index of its cluster
+        labels = np.arange(n)
+        while True:
+            minimum = np.minimum(labels[edges[:, 0]], labels[edges[:, 1]])
+            new_labels = labels.copy()
+            np.minimum.at(new_labels, edges[:, 0], minimum)
+            np.minimum.at(new_labels, edges[:, 1], minimum)
+            new_labels = new_labels[new_labels]
+            if np.array_equal(new_labels, labels):
+                return labels
+            labels = new_labels
+
+    def _keep_mask(self, signatures: np.ndarray) -> np.ndarray:
+        valid = ~(signatures == EMPTY_SIGNATURE).all(axis=1)
+        pairs = self._candidate_pairs(signatures, valid)
+        edges = pairs[self._verify(signatures, pairs)]
+        labels = self._connected_components(len(signatures), edges)
+        return labels == np.arange(len(signatures))
+
+    def _compute_keep_mask(self) -> np.ndarray:
+        keep = self._keep_mask(self._load_signatures(self._get_shard_paths()))
+        self.args.logger.logger.info(f'MinHash: keeping {int(keep.sum())} out of {len(keep)} documents')
+        return keep
+
+    def _marked_lines(self) -> Iterable[str]:
+        if self.keep is None:
+            self.keep = self._compute_keep_mask()
+        idx = 0
+        yield '0\t<corpora>\n'
+        for attrs, sentences in read_compact_files(self._get_shard_paths()):
+            if idx >= len(self.keep):
+                raise RuntimeError(f'Found more documents than MinHash signatures ({len(self.keep)})')
+            yield from marked_document(attrs, sentences, [not self.keep[idx]] * len(sentences)).splitlines(
+                keepends=True)
+            idx += 1
+        yield '0\t</corpora>\n'
+        if idx != len(self.keep):
+            raise RuntimeError(f'Found {idx} documents but {len(self.keep)} MinHash signatures')
+
+    def _reduce(self):
+        # The signatures are small, so the clusters are computed eagerly even with --streaming-reduce
+        self.keep = self._compute_keep_mask()
+        if self.streaming_reduce:
+            return
+        with open(self.onion_output_file, 'w', encoding='utf-8') as out:
+            out.writelines(self._marked_lines())
+        if self.remove_glob_rep_sen != -1:
+            self._remove_global_duplicate_sentences(self.remove_glob_rep_sen)
@@ -0,0 +1,241 @@
+from corpus_cleaner.compression import open_text
+from corpus_cleaner.components.a_data_parser.compact_parser import read_compact, read_compact_files
+from corpus_cleaner.hashing import unit_ngram_hashes
+from corpus_cleaner.dedup_partitions import load_seen
+from collections import deque
+import multiprocessing
+import numpy as np
+from typing import Iterable, List, TextIO, Tuple
+
+GRANULARITIES = ['document', 'paragraph']
+INITIAL_CAPACITY = 2 ** 20
+MAX_LOAD = 0.5
+FULL_LOAD = 0.9
+HASH_CHUNK_SIZE = 1000
+
+
+def marked_document(attrs: str, sentences: List[str], duplicates: List[bool]) -> str:
+    """
+    Formats a document in the marked vertical format of onion's output (every line prefixed by 1 if it is a duplicate
+    or 0 otherwise), as read by OnionParser.
+    :param attrs: Attributes string of the document.
+    :param sentences: Sentences of the document, with words separated by single spaces.
+    :param duplicates: Whether every sentence is a duplicate.
+    :return: The formatted document (several lines).
+    """
+    return f'0\t<doc {attrs}>\n' + \
+           '0\t\n'.join(''.join(f'{int(duplicate)}\t{word}\n' for word in sentence.split(' '))
+                        for sentence, duplicate in zip(sentences, duplicates)) + \
+           '0\t</doc>\n'
+
+
+def write_marked_document(out: TextIO, attrs: str, sentences: List[str], duplicates: List[bool]):
+    out.write(marked_document(attrs, sentences, duplicates))
+
+
+def _hash_documents(args: Tuple[List[Tuple[str, List[str]]], int, str]) -> List[List[np.ndarray]]:
+    documents, n, granularity = args
+    return [unit_ngram_hashes(sentences, n, granularity) for _, sentences in documents]
+
+
+class NGramHashSet:
+    def __init__(self, memory: int, initial_capacity: int = INITIAL_CAPACITY):
+        """
+        Set of 64-bit hashes backed by a NumPy open-addressing (linear probing) table, with vectorized lookups and
+        insertions. It doubles its size when the load factor goes above MAX_LOAD, as long as it fits in the memory
+        budget.
+        :param memory: Maximum size of the table, in bytes.
+        :param initial_capacity: Initial number of slots (a power of 2).
+        """
+        self.memory = memory
+        self.table = np.zeros(initial_capacity, dtype=np.uint64)
+        self.mask = np.uint64(initial_capacity - 1)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """
+        :param keys: uint64 array of (non-zero) keys.
+        :return: Boolean array, True for the keys in the set.
+        """
+        res = np.zeros(len(keys), dtype=bool)
+        idx = np.arange(len(keys))
+        slots = keys & self.mask
+        while len(idx) > 0:
+            values = self.table[slots]
+            hit = values == keys[idx]
+            res[idx[hit]] = True
+            pending = ~(hit | (values == 0))
+            idx = idx[pending]
+            slots = (slots[pending] + np.uint64(1)) & self.mask
+        return res
+
+    def _insert_new(self, keys: np.ndarray):
+        # keys must be unique and not in the set
+        slots = keys & self.mask
+        while len(keys) > 0:
+            candidates = np.flatnonzero(self.table[slots] == 0)
+            # Only one of the keys probing the same empty slot can take it
+            _, first = np.unique(slots[candidates], return_index=True)
+            winners = candidates[first]
+            self.table[slots[winners]] = keys[winners]
+            pending = np.ones(len(keys), dtype=bool)
+            pending[winners] = False
+            keys = keys[pending]
+            slots = (slots[pending] + np.uint64(1)) & self.mask
+
+    def _grow(self):
+        keys = self.table[self.table != 0]
+        self.table = np.zeros(2 * len(self.table), dtype=np.uint64)
+        self.mask = np.uint64(len(self.table) - 1)
+        self._insert_new(keys)
+
+    def add(self, keys: np.ndarray):
+        keys = np.unique(keys)
+        keys = keys[~self.contains(keys)]
+        while self.size + len(keys) > MAX_LOAD * len(self.table):
+            if 2 * self.table.nbytes > self.memory:
+                # Out of budget: keep filling the table, but linear probing degrades too much above FULL_LOAD
+                if self.size + len(keys) > FULL_LOAD * len(self.table):
+                    raise RuntimeError(f'The n-gram hash set is full ({self.size} n-grams); increase --dedup-memory')
+                break
+            self._grow()
+        self._insert_new(keys)
+        self.size += len(keys)
+
+
+class NGramDeduplicator:
+    def __init__(self, n: int = 5, threshold: float = 0.5, granularity: str = 'document', memory: int = 4000000000,
+                 processes: int = 1):
+        """
+        Native implementation of onion's near-duplicate detection. Units (documents or paragraphs, ie. sentences) are
+        processed in order; a token is a duplicate if it is covered by an n-gram seen in a previous unit, and a unit is
+        a duplicate if the proportion of duplicate tokens is above the threshold. The n-grams of every unit are added to
+        the set of seen n-grams, whether it is a duplicate or not. N-grams are hashed in parallel, while the decisions
+        (which depend on the order) are taken sequentially.
+        :param n: n-gram length.
+        :param threshold: Duplicate content threshold.
+        :param granularity: 'document' or 'paragraph'.
+        :param memory: Memory budget of the n-gram hash set, in bytes.
+        :param processes: Number of processes hashing n-grams.
+        """
+        assert granularity in GRANULARITIES
+        self.n = n
+        self.threshold = threshold
+        self.granularity = granularity
+        self.processes = processes
+        self.seen = NGramHashSet(memory)
+
+    def _is_duplicate(self, seen: np.ndarray) -> bool:
+        """
+        :param seen: Whether every n-gram of a unit was seen in a previous unit.
+        :return: Whether the unit is a duplicate.
+        """
+        if len(seen) == 0:
+            return False
+        # The duplicate tokens are the ones covered by any seen n-gram
+        n_tokens = len(seen) + self.n - 1
+        duplicate_tokens = np.convolve(seen.astype(np.int32), np.ones(self.n, dtype=np.int32))[:n_tokens] > 0
+        return duplicate_tokens.sum() / n_tokens > self.threshold
+
+    def _duplicate_units(self, units: List[np.ndarray]) -> List[bool]:
+        # Since the n-grams of every unit are added to the set regardless of the decision, the n-grams seen before each
+        # unit of a chunk are the ones in the set before the chunk, plus the ones of the previous units of the chunk.
+        # This gives the same decisions as processing the units one by one, with a few large vectorized operations.
+        if len(units) == 0:
+            return []
+        lengths = [len(unit) for unit in units]
+        hashes = np.concatenate(units)
+        unit_ids = np.repeat(np.arange(len(units)), lengths)
+        unique, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        seen = self.seen.contains(hashes) | (unit_ids[first][inverse] < unit_ids)
+        self.seen.add(unique)
+        return [self._is_duplicate(unit_seen) for unit_seen in np.split(seen, np.cumsum(lengths)[:-1])]
+
+    def _hashed_chunks(self, documents: Iterable[Tuple[str, List[str]]]) \
+            -> Iterable[Tuple[List[Tuple[str, List[str]]], List[List[np.ndarray]]]]:
+        def chunks():
+            chunk = []
+            for document in documents:
+                chunk.append(document)
+                if len(chunk) == HASH_CHUNK_SIZE:
+                    yield chunk
+                    chunk = []
+            if len(chunk) > 0:
+                yield chunk
+
+        if self.processes == 1:
+            for chunk in chunks():
+                yield chunk, _hash_documents((chunk, self.n, self.granularity))
+            return
+        # Bounded number of chunks in flight (unlike Pool.imap, which consumes the whole input)
+        with multiprocessing.Pool(self.processes) as pool:
+            pending = deque()
+            for chunk in chunks():
+                pending.append((chunk, pool.apply_async(_hash_documents, ((chunk, self.n, self.granularity),))))
+                if len(pending) >= 2 * self.processes:
+                    chunk, res = pending.popleft()
+                    yield chunk, res.get()
+            while pending:
+                chunk, res = pending.popleft()
+                yield chunk, res.get()
+
+    def deduplicate_documents(self, documents: Iterable[Tuple[str, List[str]]]) \
+            -> Iterable[Tuple[str, List[str], List[bool]]]:
+        """
+        :param documents: Iterable of (attributes string, sentences) tuples, as read by read_compact.
+        :return: Iterable of (attributes string, sentences, whether every sentence is a duplicate) tuples.
+        """
+        for chunk, chunk_hashes in self._hashed_chunks(documents):
+            duplicates = iter(self._duplicate_units([unit for units in chunk_hashes for unit in units]))
+            for (attrs, sentences), hashes in zip(chunk, chunk_hashes):
+                if self.granularity == 'document':
+                    document_duplicates = [next(duplicates)] * len(sentences)
+                else:
+                    document_duplicates = [next(duplicates) for _ in hashes]
+                yield attrs, sentences, document_duplicates
+
+    def deduplicate(self, documents: Iterable[Tuple[str, List[str]]], out: TextIO):
+        """
+        :param documents: Iterable of (attributes string, sentences) tuples, as read by read_compact.
+        :param out: Text file object where the documents are written in onion's output format.
+        """
+        for attrs, sentences, duplicates in self.deduplicate_documents(documents):
+            write_marked_document(out, attrs, sentences, duplicates)
+
+    def deduplicate_files(self, paths: List[str], output_file: str, corpora_tags: bool = True):
+        with open(output_file, 'w', encoding='utf-8') as out:
+            if corpora_tags:
+                out.write('0\t<corpora>\n')
+            self.deduplicate(read_compact_files(paths), out)
+            if corpora_tags:
+                out.write('0\t</corpora>\n')
+
+    def deduplicate_shard(self, path: str, num_partitions: int, output_file: str):
+        """
+        Deduplicates a shard whose n-gram keys were written in the map phase and resolved by count_partition. The
+        decisions are the same as the ones of deduplicate_files over all the shards.
+        :param path: Path of the tmp shard.
+        :param num_partitions: Number of partitions.
+        :param output_file: Path of the output, in onion's output format.
+        """
+        seen = load_seen(path, num_partitions)
+        seen_units = (seen['document'] << np.uint64(32)) | seen['unit'].astype(np.uint64)
+        with open_text(path) as fd, open(output_file, 'w', encoding='utf-8') as out:
+            for document, (attrs, sentences) in enumerate(read_compact(fd, path)):
+                if self.granularity == 'document':
+                    units = [' '.join(sentences)]
+                else:
+                    units = sentences
+                duplicates = []
+                for unit, text in enumerate(units):
+                    key = (document << 32) | unit
+                    start, end = np.searchsorted(seen_units, np.array([key, key + 1], dtype=np.uint64))
+                    unit_seen = np.zeros(max(0, len(text.split()) - self.n + 1), dtype=bool)
+                    unit_seen[seen['position'][start:end]] = True
+                    duplicates.append(self._is_duplicate(unit_seen))
+                if self.granularity == 'document':
+                    duplicates = duplicates * len(sentences)
+                write_marked_document(out, attrs, sentences, duplicates)
@@ -0,0 +1,193 @@
+from hashlib import blake2b
+import heapq
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import numpy as np
+from typing import Callable, Iterable, List, Optional, Tuple
+from corpus_cleaner.compression import BlockWriter, add_compression_extension, open_text, spill_compression
+
+PAIR_DTYPE = np.dtype([('hash', '<u8'), ('ordinal', '<i8')])
+ORDINAL_DTYPE = np.dtype('<i8')
+FLUSH_SIZE = 1000000
+READ_CHUNK_SIZE = 65536
+TAGS = ('</doc>', '<corpora>', '</corpora>')
+
+
+def _is_boundary(token: str) -> bool:
+    return token == '' or token.startswith('<doc') or token in TAGS
+
+
+def _sentences(lines: Iterable[str]) -> Iterable[Tuple[List[str], List[str]]]:
+    """
+    Groups the lines of onion's marked vertical format into sentences.
+    :param lines: Lines (eg. a text file object).
+    :return: Iterable of (lines, kept words) tuples. Boundary lines (tags and empty lines) are returned on their own,
+    without kept words.
+    """
+    sentence_lines = []
+    words = []
+    for line in lines:
+        mark, _, token = line.rstrip('\n').partition('\t')
+        if _is_boundary(token):
+            if len(sentence_lines) > 0:
+                yield sentence_lines, words
+                sentence_lines = []
+                words = []
+            yield [line], []
+        else:
+            sentence_lines.append(line)
+            if mark == '0':
+                words.append(token)
+    if len(sentence_lines) > 0:
+        yield sentence_lines, words
+
+
+def _sentence_hash(words: List[str]) -> int:
+    return int.from_bytes(blake2b(' '.join(words).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _count_partition(args: Tuple[str, str, int]):
+    # Marks every occurrence of a sentence after the first `threshold` ones (in corpus order)
+    pairs_path, marked_path, threshold = args
+    pairs = np.fromfile(pairs_path, dtype=PAIR_DTYPE)
+    os.remove(pairs_path)
+    order = np.lexsort((pairs['ordinal'], pairs['hash']))
+    hashes = pairs['hash'][order]
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = hashes[1:] != hashes[:-1]
+    group_starts = np.flatnonzero(new_group)[np.cumsum(new_group) - 1]
+    ranks = np.arange(len(order)) - group_starts
+    np.sort(pairs['ordinal'][order][ranks >= threshold]).astype(ORDINAL_DTYPE).tofile(marked_path)
+
+
+def _read_ordinals(path: str) -> Iterable[int]:
+    ordinals = np.memmap(path, dtype=ORDINAL_DTYPE, mode='r') if os.path.getsize(path) > 0 else []
+    for start in range(0, len(ordinals), READ_CHUNK_SIZE):
+        yield from ordinals[start:start + READ_CHUNK_SIZE].tolist()
+
+
+class RepeatedSentenceFilter:
+    def __init__(self, threshold: int, memory: int = 2000000000, processes: int = 1,
+                 tmp_dir: Optional[str] = None):
+        """
+        Corpus-level repeated sentence removal in external memory. A first pass over onion's output writes the 64-bit
+        hash of every kept sentence, with its position, to one of several partition files (chosen by hash, so all the
+        occurrences of a sentence end up in the same partition). Partitions are small enough to be sorted within the
+        memory budget, and are processed in parallel. A second pass marks as duplicates (1) the occurrences of every
+        sentence after the first `threshold` ones.
+        :param threshold: Number of occurrences of a sentence that are kept.
+        :param memory: Memory budget, in bytes, shared by the processes.
+        :param processes: Number of processes counting partitions.
+        :param tmp_dir: Directory for the partition files.
+        """
+        self.threshold = threshold
+        self.memory = memory
+        self.processes = processes
+        self.tmp_dir = tmp_dir
+
+    def _num_partitions(self, max_sentences: int) -> int:
+        # Each sentence takes 16 bytes in a partition, and sorting a partition needs about twice its size
+        return max(1, math.ceil(2 * max_sentences * PAIR_DTYPE.itemsize * self.processes / self.memory))
+
+    def _partition(self, lines: Iterable[str], pairs_paths: List[str], spill: Optional[BlockWriter] = None):
+        num_partitions = len(pairs_paths)
+        fds = [open(path, 'wb') for path in pairs_paths]
+        buffer = np.zeros(FLUSH_SIZE, dtype=PAIR_DTYPE)
+        size = 0
+        ordinal = 0
+
+        def flush(pairs: np.ndarray):
+            partitions = pairs['hash'] % np.uint64(num_partitions)
+            order = np.argsort(partitions, kind='stable')
+            bounds = np.searchsorted(partitions[order], np.arange(num_partitions + 1))
+            for partition, fd in enumerate(fds):
+                pairs[order[bounds[partition]:bounds[partition + 1]]].tofile(fd)
+
+        for sentence_lines, words in _sentences(lines):
+            if spill is not None:
+                spill.writelines(sentence_lines)
+            if len(words) == 0:
+                continue
+            buffer[size] = (_sentence_hash(words), ordinal)
+            size += 1
+            ordinal += 1
+            if size == FLUSH_SIZE:
+                flush(buffer)
+                size = 0
+        flush(buffer[:size])
+        for fd in fds:
+            fd.close()
+
+    def _count(self, tasks: List[Tuple[str, str, int]]):
+        if self.processes == 1:
+            for task in tasks:
+                _count_partition(task)
+        else:
+            with multiprocessing.Pool(self.processes) as pool:
+                pool.map(_count_partition, tasks)
+
+    @staticmethod
+    def _mark(lines: Iterable[str], marked_paths: List[str]) -> Iterable[str]:
+        marked = heapq.merge(*[_read_ordinals(path) for path in marked_paths])
+        next_marked = next(marked, -1)
+        ordinal = 0
+        for sentence_lines, words in _sentences(lines):
+            if len(words) == 0:
+                yield from sentence_lines
+                continue
+            if ordinal == next_marked:
+                for line in sentence_lines:
+                    yield '1' + line[line.index('\t'):]
+                next_marked = next(marked, -1)
+            else:
+                yield from sentence_lines
+            ordinal += 1
+
+    def filter_stream(self, lines: Iterable[str], max_sentences: int,
+                      lines_again: Optional[Callable[[], Iterable[str]]] = None) -> Iterable[str]:
+        """
+        :param lines: Iterable over the lines of onion's output. It is only consumed once.
+        :param max_sentences: Upper bound of the number of sentences (only used to choose the number of partitions).
+        :param lines_again: Callable returning the same lines again, for the second pass (eg. when they are read from a
+        file). If None, the lines are spilled to a compressed file in the first pass, so that they are not computed
+        twice.
+        :return: Iterable over the lines of the output, in the same format.
+        """
+        tmp_dir = tempfile.mkdtemp(prefix='repeated_sentences_', dir=self.tmp_dir)
+        try:
+            num_partitions = self._num_partitions(max_sentences)
+            pairs_paths = [os.path.join(tmp_dir, f'{partition}.pairs') for partition in range(num_partitions)]
+            marked_paths = [os.path.join(tmp_dir, f'{partition}.marked') for partition in range(num_partitions)]
+            if lines_again is None:
+                compression = spill_compression()
+                spill_path = add_compression_extension(os.path.join(tmp_dir, 'lines.spill'), compression)
+                with BlockWriter(spill_path, compression=compression, threads=self.processes, mode='w') as spill:
+                    self._partition(lines, pairs_paths, spill)
+
+                def lines_again():
+                    with open_text(spill_path) as fd:
+                        yield from fd
+            else:
+                self._partition(lines, pairs_paths)
+            self._count([(pairs_path, marked_path, self.threshold)
+                         for pairs_path, marked_path in zip(pairs_paths, marked_paths)])
+            yield from self._mark(lines_again(), marked_paths)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def filter(self, input_file: str, output_file: str):
+        """
+        :param input_file: Path to onion's output.
+        :param output_file: Path to the output, in the same format.
+        """
+        def lines():
+            with open(input_file, 'r', encoding='utf-8') as fd:
+                yield from fd
+
+        # A sentence takes at least 7 bytes in the vertical format ("0\tw\n0\t\n")
+        max_sentences = os.path.getsize(input_file) // 7 + 1
+        with open(output_file, 'w', encoding='utf-8') as out:
+            out.writelines(self.filter_stream(lines(), max_sentences, lines_again=lines))
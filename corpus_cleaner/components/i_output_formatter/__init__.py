@@ -3,6 +3,8 @@ from .fairseq_lm_output_formatter import FairseqLMOutputFormatter
 from .output_formatter_factory import OutputFormatterFactory
 from .onion_output_formatter import OnionOutputFormatter
 from .sentence_output_formatter import SentenceOutputFormatter
+from .indexed_output_formatter import IndexedOutputFormatter, IndexedDataset
+from .compact_output_formatter import CompactOutputFormatter
 
 __all__ = ['OutputFormatter', 'FairseqLMOutputFormatter', 'OnionOutputFormatter', 'SentenceOutputFormatter',
-           'OutputFormatterFactory']
+           'IndexedOutputFormatter', 'IndexedDataset', 'CompactOutputFormatter', 'OutputFormatterFactory']
@@ -0,0 +1,62 @@
+from .output_formatter import OutputFormatter
+from corpus_cleaner.document import Document
+from corpus_cleaner.compression import BlockWriter, add_compression_extension
+from corpus_cleaner.hashing import minhash_permutations, minhash_signature
+from corpus_cleaner.dedup_partitions import NGramKeyWriter
+import argparse
+
+MINHASH_EXTENSION = '.minhash'
+
+
+class CompactOutputFormatter(OutputFormatter):
+    def __init__(self, args: argparse.Namespace, output_path: str, **kwargs):
+        """
+        Writes the intermediate (tmp) shards in a compact format: a header line per document with the number of
+        sentences and the document attributes (separated by a tab, see Document.attr_str, which includes the language
+        confidence and the chunk position), followed by one sentence per line. Whitespace inside
+        sentences is normalized to single spaces, which is all onion's vertical format can represent anyway, and
+        sentences without words are dropped. Shards can be block-compressed with --tmp-compression.
+        When the MinHashDocumentFilter reducer is used, the MinHash signature of every document is also appended to
+        {output_path}.minhash (--minhash-permutations uint32 values per document, in the same order).
+        With --dedup-partitions N, the n-gram keys of the document filter are also written to N hash partitions (see
+        NGramKeyWriter).
+        """
+        super().__init__(args, output_path)
+        self.tmp_compression = args.tmp_compression if args.tmp_compression is not None else 'none'
+        self.minhash = args.components is not None and 'MinHashDocumentFilter' in args.components
+        if self.minhash:
+            self.minhash_ngram = args.minhash_ngram
+            self.minhash_permutations = minhash_permutations(args.minhash_permutations)
+        self.minhash_fd = None
+        dedup_partitions = args.dedup_partitions if args.dedup_partitions is not None else 0
+        self.key_writer = NGramKeyWriter(output_path, dedup_partitions, args.dedup_granularity) \
+            if dedup_partitions > 0 else None
+
+    def _init_writing(self):
+        self.fd = BlockWriter(add_compression_extension(self.path, self.tmp_compression),
+                              compression=self.tmp_compression, threads=self.output_compression_threads)
+        if self.minhash:
+            self.minhash_fd = open(self.path + MINHASH_EXTENSION, 'ab')
+        if self.key_writer is not None:
+            self.key_writer.open()
+
+    def _write_document(self, document: Document):
+        if document is not None:
+            sentences = [' '.join(sentence.split()) for sentence in document.sentences]
+            sentences = [sentence for sentence in sentences if len(sentence) > 0]
+            # Shards are read back in text mode, so '\r' would be taken as a line break
+            attrs = document.attr_str().replace('\r', ' ')
+            self.fd.write(f'{len(sentences)}\t{attrs}\n' + ''.join(f'{sentence}\n' for sentence in sentences))
+            if self.minhash:
+                tokens = ' '.join(sentences).split(' ') if len(sentences) > 0 else []
+                self.minhash_fd.write(minhash_signature(tokens, self.minhash_ngram, self.minhash_permutations)
+                                      .astype('<u4').tobytes())
+            if self.key_writer is not None:
+                self.key_writer.write(sentences)
+
+    def _end_writing(self):
+        self.fd.close()
+        if self.minhash_fd is not None:
+            self.minhash_fd.close()
+        if self.key_writer is not None:
+            self.key_writer.close()
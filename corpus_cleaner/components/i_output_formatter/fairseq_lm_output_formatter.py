@@ -11,12 +11,11 @@ class FairseqLMOutputFormatter(OutputFormatter):
         super().__init__(args, output_path)
 
     def _init_writing(self):
-        self.fd = open(self.path, 'a')
+        self.fd = self._open_output(self._output_path())
 
     def _write_document(self, document: Document):
         if len(document.sentences) > 0:
-            self.fd.writelines(f'{sentence}\n' for sentence in document.sentences)
-            self.fd.write('\n')
+            self.fd.write(''.join(f'{sentence}\n' for sentence in document.sentences) + '\n')
 
     def _end_writing(self):
         self.fd.close()
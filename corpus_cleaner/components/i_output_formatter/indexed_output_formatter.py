@@ -0,0 +1,100 @@
+from .output_formatter import OutputFormatter
+from corpus_cleaner.document import Document
+import argparse
+import os
+import shutil
+from typing import List, Optional
+import numpy as np
+from numpy.lib.format import write_array_header_1_0
+
+OFFSETS_DTYPE = np.dtype('<i8')
+
+
+class IndexedOutputFormatter(OutputFormatter):
+    def __init__(self, args: argparse.Namespace, output_path: Optional[str] = None):
+        """
+        Writes the documents as an indexed binary dataset, ready to be memory-mapped by IndexedDataset:
+          - {root}.bin: The UTF-8 bytes of all the sentences, concatenated.
+          - {root}.sentence_offsets.npy: int64 array with the byte offset of every sentence in the .bin file (plus the
+            final size), so that sentence i is bin[sentence_offsets[i]:sentence_offsets[i+1]].
+          - {root}.document_offsets.npy: int64 array with the index of the first sentence of every document (plus the
+            total number of sentences).
+        Offsets are streamed to disk while writing, and only wrapped as .npy files at the end.
+        """
+        if output_path is None:
+            output_path = os.path.join(args.output_path, 'output.bin')
+        super().__init__(args, output_path)
+
+    def _init_writing(self):
+        self.root = os.path.splitext(self._output_path())[0]
+        self.fd = open(self.root + '.bin', 'wb')
+        self.sentence_offsets_fd = open(self.root + '.sentence_offsets.tmp', 'wb')
+        self.document_offsets_fd = open(self.root + '.document_offsets.tmp', 'wb')
+        self.n_bytes = 0
+        self.n_sentences = 0
+        self.n_documents = 0
+        np.zeros(1, dtype=OFFSETS_DTYPE).tofile(self.sentence_offsets_fd)
+        np.zeros(1, dtype=OFFSETS_DTYPE).tofile(self.document_offsets_fd)
+
+    def _write_document(self, document: Document):
+        if len(document.sentences) > 0:
+            encoded = [sentence.encode('utf-8') for sentence in document.sentences]
+            offsets = np.cumsum([len(sentence) for sentence in encoded], dtype=OFFSETS_DTYPE) + self.n_bytes
+            self.fd.write(b''.join(encoded))
+            offsets.tofile(self.sentence_offsets_fd)
+            self.n_bytes = int(offsets[-1])
+            self.n_sentences += len(encoded)
+            self.n_documents += 1
+            np.array([self.n_sentences], dtype=OFFSETS_DTYPE).tofile(self.document_offsets_fd)
+
+    @staticmethod
+    def _to_npy(tmp_path: str, length: int):
+        with open(os.path.splitext(tmp_path)[0] + '.npy', 'wb') as npy, open(tmp_path, 'rb') as tmp:
+            write_array_header_1_0(npy, dict(descr=OFFSETS_DTYPE.str, fortran_order=False, shape=(length,)))
+            shutil.copyfileobj(tmp, npy)
+        os.remove(tmp_path)
+
+    def _end_writing(self):
+        self.fd.close()
+        self.sentence_offsets_fd.close()
+        self.document_offsets_fd.close()
+        self._to_npy(self.sentence_offsets_fd.name, self.n_sentences + 1)
+        self._to_npy(self.document_offsets_fd.name, self.n_documents + 1)
+
+
+class IndexedDataset:
+    def __init__(self, path: str):
+        """
+        Memory-mapped reader of the output of IndexedOutputFormatter, with O(1) random access to any document.
+        :param path: Path to the .bin file (or its root, without extension).
+        """
+        root = path[:-len('.bin')] if path.endswith('.bin') else path
+        self.sentence_offsets = np.load(root + '.sentence_offsets.npy', mmap_mode='r')
+        self.document_offsets = np.load(root + '.document_offsets.npy', mmap_mode='r')
+        # numpy can't memory-map empty files
+        self.data = np.memmap(root + '.bin', dtype=np.uint8, mode='r') if self.sentence_offsets[-1] > 0 else \
+            np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.document_offsets) - 1
+
+    def num_sentences(self) -> int:
+        return len(self.sentence_offsets) - 1
+
+    def get_sentence(self, idx: int) -> str:
+        return self.data[self.sentence_offsets[idx]:self.sentence_offsets[idx + 1]].tobytes().decode('utf-8')
+
+    def __getitem__(self, idx: int) -> List[str]:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        first, last = self.document_offsets[idx], self.document_offsets[idx + 1]
+        offsets = self.sentence_offsets[first:last + 1]
+        blob = self.data[offsets[0]:offsets[-1]].tobytes()
+        offsets = offsets - offsets[0]
+        return [blob[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def get_document(self, idx: int) -> Document:
+        sentences = self[idx]
+        return Document(content='\n'.join(sentences), sentences=sentences)
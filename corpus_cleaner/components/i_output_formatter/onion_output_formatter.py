@@ -17,7 +17,9 @@ class OnionOutputFormatter(OutputFormatter):
     def _write_document(self, document: Document):
         if document is not None:
             if self.debug:
-                operations = [", ".join(ops) for ops in document.operations]
+                # Operations are only turned into strings here
+                operations = [", ".join(ops)
+                              for ops in document.operations.sentence_operations(len(document.sentences))]
                 sentences = [f'{sent_orig}{self.separator}{sent_clean}{self.separator}{operation}'
                              for sent_orig, sent_clean, operation in zip(document.sentences_orig,
                                                                          document.sentences,
@@ -30,7 +32,7 @@ class OnionOutputFormatter(OutputFormatter):
                                    for sent in sentences) + \
                          self.end_doc_tag
 
-            self.fd.writelines(paragraphs)
+            self.fd.write(paragraphs)
 
     def _end_writing(self):
         self.fd.close()
@@ -2,10 +2,14 @@ from corpus_cleaner.document import Document
 from typing import Iterable, Union
 from corpus_cleaner.components.cleaner_component import CleanerComponent
 import argparse
+import json
+import os
 from typing import TextIO
-from typing import Optional
+from typing import Dict, List, Optional
+from corpus_cleaner.compression import COMPRESSIONS, BlockWriter, add_compression_extension, check_compression
 
 SEPARATOR = "|"
+SHARD_UNITS = ['bytes', 'documents', 'sentences']
 
 
 class OutputFormatter(CleanerComponent):
@@ -14,15 +18,77 @@ class OutputFormatter(CleanerComponent):
         self.path = output_path if output_path is not None else args.output_path
         self.fd: Union[TextIO, None] = None
         self.separator = SEPARATOR
+        self.output_compression = args.output_compression if args.output_compression is not None else 'none'
+        self.output_compression_threads = args.output_compression_threads \
+            if args.output_compression_threads is not None else 4
+        self.output_shard_size = args.output_shard_size if args.output_shard_size is not None else 0
+        self.output_shard_unit = args.output_shard_unit if args.output_shard_unit is not None else 'bytes'
+        self.shard_idx: Optional[int] = None
+        self.shard_counts: Dict[str, int] = {}
+        self.shards: List[Dict] = []
 
     @staticmethod
     def add_args(parser: argparse.ArgumentParser):
-        pass
+        parser.add_argument('--output-compression', type=str, choices=COMPRESSIONS, default='none',
+                            help='Compress the final output (zstd requires the zstandard package)')
+        parser.add_argument('--output-compression-threads', type=int, default=4,
+                            help='Number of background threads compressing output blocks')
+        parser.add_argument('--output-shard-size', type=int, default=0,
+                            help='Roll the final output over to output-00000.txt, output-00001.txt... every N units '
+                                 '(see --output-shard-unit), respecting document boundaries (0 to deactivate)')
+        parser.add_argument('--output-shard-unit', type=str, choices=SHARD_UNITS, default='bytes',
+                            help='Unit of --output-shard-size (uncompressed bytes, documents or sentences)')
+        parser.add_argument('--tmp-compression', type=str, choices=COMPRESSIONS, default='none',
+                            help='Compress the intermediate shards written before the document filter')
 
     @staticmethod
     def check_args(args: argparse.Namespace):
         # TODO check custom args
-        pass
+        check_compression(args.output_compression)
+        check_compression(args.tmp_compression)
+        assert args.output_compression_threads >= 1
+        assert args.output_shard_size >= 0
+        if args.output_shard_size > 0 and args.no_reduce:
+            raise RuntimeError('--output-shard-size cannot be used with --no-reduce')
+        if args.output_format == 'indexed' and (args.no_reduce or args.output_compression != 'none'):
+            raise RuntimeError('--output-format indexed cannot be used with --no-reduce or --output-compression')
+
+    def _open_output(self, path: str) -> BlockWriter:
+        return BlockWriter(add_compression_extension(path, self.output_compression),
+                           compression=self.output_compression, threads=self.output_compression_threads)
+
+    def _output_path(self) -> str:
+        if self.shard_idx is None:
+            return self.path
+        root, extension = os.path.splitext(self.path)
+        return f'{root}-{self.shard_idx:05d}{extension}'
+
+    def _start_shard(self):
+        self.shard_counts = dict(bytes=0, documents=0, sentences=0)
+        self._init_writing()
+
+    def _close_shard(self):
+        self.shard_counts['bytes'] = self.fd.tell()
+        self._end_writing()
+        self.shards.append(dict(path=os.path.basename(add_compression_extension(self._output_path(),
+                                                                                self.output_compression)),
+                                **self.shard_counts))
+        self.fd = None
+        self.shard_idx += 1
+
+    def _update_shard(self, document: Document):
+        if len(document.sentences) == 0:
+            return
+        self.shard_counts['documents'] += 1
+        self.shard_counts['sentences'] += len(document.sentences)
+        self.shard_counts['bytes'] = self.fd.tell()
+        if self.shard_counts[self.output_shard_unit] >= self.output_shard_size:
+            self._close_shard()
+
+    def _write_shard_manifest(self):
+        root, _ = os.path.splitext(self.path)
+        with open(f'{root}.shards.json', 'w') as f:
+            json.dump(dict(unit=self.output_shard_unit, size=self.output_shard_size, shards=self.shards), f, indent=2)
 
     def _init_writing(self):
         raise NotImplementedError()
@@ -34,6 +100,9 @@ class OutputFormatter(CleanerComponent):
         raise NotImplementedError()
 
     def _output_format(self, documents: Iterable[Document]):
+        if self.output_shard_size > 0:
+            self._output_format_sharded(documents)
+            return
         if self.fd is None:
             self._init_writing()
         for document in documents:
@@ -42,6 +111,21 @@ class OutputFormatter(CleanerComponent):
             self._write_document(document)
         self._end_writing()
 
+    def _output_format_sharded(self, documents: Iterable[Document]):
+        # Shards are only closed after a whole document, and the next one is opened lazily (no empty trailing shard)
+        self.shard_idx = 0
+        self._start_shard()
+        for document in documents:
+            if document is None:
+                continue
+            if self.fd is None:
+                self._start_shard()
+            self._write_document(document)
+            self._update_shard(document)
+        if self.fd is not None:
+            self._close_shard()
+        self._write_shard_manifest()
+
     def apply(self, documents: Iterable[Document]) -> Union[Iterable[Document], None]:
         return self._output_format(documents)
 
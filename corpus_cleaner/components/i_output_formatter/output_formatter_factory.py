@@ -2,13 +2,15 @@ from .output_formatter import OutputFormatter
 from .fairseq_lm_output_formatter import FairseqLMOutputFormatter
 from .onion_output_formatter import OnionOutputFormatter
 from .sentence_output_formatter import SentenceOutputFormatter
+from .indexed_output_formatter import IndexedOutputFormatter
+from .compact_output_formatter import CompactOutputFormatter
 from .output_formatter_mapper import OutputFormatterMapper
 from typing import Optional
 import argparse
 
 
 class OutputFormatterFactory:
-    VALID_OUTPUT_FORMATS = ['fairseq-lm', 'sentence']
+    VALID_OUTPUT_FORMATS = ['fairseq-lm', 'sentence', 'indexed']
 
     @staticmethod
     def get_output_formatter(args: argparse.Namespace, output_format: Optional[str] = None,
@@ -18,11 +20,15 @@ class OutputFormatterFactory:
                 return FairseqLMOutputFormatter(args, **kwargs)
             elif args.output_format == 'sentence':
                 return SentenceOutputFormatter(args, **kwargs)
+            elif args.output_format == 'indexed':
+                return IndexedOutputFormatter(args, **kwargs)
             else:
                 raise NotImplementedError()
         else:
             if output_format == 'onion':
                 return OnionOutputFormatter(args, output_path)
+            elif output_format == 'compact':
+                return CompactOutputFormatter(args, output_path)
             elif args.output_format == 'fairseq-lm':
                 return FairseqLMOutputFormatter(args, output_path)
             else:
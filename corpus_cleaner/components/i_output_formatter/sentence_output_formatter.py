@@ -1,17 +1,22 @@
 from .output_formatter import OutputFormatter
 from corpus_cleaner.document import Document
 import os
+from typing import Optional
 
 
 class SentenceOutputFormatter(OutputFormatter):
+    def __init__(self, args, output_path: Optional[str] = None):
+        if output_path is None:
+            output_path = os.path.join(args.output_path, 'output.txt')
+        super().__init__(args, output_path)
 
     def _init_writing(self):
-        self.fd = open(os.path.join(self.path, 'output.txt'), 'a')
+        self.fd = self._open_output(self._output_path())
 
     def _write_document(self, document: Document):
         if len(document.sentences) > 0:
             # sentences = [sentence.replace(f'{self.separator}', '\t') for sentence in document.sentences]
-            self.fd.writelines(f'{sentence}\n' for sentence in document.sentences)
+            self.fd.write(''.join(f'{sentence}\n' for sentence in document.sentences))
 
     def _end_writing(self):
         self.fd.close()
@@ -0,0 +1,162 @@
+import gzip
+import io
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Deque, Iterable, TextIO
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSIONS = ['none', 'gzip', 'zstd']
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def check_compression(compression: str):
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'Unknown compression {compression}')
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError('zstd compression requires the zstandard package')
+
+
+def compression_from_path(path: str) -> str:
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return 'none'
+
+
+def spill_compression() -> str:
+    """
+    :return: Compression of temporary files that are written and read once (zstd if available, since it is the fastest).
+    """
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def strip_compression_extension(path: str) -> str:
+    compression = compression_from_path(path)
+    return path if compression == 'none' else path[:-len(COMPRESSION_EXTENSIONS[compression])]
+
+
+def add_compression_extension(path: str, compression: str) -> str:
+    if compression == 'none' or path.endswith(COMPRESSION_EXTENSIONS[compression]):
+        return path
+    return path + COMPRESSION_EXTENSIONS[compression]
+
+
+def open_binary(path: str) -> BinaryIO:
+    """
+    Opens a (possibly compressed) file for reading in binary mode, choosing the decompressor from the file extension.
+    Files made of several concatenated gzip members or zstd frames (as written by BlockWriter) are read as a whole.
+    :param path: Path of the file.
+    :return: Binary file object with the decompressed content.
+    """
+    compression = compression_from_path(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        check_compression(compression)
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'),
+                                                                           read_across_frames=True))
+    return open(path, 'rb')
+
+
+def open_text(path: str, encoding: str = 'utf-8', errors: str = 'strict') -> TextIO:
+    if compression_from_path(path) == 'none':
+        return open(path, 'r', encoding=encoding, errors=errors)
+    return io.TextIOWrapper(open_binary(path), encoding=encoding, errors=errors)
+
+
+class BlockWriter:
+    def __init__(self, path: str, compression: str = 'none', threads: int = 4, mode: str = 'a',
+                 block_size: int = BLOCK_SIZE):
+        """
+        Text writer that encodes the written strings in blocks and, optionally, compresses every block in a background
+        thread pool while the caller keeps writing. Each block becomes an independent gzip member or zstd frame, so the
+        resulting file is a standard .gz/.zst file, and blocks are written with a single unbuffered write (several
+        processes can safely append to the same file). zlib and zstd release the GIL, so compression actually runs in
+        parallel with the main thread.
+        :param path: Output path (the compression extension is not added).
+        :param compression: 'none', 'gzip' or 'zstd'.
+        :param threads: Number of compression threads.
+        :param mode: 'a' to append, 'w' to truncate.
+        :param block_size: Number of bytes buffered before a block is submitted.
+        """
+        check_compression(compression)
+        assert mode in ['a', 'w']
+        self.path = path
+        self.compression = compression
+        self.block_size = block_size
+        self.fd = open(path, mode + 'b', buffering=0)
+        self.buffer = []
+        self.buffered = 0
+        self.bytes_written = 0
+        self.pending: Deque = deque()
+        self.max_pending = 2 * max(1, threads)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, threads)) if compression != 'none' else None
+        self.local = threading.local()
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == 'gzip':
+            return gzip.compress(data, compresslevel=GZIP_LEVEL)
+        compressor = getattr(self.local, 'compressor', None)
+        if compressor is None:
+            compressor = self.local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return compressor.compress(data)
+
+    def _write_ready(self, wait: bool):
+        while self.pending and (wait or self.pending[0].done() or len(self.pending) >= self.max_pending):
+            self.fd.write(self.pending.popleft().result())
+
+    def _flush_block(self):
+        if self.buffered == 0:
+            return
+        data = b''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        self.bytes_written += len(data)
+        if self.pool is None:
+            self.fd.write(data)
+        else:
+            self.pending.append(self.pool.submit(self._compress, data))
+            self._write_ready(wait=False)
+
+    def write(self, s: str):
+        data = s.encode('utf-8')
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.block_size:
+            self._flush_block()
+
+    def writelines(self, lines: Iterable[str]):
+        for line in lines:
+            self.write(line)
+
+    def tell(self) -> int:
+        """
+        :return: Number of uncompressed (UTF-8) bytes written so far, including the ones still buffered.
+        """
+        return self.bytes_written + self.buffered
+
+    def flush(self):
+        self._flush_block()
+        self._write_ready(wait=True)
+
+    def close(self):
+        if self.fd.closed:
+            return
+        self.flush()
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,100 @@
+import os
+import numpy as np
+from typing import List
+from corpus_cleaner.compression import strip_compression_extension
+from corpus_cleaner.hashing import unit_ngram_hashes
+
+# Length of the n-grams of the document filter (as in onion's -n 5)
+DEDUP_NGRAM = 5
+KEY_DTYPE = np.dtype([('hash', '<u8'), ('document', '<u8'), ('unit', '<u4'), ('position', '<u4')])
+SEEN_DTYPE = np.dtype([('document', '<u8'), ('unit', '<u4'), ('position', '<u4')])
+
+
+def keys_path(shard_path: str, partition: int) -> str:
+    return f'{strip_compression_extension(shard_path)}.keys-{partition:05d}'
+
+
+def seen_path(shard_path: str, partition: int) -> str:
+    return f'{strip_compression_extension(shard_path)}.seen-{partition:05d}'
+
+
+class NGramKeyWriter:
+    def __init__(self, shard_path: str, num_partitions: int, granularity: str, n: int = DEDUP_NGRAM):
+        """
+        Map-side half of the hash-partitioned deduplication: appends the n-gram hashes of every deduplication unit of a
+        shard, with their position (document index in the shard, unit index in the document and n-gram index in the
+        unit), to the partition file chosen by the hash. Since all the occurrences of an n-gram end up in the same
+        partition, each partition can be resolved independently (see count_partition).
+        :param shard_path: Path of the tmp shard.
+        :param num_partitions: Number of partitions.
+        :param granularity: 'document' or 'paragraph'.
+        :param n: n-gram length.
+        """
+        self.shard_path = shard_path
+        self.num_partitions = num_partitions
+        self.granularity = granularity
+        self.n = n
+        self.fds = []
+        self.documents = 0
+
+    def open(self):
+        self.fds = [open(keys_path(self.shard_path, partition), 'ab') for partition in range(self.num_partitions)]
+
+    def write(self, sentences: List[str]):
+        units = unit_ngram_hashes(sentences, self.n, self.granularity)
+        keys = np.zeros(sum(len(unit) for unit in units), dtype=KEY_DTYPE)
+        keys['hash'] = np.concatenate(units) if len(units) > 0 else []
+        keys['document'] = self.documents
+        keys['unit'] = np.repeat(np.arange(len(units)), [len(unit) for unit in units])
+        keys['position'] = np.concatenate([np.arange(len(unit)) for unit in units]) if len(units) > 0 else []
+        partitions = keys['hash'] % np.uint64(self.num_partitions)
+        for partition in np.unique(partitions):
+            keys[partitions == partition].tofile(self.fds[partition])
+        self.documents += 1
+
+    def close(self):
+        for fd in self.fds:
+            fd.close()
+        self.fds = []
+
+
+def count_partition(shard_paths: List[str], partition: int):
+    """
+    Reduce-side half of the hash-partitioned deduplication. Finds, within a partition, the n-gram occurrences that were
+    already seen in a previous unit (in corpus order: shards in the given order, then documents, then units), and writes
+    them to one file per shard. This is exactly the information that a global deduplication would obtain from its set of
+    seen n-grams.
+    :param shard_paths: Paths of all the tmp shards, in corpus order.
+    :param partition: Partition index.
+    """
+    keys = [np.fromfile(keys_path(path, partition), dtype=KEY_DTYPE) for path in shard_paths]
+    shards = np.repeat(np.arange(len(keys)), [len(shard_keys) for shard_keys in keys])
+    keys = np.concatenate(keys) if len(keys) > 0 else np.zeros(0, dtype=KEY_DTYPE)
+    order = np.lexsort((keys['unit'], keys['document'], shards, keys['hash']))
+    keys = keys[order]
+    shards = shards[order]
+    new_group = np.ones(len(keys), dtype=bool)
+    new_group[1:] = keys['hash'][1:] != keys['hash'][:-1]
+    first = np.flatnonzero(new_group)[np.cumsum(new_group) - 1]
+    # Occurrences in the first unit of every group (the earliest one) are new, all the others were seen before
+    seen = (shards[first] != shards) | (keys['document'][first] != keys['document']) | \
+           (keys['unit'][first] != keys['unit'])
+    for shard, path in enumerate(shard_paths):
+        shard_seen = keys[seen & (shards == shard)]
+        res = np.zeros(len(shard_seen), dtype=SEEN_DTYPE)
+        for field in SEEN_DTYPE.names:
+            res[field] = shard_seen[field]
+        res.tofile(seen_path(path, partition))
+    for path in shard_paths:
+        os.remove(keys_path(path, partition))
+
+
+def load_seen(shard_path: str, num_partitions: int) -> np.ndarray:
+    """
+    :return: The seen n-gram occurrences of a shard, sorted by document, unit and position.
+    """
+    seen = np.concatenate([np.fromfile(seen_path(shard_path, partition), dtype=SEEN_DTYPE)
+                           for partition in range(num_partitions)])
+    for partition in range(num_partitions):
+        os.remove(seen_path(shard_path, partition))
+    return seen[np.lexsort((seen['position'], seen['unit'], seen['document']))]
@@ -1,8 +1,17 @@
-from typing import List
+from typing import List, Tuple
 from typing import Optional
+import re
+import sys
+from corpus_cleaner.operations import OperationLog
+
+ATTR_RE = re.compile(r'(\w+)="(.*?)"(?=\s+\w+="|\s*$)', re.DOTALL)
 
 
 class Document:
+    # No per-instance __dict__: documents are created by the million, and batched and pickled between processes
+    __slots__ = ('content', 'content_orig', 'sentences', 'sentences_orig', 'title', 'url', 'id', 'keywords', 'heads',
+                 'filename', 'language', 'language_confidence', 'chunk', 'operations')
+
     def __init__(self,
                  content: str,
                  filename: Optional[str] = None,
@@ -14,9 +23,20 @@ class Document:
                  keywords: Optional[str] = None,
                  heads: Optional[str] = None,
                  language: Optional[str] = None,
-                 operations: List = []):
+                 language_confidence: Optional[float] = None,
+                 chunk: Optional[Tuple[int, int, int]] = None,
+                 operations: Optional[OperationLog] = None,
+                 keep_original: bool = False):
+        """
+        :param language_confidence: Confidence of the document-level language identification of `language` (eg. set by
+        PreFilterer with --lang-filter-document), if any.
+        :param chunk: (document index in the file, chunk index, number of chunks) tuple, if the document is a chunk of a
+        larger one (see --max-document-chars).
+        :param keep_original: Whether to keep a reference to the original content (content_orig) and to track the
+        operations applied to the document, as needed by the debug mode (see keep_original).
+        """
         self.content = content
-        self.content_orig = content
+        self.content_orig = None
         self.sentences = sentences
         self.sentences_orig = sentences_orig
         self.title = title
@@ -24,9 +44,29 @@ class Document:
         self.id = id_
         self.keywords = keywords
         self.heads = heads
-        self.filename = filename
-        self.language = language
+        # Low-cardinality fields are interned, so that all the documents share the same string objects
+        self.filename = sys.intern(filename) if filename is not None else None
+        self.language = sys.intern(language) if language is not None else None
+        self.language_confidence = language_confidence
+        self.chunk = chunk
         self.operations = operations
+        if keep_original:
+            self.keep_original()
+
+    def keep_original(self):
+        """
+        Keeps the current content as the original one, and starts tracking operations (debug mode).
+        """
+        self.content_orig = self.content
+        if self.operations is None:
+            self.operations = OperationLog()
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
 
     def attr_str(self) -> str:
         res = []
@@ -44,6 +84,11 @@ class Document:
             res.append(('filename', self.filename.replace('\n', ' ')))
         if self.language is not None:
             res.append(('language', self.language.replace('\n', ' ')))
+        # Set by the mappers, and kept through the tmp shards and onion's output
+        if self.language_confidence is not None:
+            res.append(('language_confidence', repr(self.language_confidence)))
+        if self.chunk is not None:
+            res.append(('chunk', ','.join(map(str, self.chunk))))
         s = ''
         for e in res:
             s += f'{e[0]}="{e[1]}" '
@@ -51,29 +96,22 @@ class Document:
 
     @classmethod
     def parse_str(cls, s):
-
-        attr_dict = {}
-        key = ''
-        value = ''
-        is_key = True
-        for c in s:
-            if not is_key and c == '=':
-                is_key = False
-            elif is_key:
-                key += c
-            elif c.isspace():
-                attr_dict[key] = value[1:-1]
-                key = ''
-                value = ''
-                is_key = True
-            else:
-                value += c
-        if len(key) > 0 and len(value) > 0:
-            attr_dict[key] = value[1:-1]
+        """
+        Inverse of attr_str.
+        :param s: Attributes string (key="value" pairs separated by spaces), or a list of its whitespace-separated parts.
+        :return: Document with the parsed attributes.
+        """
+        if not isinstance(s, str):
+            s = ' '.join(s)
+        # Values are not escaped, so a value ends at the quote followed by the next key (or the end of the string)
+        attr_dict = dict(ATTR_RE.findall(s))
 
         def get_att(att_name):
             return attr_dict[att_name] if att_name in attr_dict else None
 
+        language_confidence = get_att('language_confidence')
+        chunk = get_att('chunk')
+
         return Document(content='',
                         sentences=[],
                         filename=get_att('filename'),
@@ -82,5 +120,7 @@ class Document:
                         id_=get_att('id'),
                         keywords=get_att('keywords'),
                         heads=get_att('heads'),
-                        language=get_att('language')
+                        language=get_att('language'),
+                        language_confidence=float(language_confidence) if language_confidence is not None else None,
+                        chunk=tuple(map(int, chunk.split(','))) if chunk is not None else None
                         )
@@ -0,0 +1,80 @@
+import time
+from typing import Any, Callable, List, Optional, Tuple
+from corpus_cleaner.par_utils.par_utils import PipelineLogger
+
+Filter = Callable[[Any], Tuple[bool, Any]]
+
+
+class AdaptiveFilterOrder:
+    def __init__(self, filters: List[Filter], sample_size: int, name: str, logger: Optional[PipelineLogger] = None):
+        """
+        Short-circuiting list of filters (an item is rejected by the first filter returning False) that reorders itself
+        to minimize the expected cost. The first sample_size items are evaluated by all the filters, measuring the time
+        and the rejection rate of every filter on its own. Then, the filters are sorted by cost per rejection, so that
+        cheap filters that reject often go first, and filters that never rejected go last (by cost). Since the filters
+        are ANDed, the order changes which filter rejects an item, but not which items are kept.
+        :param filters: Filters, returning a (keep, value) tuple. They must not depend on the filters run before.
+        :param sample_size: Number of items evaluated by all the filters before reordering them (0 to keep the order).
+        :param name: Name used when logging the chosen order.
+        :param logger: Logger (optional).
+        """
+        self.filters = list(filters)
+        self.sample_size = sample_size if len(self.filters) > 1 else 0
+        self.name = name
+        self.logger = logger
+        self._times = [0.0] * len(self.filters)
+        self._rejected = [0] * len(self.filters)
+        self._sampled = 0
+
+    def __len__(self) -> int:
+        return len(self.filters)
+
+    @property
+    def sampling(self) -> bool:
+        """
+        :return: Whether items are still being evaluated by all the filters (so filters may see items that the final
+        order would reject before reaching them).
+        """
+        return self._sampled < self.sample_size
+
+    def __call__(self, item: Any) -> Tuple[bool, Optional[Filter], Any]:
+        """
+        :param item: Item to filter (eg. a document).
+        :return: (keep, filter, value) tuple, where filter is the first filter rejecting the item (or None) and value is
+        the value it returned.
+        """
+        if self.sampling:
+            return self._sample(item)
+        for filter_ in self.filters:
+            keep, value = filter_(item)
+            if not keep:
+                return False, filter_, value
+        return True, None, None
+
+    def _sample(self, item: Any) -> Tuple[bool, Optional[Filter], Any]:
+        res = True, None, None
+        for idx, filter_ in enumerate(self.filters):
+            start = time.perf_counter()
+            keep, value = filter_(item)
+            self._times[idx] += time.perf_counter() - start
+            if not keep:
+                self._rejected[idx] += 1
+                if res[0]:
+                    res = False, filter_, value
+        self._sampled += 1
+        if self._sampled == self.sample_size:
+            self._reorder()
+        return res
+
+    def _reorder(self):
+        def expected_cost(idx: int) -> Tuple[bool, float]:
+            if self._rejected[idx] == 0:
+                return True, self._times[idx]
+            return False, self._times[idx] / self._rejected[idx]
+
+        order = sorted(range(len(self.filters)), key=expected_cost)
+        if self.logger is not None:
+            stats = ', '.join(f'{self.filters[idx].__name__} ({1e6 * self._times[idx] / self._sampled:.1f} us, '
+                              f'{self._rejected[idx] / self._sampled:.1%} rejected)' for idx in order)
+            self.logger.logger.info(f'{self.name} filter order after {self._sampled} samples: {stats}')
+        self.filters = [self.filters[idx] for idx in order]
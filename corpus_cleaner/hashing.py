@@ -0,0 +1,89 @@
+from functools import lru_cache
+from hashlib import blake2b
+import numpy as np
+from typing import List
+
+TOKEN_CACHE_SIZE = 2 ** 20
+# Odd constant of the polynomial that combines the token hashes of an n-gram (arithmetic wraps around modulo 2^64)
+NGRAM_BASE = np.uint64(0x100000001B3)
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def _token_hash(token: str) -> int:
+    return int.from_bytes(blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _token_hashes(tokens: List[str]) -> np.ndarray:
+    return np.fromiter(map(_token_hash, tokens), dtype=np.uint64, count=len(tokens))
+
+
+def ngram_hashes(tokens: List[str], n: int) -> np.ndarray:
+    """
+    Hashes the n-grams (shingles) of a sequence of tokens.
+    :param tokens: List of tokens.
+    :param n: n-gram length.
+    :return: uint64 array with the hash of every n-gram (len(tokens) - n + 1 elements, or none if there are less than n
+    tokens). 0 is never returned (it marks the empty slots of NGramHashSet).
+    """
+    if len(tokens) < n:
+        return np.zeros(0, dtype=np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(_token_hashes(tokens), n)
+    powers = NGRAM_BASE ** np.arange(n - 1, -1, -1, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        hashes = (windows * powers).sum(axis=1, dtype=np.uint64)
+        # Final mix (splitmix64) so that the low bits, used as the table index, are well distributed
+        hashes ^= hashes >> np.uint64(30)
+        hashes *= np.uint64(0xBF58476D1CE4E5B9)
+        hashes ^= hashes >> np.uint64(27)
+        hashes *= np.uint64(0x94D049BB133111EB)
+        hashes ^= hashes >> np.uint64(31)
+    hashes[hashes == 0] = 1
+    return hashes
+
+
+def unit_ngram_hashes(sentences: List[str], n: int, granularity: str) -> List[np.ndarray]:
+    """
+    :param sentences: Sentences of a document.
+    :param n: n-gram length.
+    :param granularity: Deduplication unit: 'document' (the n-grams of the whole document, across sentences) or
+    'paragraph' (the n-grams of every sentence).
+    :return: List with the n-gram hashes of every unit.
+    """
+    if granularity == 'document':
+        return [ngram_hashes(' '.join(sentences).split(), n)]
+    return [ngram_hashes(sentence.split(), n) for sentence in sentences]
+
+
+def minhash_permutations(num_permutations: int, seed: int = 1):
+    """
+    :param num_permutations: Number of hash functions.
+    :param seed: Random seed (the same hash functions must be used for all the documents).
+    :return: (a, b) uint64 arrays with the parameters of the hash functions h_i(x) = (a_i * x + b_i) mod 2^64.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2 ** 63, size=num_permutations, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=num_permutations, dtype=np.uint64)
+    return a, b
+
+
+def minhash_signature(tokens: List[str], n: int, permutations, chunk_size: int = 8192) -> np.ndarray:
+    """
+    Computes the MinHash signature of the set of n-grams of a sequence of tokens (if there are less than n tokens, the
+    whole sequence is the only shingle).
+    :param tokens: List of tokens.
+    :param n: n-gram length.
+    :param permutations: Hash functions, as returned by minhash_permutations.
+    :param chunk_size: Number of shingles hashed at once (bounds the memory of long documents).
+    :return: uint32 array with the minimum of every hash function (the top 32 bits are kept). Documents without tokens
+    get the maximum value everywhere.
+    """
+    a, b = permutations
+    signature = np.full(len(a), np.iinfo(np.uint32).max, dtype=np.uint32)
+    if len(tokens) == 0:
+        return signature
+    shingles = np.unique(ngram_hashes(tokens, min(n, len(tokens))))
+    with np.errstate(over='ignore'):
+        for start in range(0, len(shingles), chunk_size):
+            values = (shingles[start:start + chunk_size, None] * a[None, :] + b[None, :]) >> np.uint64(32)
+            signature = np.minimum(signature, values.min(axis=0).astype(np.uint32))
+    return signature
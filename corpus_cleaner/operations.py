@@ -0,0 +1,94 @@
+from array import array
+import math
+from typing import Any, Dict, List, Optional
+
+# Operation names (eg. 'SentenceFilter-_filter_by_lang') are registered on first use. Codes are only meaningful within
+# a process, so OperationLog pickles the names of the codes it uses
+_NAMES: List[str] = []
+_CODES: Dict[str, int] = {}
+WHOLE_DOCUMENT = -1
+NO_VALUE = object()
+
+
+def operation_code(name: str) -> int:
+    """
+    :param name: Operation name, as written in the debug output.
+    :return: Small integer code of the operation.
+    """
+    code = _CODES.get(name)
+    if code is None:
+        code = len(_NAMES)
+        _NAMES.append(name)
+        _CODES[name] = code
+    return code
+
+
+def operation_name(code: int) -> str:
+    return _NAMES[code]
+
+
+class OperationLog:
+    __slots__ = ('codes', 'sentences', 'values', 'others')
+
+    def __init__(self):
+        """
+        Operations applied to a document in debug mode, stored as parallel arrays: the operation code, the index of the
+        sentence (or WHOLE_DOCUMENT, for operations applied before sentence splitting) and an optional float value.
+        Values of other types (eg. the language and confidence of the language filter) are kept aside, by position.
+        Operations are only turned into strings when the debug file is written (see sentence_operations).
+        """
+        self.codes = array('H')
+        self.sentences = array('i')
+        self.values = array('d')
+        self.others: Optional[Dict[int, Any]] = None
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def add(self, code: int, sentence: int = WHOLE_DOCUMENT, value: Any = NO_VALUE):
+        """
+        :param code: Operation code (see operation_code).
+        :param sentence: Index of the sentence, or WHOLE_DOCUMENT.
+        :param value: Optional value, written after the operation name.
+        """
+        if isinstance(value, float):
+            self.values.append(value)
+        else:
+            self.values.append(math.nan)
+            if value is not NO_VALUE:
+                if self.others is None:
+                    self.others = {}
+                self.others[len(self.codes)] = value
+        self.codes.append(code)
+        self.sentences.append(sentence)
+
+    def _describe(self, idx: int) -> str:
+        name = _NAMES[self.codes[idx]]
+        if self.others is not None and idx in self.others:
+            return f'{name}:{self.others[idx]}'
+        value = self.values[idx]
+        return name if math.isnan(value) else f'{name}:{value}'
+
+    def sentence_operations(self, num_sentences: int) -> List[List[str]]:
+        """
+        :param num_sentences: Number of sentences of the document.
+        :return: The names (and values) of the operations applied to every sentence. Whole-document operations apply to
+        all the sentences, and go first.
+        """
+        document_operations = [self._describe(idx) for idx in range(len(self.codes))
+                               if self.sentences[idx] == WHOLE_DOCUMENT]
+        res = [list(document_operations) for _ in range(num_sentences)]
+        for idx in range(len(self.codes)):
+            sentence = self.sentences[idx]
+            if sentence != WHOLE_DOCUMENT and sentence < num_sentences:
+                res[sentence].append(self._describe(idx))
+        return res
+
+    def __getstate__(self):
+        names = {code: _NAMES[code] for code in set(self.codes)}
+        return self.codes, self.sentences, self.values, self.others, names
+
+    def __setstate__(self, state):
+        codes, self.sentences, self.values, self.others, names = state
+        local_codes = {code: operation_code(name) for code, name in names.items()}
+        self.codes = array('H', [local_codes[code] for code in codes])
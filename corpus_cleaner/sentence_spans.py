@@ -0,0 +1,179 @@
+from collections.abc import Sequence
+from functools import lru_cache
+import re
+import sys
+import numpy as np
+from typing import Iterable, Iterator, List, Optional
+
+SEPARATOR = '\n'
+OFFSETS_DTYPE = np.int64
+SPACE_PATTERN = re.compile(' ')
+# Same characters as str.isspace (and, therefore, as str.split)
+WHITESPACE_PATTERN = re.compile(r'\s')
+WHITESPACE_RUN_PATTERN = re.compile(r'\s*')
+TOKEN_PATTERN = re.compile(r'\S+')
+
+
+@lru_cache(maxsize=None)
+def _digit_pattern() -> re.Pattern:
+    # Same characters as str.isdigit: decimals (\d) plus digits such as superscripts, which re does not include
+    digits = ''.join(chr(c) for c in range(sys.maxunicode + 1) if chr(c).isdigit() and not chr(c).isdecimal())
+    return re.compile(r'[\d' + re.escape(digits) + ']')
+
+
+def _positions(pattern: re.Pattern, text: str) -> np.ndarray:
+    return np.fromiter((match.start() for match in pattern.finditer(text)), dtype=OFFSETS_DTYPE)
+
+
+class SentenceSpans(Sequence):
+    def __init__(self, text: str, starts: np.ndarray, ends: np.ndarray):
+        """
+        Sentences of a document as (start, end) offsets into a single string (usually the content of the document, see
+        from_text), instead of one string per sentence. Selecting sentences (eg. after filtering) shares the string, and
+        per-sentence statistics (characters, words, digits...) are computed for all the sentences at once, with one
+        regular expression pass over the string, so that filters don't need to split every sentence. Sentence strings
+        are only created when they are accessed (eg. when writing the output). It behaves as a read-only list of
+        strings.
+        :param text: Backing string. Sentences must be separated by at least one whitespace character, and the text
+        between them is ignored.
+        :param starts: Start offset of every sentence.
+        :param ends: End offset of every sentence.
+        """
+        self.text = text
+        self.starts = starts
+        self.ends = ends
+        self._lengths: Optional[np.ndarray] = None
+        self._words: Optional[np.ndarray] = None
+        self._space_tokens: Optional[np.ndarray] = None
+        self._non_space: Optional[np.ndarray] = None
+        self._digits: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_text(cls, text: str, sentences: Iterable[str]) -> 'SentenceSpans':
+        """
+        :param text: Text the sentences were split from (eg. the content of the document).
+        :param sentences: Sentences, in order, as returned by the sentence splitter.
+        :return: The sentences as offsets into the text, if every sentence is found right after the previous one,
+        skipping whitespace only. Otherwise (eg. the splitter collapsed a run of spaces inside a sentence), the sentences
+        as offsets into their own backing string (see from_sentences).
+        """
+        sentences = list(sentences)
+        starts = np.zeros(len(sentences), dtype=OFFSETS_DTYPE)
+        ends = np.zeros(len(sentences), dtype=OFFSETS_DTYPE)
+        # The previous non-empty sentence must be followed by whitespace
+        end = -1
+        pos = 0
+        for idx, sentence in enumerate(sentences):
+            pos = WHITESPACE_RUN_PATTERN.match(text, pos).end()
+            if not text.startswith(sentence, pos) or (pos == end and len(sentence) > 0):
+                return cls.from_sentences(sentences)
+            starts[idx] = pos
+            pos += len(sentence)
+            ends[idx] = pos
+            if len(sentence) > 0:
+                end = pos
+        return cls(text, starts, ends)
+
+    @classmethod
+    def from_sentences(cls, sentences: Iterable[str]) -> 'SentenceSpans':
+        if isinstance(sentences, SentenceSpans):
+            return sentences
+        sentences = list(sentences)
+        lengths = np.fromiter((len(sentence) for sentence in sentences), dtype=OFFSETS_DTYPE, count=len(sentences))
+        starts = np.zeros(len(sentences), dtype=OFFSETS_DTYPE)
+        np.cumsum(lengths[:-1] + len(SEPARATOR), out=starts[1:])
+        return cls(SEPARATOR.join(sentences), starts, starts + lengths)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.select(np.arange(len(self))[idx])
+        return self.text[self.starts[idx]:self.ends[idx]]
+
+    def __iter__(self) -> Iterator[str]:
+        text = self.text
+        for start, end in zip(self.starts.tolist(), self.ends.tolist()):
+            yield text[start:end]
+
+    def __repr__(self) -> str:
+        return f'SentenceSpans({list(self)!r})'
+
+    def __getstate__(self):
+        # The statistics are cheap to recompute, and the backing string is only sent once (and shared with the content of
+        # the document, if it is pickled along with it)
+        return self.text, self.starts, self.ends
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def select(self, indices) -> 'SentenceSpans':
+        """
+        :param indices: Indices (or boolean mask) of the selected sentences.
+        :return: The selected sentences, sharing the backing string and the computed statistics.
+        """
+        res = SentenceSpans(self.text, self.starts[indices], self.ends[indices])
+        for attr in ('_lengths', '_words', '_space_tokens', '_non_space', '_digits'):
+            value = getattr(self, attr)
+            if value is not None:
+                setattr(res, attr, value[indices])
+        return res
+
+    def to_list(self) -> List[str]:
+        return list(self)
+
+    def _count(self, positions: np.ndarray) -> np.ndarray:
+        return np.searchsorted(positions, self.ends) - np.searchsorted(positions, self.starts)
+
+    def count_matches(self, pattern: re.Pattern) -> np.ndarray:
+        """
+        :param pattern: Compiled pattern whose matches can't span several sentences (eg. they can't include newlines).
+        :return: Number of (non-overlapping) matches of the pattern in every sentence, as len(pattern.findall(sentence)).
+        """
+        return self._count(_positions(pattern, self.text))
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """
+        :return: Number of characters of every sentence (len(sentence)).
+        """
+        if self._lengths is None:
+            self._lengths = self.ends - self.starts
+        return self._lengths
+
+    @property
+    def words(self) -> np.ndarray:
+        """
+        :return: Number of whitespace-separated words of every sentence (len(sentence.split())).
+        """
+        if self._words is None:
+            self._words = self._count(_positions(TOKEN_PATTERN, self.text))
+        return self._words
+
+    @property
+    def space_tokens(self) -> np.ndarray:
+        """
+        :return: Number of single-space-separated tokens of every sentence (len(sentence.split(' '))).
+        """
+        if self._space_tokens is None:
+            self._space_tokens = self._count(_positions(SPACE_PATTERN, self.text)) + 1
+        return self._space_tokens
+
+    @property
+    def non_space(self) -> np.ndarray:
+        """
+        :return: Number of non-whitespace characters of every sentence (len(''.join(sentence.split()))).
+        """
+        if self._non_space is None:
+            self._non_space = self.lengths - self._count(_positions(WHITESPACE_PATTERN, self.text))
+        return self._non_space
+
+    @property
+    def digits(self) -> np.ndarray:
+        """
+        :return: Number of digits (str.isdigit) of every sentence.
+        """
+        if self._digits is None:
+            self._digits = self._count(_positions(_digit_pattern(), self.text))
+        return self._digits
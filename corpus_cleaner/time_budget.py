@@ -0,0 +1,198 @@
+from contextlib import contextmanager
+import json
+import math
+import os
+import signal
+import threading
+import time
+from typing import Optional, Tuple
+from corpus_cleaner.document import Document
+
+
+class TimeBudgetExceeded(Exception):
+    def __init__(self, stage: str, elapsed: float, budget: str):
+        """
+        :param stage: Name of the component that was running.
+        :param elapsed: Time spent on the document by the component, in seconds.
+        :param budget: Exceeded budget ('document' or 'component').
+        """
+        super().__init__(f'{stage} exceeded the {budget} time budget ({elapsed:.2f}s)')
+        self.stage = stage
+        self.elapsed = elapsed
+        self.budget = budget
+
+
+class _Alarm(BaseException):
+    # Not an Exception, so that it is not swallowed by the `except Exception` of the code being interrupted
+    pass
+
+
+def _raise_alarm(signum, frame):
+    raise _Alarm()
+
+
+class TimeBudget:
+    def __init__(self, document_budget: float = -1, component_budget: float = -1,
+                 quarantine_dir: Optional[str] = None):
+        """
+        Bounds the time spent on every document by the mappers, so that a few pathological documents can't stall a
+        worker (and the whole file it is processing). A single timer (SIGALRM, in the main thread of Unix processes) is
+        armed when a document reaches the first component, and components only take the time when they start and end.
+        The timer fires at the earliest time a budget can be exceeded; if the running component is over budget then,
+        it is interrupted (any Python code, including the re module), and otherwise the timer is armed again for the
+        next deadline. Regular expressions of the regex module can be given the remaining time as timeout (see
+        remaining). Where there is no timer (eg. in other threads, see interruptible), the budgets are only checked
+        after every component.
+        :param document_budget: Maximum time, in seconds, spent by all the components on a document (-1 for no limit).
+        :param component_budget: Maximum time, in seconds, spent by any component on a document (-1 for no limit).
+        :param quarantine_dir: Directory where the dropped documents are written (as JSON lines, one file per
+        process), with the reason. If None, they are only dropped.
+        """
+        self.document_budget = document_budget
+        self.component_budget = component_budget
+        self.quarantine_dir = quarantine_dir
+        self.dropped = 0
+        self.warned = False
+        self._document = None
+        self._document_start = 0.0
+        # Start of the running component (None between components)
+        self._component_start: Optional[float] = None
+        self._previous_handler = None
+        self._timer_armed = False
+        self._quarantine = None
+
+    def __getstate__(self):
+        # The budget is sent to the worker processes, which install their own handler and open their own quarantine
+        # file
+        state = self.__dict__.copy()
+        state['_document'] = None
+        state['_component_start'] = None
+        state['_previous_handler'] = None
+        state['_timer_armed'] = False
+        state['_quarantine'] = None
+        return state
+
+    @property
+    def active(self) -> bool:
+        return self.document_budget > 0 or self.component_budget > 0
+
+    @property
+    def interruptible(self) -> bool:
+        """
+        :return: Whether components can be interrupted here (signals are only handled in the main thread).
+        """
+        return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+    def _deadline(self, now: float) -> float:
+        # Earliest time at which a budget can be exceeded: the end of the budget of the document, or of the running
+        # component (between components, of a component starting now)
+        deadline = math.inf
+        if self.document_budget > 0:
+            deadline = self._document_start + self.document_budget
+        if self.component_budget > 0:
+            start = self._component_start if self._component_start is not None else now
+            deadline = min(deadline, start + self.component_budget)
+        return deadline
+
+    def remaining(self) -> Optional[float]:
+        """
+        :return: Seconds left for the running component (eg. as timeout of the regex module), or None if there is no
+        limit.
+        """
+        if self._component_start is None:
+            return None
+        now = time.monotonic()
+        deadline = self._deadline(now)
+        return max(deadline - now, 0.0) if deadline != math.inf else None
+
+    def _on_alarm(self, signum, frame):
+        now = time.monotonic()
+        deadline = self._deadline(now)
+        if deadline > now:
+            # Nothing exceeded yet (eg. the component whose deadline it was finished in time)
+            signal.setitimer(signal.ITIMER_REAL, deadline - now)
+        elif self._component_start is not None:
+            self._timer_armed = False
+            raise _Alarm()
+        else:
+            # The document budget ran out between components: the next component drops the document
+            self._timer_armed = False
+
+    def _start_document(self, document: Document, now: float):
+        self._document = document
+        self._document_start = now
+        if not self.interruptible:
+            return
+        if self._previous_handler is None:
+            self._previous_handler = signal.signal(signal.SIGALRM, self._on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, self._deadline(now) - now)
+        self._timer_armed = True
+
+    def stop(self):
+        """
+        Disarms the timer and restores the previous SIGALRM handler (eg. at the end of a stream of documents).
+        """
+        self._document = None
+        if self._timer_armed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            self._timer_armed = False
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGALRM, self._previous_handler)
+            self._previous_handler = None
+
+    def _limit(self, start: float) -> Tuple[float, str]:
+        # Time left for the component starting at start, and the budget that sets it
+        limit, budget = math.inf, 'component'
+        if self.component_budget > 0:
+            limit = self.component_budget
+        if self.document_budget > 0 and self._document_start + self.document_budget - start < limit:
+            limit, budget = self._document_start + self.document_budget - start, 'document'
+        return limit, budget
+
+    @contextmanager
+    def component(self, document: Document, name: str):
+        """
+        Runs a component on a document within the budgets. The clock of a document (and its timer) starts with the
+        first component that receives it.
+        :param document: Document.
+        :param name: Name of the component.
+        :raise TimeBudgetExceeded: If the component exceeds any of the budgets.
+        """
+        start = time.monotonic()
+        if document is not self._document:
+            self._start_document(document, start)
+        limit, budget = self._limit(start)
+        if limit <= 0:
+            raise TimeBudgetExceeded(name, 0.0, budget)
+        try:
+            try:
+                self._component_start = start
+                yield
+            finally:
+                # An alarm arriving from here on doesn't interrupt anything, and the elapsed time is checked below
+                self._component_start = None
+        except (_Alarm, TimeoutError):
+            raise TimeBudgetExceeded(name, time.monotonic() - start, budget)
+        elapsed = time.monotonic() - start
+        if elapsed > limit:
+            raise TimeBudgetExceeded(name, elapsed, budget)
+
+    def quarantine(self, document: Document, error: TimeBudgetExceeded):
+        """
+        Registers a document dropped for exceeding the budget, writing it to the quarantine file (if any).
+        :param document: Document (possibly modified by the interrupted component).
+        :param error: Reason.
+        """
+        self.dropped += 1
+        self._document = None
+        if self.quarantine_dir is None:
+            return
+        if self._quarantine is None:
+            os.makedirs(self.quarantine_dir, exist_ok=True)
+            path = os.path.join(self.quarantine_dir, f'{os.uname()[1]}-{os.getpid()}.jsonl')
+            self._quarantine = open(path, 'a', encoding='utf-8')
+        record = dict(filename=document.filename, id=document.id, url=document.url, title=document.title,
+                      stage=error.stage, budget=error.budget, elapsed=round(error.elapsed, 3), reason=str(error),
+                      content=document.content)
+        self._quarantine.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._quarantine.flush()
@@ -1,3 +1,7 @@
+from typing import Iterable, Tuple
+import re
+
+
 class StringTransform:
 
     def transform(self, text: str) -> str:
@@ -5,3 +9,215 @@ class StringTransform:
 
     def __call__(self, text: str) -> str:
         return self.transform(text)
+
+
+class TagRemover(StringTransform):
+    def __init__(self):
+        """
+        Removes XML/HTML tags in a single pass, with the same output as replacing '(\\s*)(<p>)+' by '\\n' and then
+        ' *(<.*?> ?)+ *' by ' ' (the patterns of --remove-tags), but without their backtracking: runs of whitespace and
+        unterminated tags (a '<' without a '>' in the same line) are scanned once, instead of once per position.
+        """
+
+    @staticmethod
+    def _replace_paragraphs(text: str) -> str:
+        res = []
+        pos = 0
+        while True:
+            start = text.find('<p>', pos)
+            if start == -1:
+                break
+            end = start + 3
+            while text.startswith('<p>', end):
+                end += 3
+            # The whitespace before the paragraph tags is replaced too
+            ws_start = start
+            while ws_start > pos and text[ws_start - 1].isspace():
+                ws_start -= 1
+            res.append(text[pos:ws_start])
+            res.append('\n')
+            pos = end
+        res.append(text[pos:])
+        return ''.join(res)
+
+    @staticmethod
+    def _replace_tags(text: str) -> Tuple[str, int]:
+        res = []
+        subs = 0
+        pos = 0
+        # First '>' and '\n' at or after the last searched positions (len(text) if there are none), so that every
+        # character is scanned a bounded number of times
+        next_gt = next_eol = -1
+
+        def tag_end(start: int) -> int:
+            # End of the tag starting at start (a '<'), or -1 if it is not terminated in the same line
+            nonlocal next_gt, next_eol
+            if next_gt < start:
+                next_gt = text.find('>', start)
+                next_gt = len(text) if next_gt == -1 else next_gt
+            if next_eol < start:
+                next_eol = text.find('\n', start)
+                next_eol = len(text) if next_eol == -1 else next_eol
+            return next_gt + 1 if next_gt < next_eol else -1
+
+        search = 0
+        while True:
+            start = text.find('<', search)
+            if start == -1:
+                break
+            end = tag_end(start)
+            if end == -1:
+                search = start + 1
+                continue
+            # Consecutive tags (optionally separated by one space), and the spaces around them
+            while True:
+                after = end + 1 if text.startswith(' ', end) else end
+                if not text.startswith('<', after):
+                    break
+                next_end = tag_end(after)
+                if next_end == -1:
+                    break
+                end = next_end
+            while text.startswith(' ', end):
+                end += 1
+            spaces_start = start
+            while spaces_start > pos and text[spaces_start - 1] == ' ':
+                spaces_start -= 1
+            res.append(text[pos:spaces_start])
+            res.append(' ')
+            subs += 1
+            pos = search = end
+        res.append(text[pos:])
+        return ''.join(res), subs
+
+    def remove(self, text: str) -> Tuple[str, int]:
+        """
+        :param text: Text.
+        :return: The text without tags, and the number of tag runs replaced by a space (as re.subn).
+        """
+        return self._replace_tags(self._replace_paragraphs(text))
+
+    def transform(self, text: str) -> str:
+        return self.remove(text)[0]
+
+
+def _char_run(chars: Iterable[str]) -> re.Pattern:
+    # A single character class without anything after it can't backtrack
+    return re.compile('[' + ''.join(re.escape(char) for char in sorted(set(chars))) + ']*')
+
+
+class EmailReplacer(StringTransform):
+    def __init__(self, lang_chars: str, replacement: str = ' [EMAIL] '):
+        r"""
+        Replaces emails with the same output as re.subn with rf'[{lang_chars}0-9_.+-]+@[a-zA-Z0-9-]+\.[a-z0-9-.]+' (the
+        pattern of --replace-emails), but only examining the text around every '@': the user name is grown backwards
+        and the domain forwards, with precomputed character classes. Texts without '@' are not scanned.
+        :param lang_chars: Letters of the alphabets of the languages, allowed in the user name.
+        :param replacement: Replacement of every email.
+        """
+        self.user_chars = frozenset(lang_chars + '0123456789_.+-')
+        self.domain_run = _char_run('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-')
+        self.tld_run = _char_run('abcdefghijklmnopqrstuvwxyz0123456789-.')
+        self.replacement = replacement
+
+    def replace(self, text: str) -> Tuple[str, int]:
+        """
+        :param text: Text.
+        :return: The text with the emails replaced, and the number of replacements (as re.subn).
+        """
+        res = []
+        subs = 0
+        pos = 0
+        at = text.find('@')
+        while at != -1:
+            start = at
+            while start > pos and text[start - 1] in self.user_chars:
+                start -= 1
+            domain_end = self.domain_run.match(text, at + 1).end()
+            if start < at and domain_end > at + 1 and text.startswith('.', domain_end):
+                end = self.tld_run.match(text, domain_end + 1).end()
+                if end > domain_end + 1:
+                    res.append(text[pos:start])
+                    res.append(self.replacement)
+                    subs += 1
+                    pos = end
+            at = text.find('@', max(pos, at + 1))
+        res.append(text[pos:])
+        return ''.join(res), subs
+
+    def transform(self, text: str) -> str:
+        return self.replace(text)[0]
+
+
+class UrlReplacer(StringTransform):
+    def __init__(self, lang_chars: str, replacement: str = ' [URL] '):
+        r"""
+        Replaces URLs with the same output as the patterns of --replace-urls: re.sub with
+        f'\((@)?((http|https)://)?([{lang_chars}0-9./?\\@\-—_=#])+\.[a-z]{{2,6}}([{lang_chars}0-9&/\\+~*?%:!@—_=#()-])*'
+        and then re.subn with '(\[URL\]\.?\w*\s*)+'. Instead of trying the first pattern at every position, it only
+        examines the text after every '(' (where all its matches start), growing the host forwards with precomputed
+        character classes and looking for the last dot followed by a top-level domain. Texts without '(' and '[URL]'
+        are not scanned.
+        :param lang_chars: Letters of the alphabets of the languages, allowed in the URLs.
+        :param replacement: Replacement of every URL.
+        """
+        self.host_run = _char_run(lang_chars + '0123456789./?\\@-—_=#')
+        self.path_run = _char_run(lang_chars + '0123456789&/\\+~*?%:!@—_=#()-')
+        self.tld_pattern = re.compile('[a-z]{2,6}')
+        self.replacement = replacement
+        self.repeated_replacements_pattern = re.compile('(' + re.escape(replacement.strip()) + r'\.?\w*\s*)+')
+
+    def _host_end(self, text: str, start: int) -> int:
+        # End of the URL if its host starts at start (or -1): the host is the longest run of host characters ending
+        # in a dot followed by a top-level domain, and the rest of the URL is the longest run of path characters
+        end = self.host_run.match(text, start).end()
+        dot = text.rfind('.', start + 1, end)
+        while dot != -1:
+            match = self.tld_pattern.match(text, dot + 1)
+            if match is not None:
+                return self.path_run.match(text, match.end()).end()
+            dot = text.rfind('.', start + 1, dot)
+        return -1
+
+    def _url_end(self, text: str, start: int) -> int:
+        # End of the URL starting at start (a '('), or -1, trying the optional '@' and scheme in the same order as re
+        for at_end in ((start + 2, start + 1) if text.startswith('@', start + 1) else (start + 1,)):
+            if text.startswith('http://', at_end):
+                host_starts = (at_end + 7, at_end)
+            elif text.startswith('https://', at_end):
+                host_starts = (at_end + 8, at_end)
+            else:
+                host_starts = (at_end,)
+            for host_start in host_starts:
+                end = self._host_end(text, host_start)
+                if end != -1:
+                    return end
+        return -1
+
+    def _replace_urls(self, text: str) -> str:
+        res = []
+        pos = 0
+        start = text.find('(')
+        while start != -1:
+            end = self._url_end(text, start)
+            if end != -1:
+                res.append(text[pos:start])
+                res.append(self.replacement)
+                pos = end
+            start = text.find('(', pos if end != -1 else start + 1)
+        res.append(text[pos:])
+        return ''.join(res)
+
+    def replace(self, text: str) -> Tuple[str, int]:
+        """
+        :param text: Text.
+        :return: The text with the URLs replaced, and the number of replacements of the second pattern (consecutive
+        replacements and the words glued to them), as in --replace-urls.
+        """
+        text = self._replace_urls(text)
+        if self.replacement.strip() not in text:
+            return text, 0
+        return self.repeated_replacements_pattern.subn(self.replacement, text)
+
+    def transform(self, text: str) -> str:
+        return self.replace(text)[0]
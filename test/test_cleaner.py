@@ -0,0 +1,37 @@
+import argparse
+import logging
+import types
+import pytest
+from corpus_cleaner.cleaner import Cleaner
+from corpus_cleaner.components.c_pre_filterer.pre_screener import PreScreener
+
+
+def get_cleaner(tmp_path, options):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input-path', type=str)
+    parser.add_argument('--output-path', type=str)
+    parser.add_argument('--input-format', type=str, default='sentence')
+    parser.add_argument('--output-format', type=str, default='sentence')
+    Cleaner.add_args(parser)
+    for component in Cleaner.get_components_classes():
+        component.add_args(parser)
+    args = parser.parse_args(['--output-path', str(tmp_path)] + options)
+    Cleaner.check_args(args)
+    for component in Cleaner.get_components_classes():
+        component.check_args(args)
+    return Cleaner(args, logging.getLogger(__name__), types.SimpleNamespace(resume=False))
+
+
+@pytest.mark.parametrize('options,pre_screening', [
+    ([], True),
+    (['--components', 'EncodingFixer', 'PreFilterer', 'DocumentFilter'], True),
+    (['--components', 'PreFilterer', 'SentenceSplitterComponent', 'DocumentFilter'], True),
+    (['--components', 'EncodingFixer', 'SentenceSplitterComponent', 'DocumentFilter'], False),
+    (['--no-pre-screening'], False),
+    (['--debug'], False)])
+def test_pre_screener_runs_with_pre_filterer(tmp_path, options, pre_screening):
+    cleaner = get_cleaner(tmp_path, options)
+    assert (PreScreener in cleaner.mappers) == pre_screening
+    if pre_screening:
+        # Right after the data parser
+        assert cleaner.mappers.index(PreScreener) == 1
@@ -0,0 +1,110 @@
+import argparse
+import logging
+import os
+import subprocess
+import pytest
+from corpus_cleaner.cleaner import Cleaner
+from corpus_cleaner.components.a_data_parser.compact_parser import compact_to_vertical, read_compact_files
+from corpus_cleaner.components.a_data_parser.onion_parser import parse_onion_blocks
+from corpus_cleaner.components.g_document_filter.document_filter import DocumentFilter
+from corpus_cleaner.components.i_output_formatter.compact_output_formatter import CompactOutputFormatter
+from corpus_cleaner.components.i_output_formatter.onion_output_formatter import OnionOutputFormatter
+from corpus_cleaner.document import Document
+from corpus_cleaner.par_utils import PipelineLogger
+
+ONION_PATH = os.path.join('lib', 'onion-1.2', 'bin', 'onion')
+FIELDS = ('title', 'url', 'id', 'keywords', 'heads', 'filename', 'language', 'language_confidence', 'chunk')
+
+
+def get_args(tmp_path, options=()):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output-path', type=str)
+    parser.add_argument('--input-format', type=str, default='sentence')
+    parser.add_argument('--output-format', type=str, default='sentence')
+    Cleaner.add_args(parser)
+    for component in Cleaner.get_components_classes():
+        component.add_args(parser)
+    args = parser.parse_args(['--output-path', str(tmp_path)] + list(options))
+    args.logger = PipelineLogger(logging.getLogger(__name__))
+    return args
+
+
+def mapped_documents():
+    # Documents as they leave the mappers
+    return [Document(content='', sentences=['Primera  frase.', 'Segona frase amb\tun tab.'], title='Títol "cometes"',
+                     url='https://example.com/a?b=1&c=2', id_='1', filename='input/a.txt', language='ca',
+                     language_confidence=0.9871234567, chunk=(3, 1, 4)),
+            Document(content='', sentences=['', 'Sense atributs.']),
+            Document(content='', sentences=['Tercera.'], id_='3', heads='HTTP/1.1 200 OK', keywords='a, b',
+                     language='es', language_confidence=1.0)]
+
+
+def summary(document):
+    return [getattr(document, field) for field in FIELDS] + [list(document.sentences)]
+
+
+def expected_summaries():
+    # Whitespace inside sentences is normalized, and sentences without words are dropped
+    res = []
+    for document in mapped_documents():
+        document.sentences = [' '.join(sentence.split()) for sentence in document.sentences if sentence.split()]
+        res.append(summary(document))
+    return res
+
+
+def write_compact_shard(tmp_path):
+    path = str(tmp_path / 'tmp' / 'host-1.compact')
+    os.makedirs(tmp_path / 'tmp', exist_ok=True)
+    CompactOutputFormatter(get_args(tmp_path), output_path=path).apply(mapped_documents())
+    return path
+
+
+def test_compact_round_trip(tmp_path):
+    path = write_compact_shard(tmp_path)
+    documents = [Document.parse_str(attrs) for attrs, _ in read_compact_files([path])]
+    for document, (_, sentences) in zip(documents, read_compact_files([path])):
+        document.sentences = sentences
+    assert [summary(document) for document in documents] == expected_summaries()
+
+
+def test_compact_to_onion_round_trip(tmp_path):
+    # Onion's output without duplicates: the vertical input with every line marked as kept
+    path = write_compact_shard(tmp_path)
+    with open(path, encoding='utf-8') as fd:
+        lines = ''.join(compact_to_vertical(fd, path)).splitlines()
+    documents = parse_onion_blocks([[f'0\t{line}'.encode('utf-8') for line in lines]], debug=False)
+    assert [summary(document) for document in documents] == expected_summaries()
+
+
+@pytest.mark.skipif(not os.path.exists(ONION_PATH), reason='onion is not installed')
+def test_compact_through_onion(tmp_path):
+    path = write_compact_shard(tmp_path)
+    with open(path, encoding='utf-8') as fd:
+        vertical = '<corpora>\n' + ''.join(compact_to_vertical(fd, path)) + '</corpora>\n'
+    output = subprocess.run([ONION_PATH, '-d', 'corpora', '-p', 'doc', '-n', '5', '-t', '0.5'], input=vertical,
+                            capture_output=True, encoding='utf-8', check=True).stdout
+    documents = parse_onion_blocks([[line.encode('utf-8') for line in output.splitlines()]], debug=False)
+    assert [summary(document) for document in documents] == expected_summaries()
+
+
+def test_legacy_onion_shard_conversion(tmp_path):
+    # Shards written in onion's vertical format (before the compact format) are converted once
+    os.makedirs(tmp_path / 'tmp')
+    legacy_path = str(tmp_path / 'tmp' / 'host-1.onion')
+    OnionOutputFormatter(get_args(tmp_path), output_path=legacy_path).apply(mapped_documents())
+    document_filter = DocumentFilter(get_args(tmp_path, ['--dedup-backend', 'native']))
+    paths = document_filter.get_onion_files_paths()
+    assert paths == [str(tmp_path / 'tmp' / 'host-1.compact')]
+    modified = os.path.getmtime(paths[0])
+    assert document_filter.get_onion_files_paths() == paths
+    assert os.path.getmtime(paths[0]) == modified
+    documents = [Document.parse_str(attrs) for attrs, _ in read_compact_files(paths)]
+    for document, (_, sentences) in zip(documents, read_compact_files(paths)):
+        document.sentences = sentences
+    assert [summary(document) for document in documents] == expected_summaries()
+
+
+def test_missing_tmp_shards(tmp_path):
+    os.makedirs(tmp_path / 'tmp')
+    with pytest.raises(RuntimeError, match='No tmp shards'):
+        DocumentFilter(get_args(tmp_path, ['--dedup-backend', 'native'])).get_onion_files_paths()
@@ -0,0 +1,46 @@
+import argparse
+import logging
+import pytest
+from corpus_cleaner.cleaner import Cleaner
+from corpus_cleaner.compression import BlockWriter, add_compression_extension, open_text
+from corpus_cleaner.components.a_data_parser.sentence_parser import SentenceParser
+from corpus_cleaner.par_utils import PipelineLogger
+
+
+@pytest.mark.parametrize('compression', ['none', 'gzip', 'zstd'])
+def test_block_writer_round_trip(tmp_path, compression):
+    lines = [f'línia {idx} ' + 'x' * (idx % 50) + '\n' for idx in range(5000)]
+    path = add_compression_extension(str(tmp_path / 'output.txt'), compression)
+    # Small blocks, so that the file is made of many gzip members or zstd frames; appending adds more of them
+    with BlockWriter(path, compression=compression, threads=3, mode='w', block_size=1000) as writer:
+        writer.writelines(lines[:4000])
+    with BlockWriter(path, compression=compression, threads=1, block_size=1000) as writer:
+        writer.writelines(lines[4000:])
+        assert writer.tell() == sum(len(line.encode('utf-8')) for line in lines[4000:])
+    with open_text(path) as fd:
+        assert fd.readlines() == lines
+
+
+def sentence_parser(input_path, options):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input-path', type=str)
+    parser.add_argument('--input-format', type=str, default='sentence')
+    Cleaner.add_args(parser)
+    for component in Cleaner.get_components_classes():
+        component.add_args(parser)
+    args = parser.parse_args(['--input-path', str(input_path), '--extensions', '.txt'] + options)
+    args.logger = PipelineLogger(logging.getLogger(__name__))
+    return SentenceParser(args)
+
+
+@pytest.mark.parametrize('compressed_input', [False, True])
+def test_compressed_input_discovery(tmp_path, compressed_input):
+    for name, compression in [('a.txt', 'none'), ('a.txt.gz', 'gzip'), ('b.txt.zst', 'zstd')]:
+        with BlockWriter(str(tmp_path / name), compression=compression, mode='w') as writer:
+            writer.write(f'{name}\n')
+    parser = sentence_parser(tmp_path, ['--compressed-input'] if compressed_input else [])
+    paths = [path for _, path in parser.get_idx_relative_filepaths()]
+    # The backup of a.txt is never read twice
+    expected = ['a.txt', 'b.txt.zst'] if compressed_input else ['a.txt']
+    assert paths == [str(tmp_path / name) for name in expected]
+    assert [document.content for path in paths for document in parser.treat_file(0, path)] == expected
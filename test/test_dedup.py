@@ -0,0 +1,169 @@
+import argparse
+import logging
+import os
+import random
+import numpy as np
+import pytest
+import corpus_cleaner.components.g_document_filter.ngram_deduplicator as ngram_deduplicator
+from corpus_cleaner.cleaner import Cleaner
+from corpus_cleaner.components.g_document_filter.document_filter import DocumentFilter
+from corpus_cleaner.par_utils import PipelineLogger
+from corpus_cleaner.dedup_partitions import NGramKeyWriter, count_partition
+from corpus_cleaner.components.g_document_filter.ngram_deduplicator import NGramDeduplicator, NGramHashSet
+
+WORDS = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+
+
+def random_documents(n_documents, seed=0):
+    # Few distinct words, so that many n-grams are repeated
+    rng = random.Random(seed)
+    documents = []
+    for idx in range(n_documents):
+        sentences = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))) for _ in range(rng.randint(0, 4))]
+        documents.append((f'id="{idx}"', sentences))
+    return documents
+
+
+def naive_duplicates(documents, n, threshold, granularity):
+    # Onion's algorithm, one unit at a time, with a set of n-gram tuples
+    seen = set()
+    res = []
+    for _, sentences in documents:
+        if granularity == 'document':
+            units = [' '.join(sentences).split()]
+        else:
+            units = [sentence.split() for sentence in sentences]
+        duplicates = []
+        for tokens in units:
+            ngrams = [tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+            covered = [False] * len(tokens)
+            for i, ngram in enumerate(ngrams):
+                if ngram in seen:
+                    covered[i:i + n] = [True] * n
+            duplicates.append(len(ngrams) > 0 and sum(covered) / len(tokens) > threshold)
+            seen.update(ngrams)
+        if granularity == 'document':
+            duplicates = duplicates * len(sentences)
+        res.append(duplicates)
+    return res
+
+
+def test_ngram_hash_set_matches_set():
+    rng = np.random.default_rng(0)
+    hash_set = NGramHashSet(memory=2 ** 30, initial_capacity=4)
+    reference = set()
+    for _ in range(50):
+        keys = rng.integers(1, 500, size=rng.integers(0, 40), dtype=np.uint64)
+        queries = rng.integers(1, 500, size=30, dtype=np.uint64)
+        assert hash_set.contains(queries).tolist() == [int(query) in reference for query in queries]
+        hash_set.add(keys)
+        reference.update(int(key) for key in keys)
+        assert len(hash_set) == len(reference)
+
+
+@pytest.mark.parametrize('granularity', ['document', 'paragraph'])
+@pytest.mark.parametrize('n,threshold', [(1, 0.5), (2, 0.0), (3, 0.5), (5, 0.5)])
+def test_ngram_deduplicator_matches_naive(monkeypatch, granularity, n, threshold):
+    # Small chunks, so that the vectorized decisions cross chunk boundaries
+    monkeypatch.setattr(ngram_deduplicator, 'HASH_CHUNK_SIZE', 7)
+    documents = random_documents(300, seed=n)
+    deduplicator = NGramDeduplicator(n=n, threshold=threshold, granularity=granularity, memory=2 ** 30)
+    res = [duplicates for _, _, duplicates in deduplicator.deduplicate_documents(documents)]
+    assert res == naive_duplicates(documents, n, threshold, granularity)
+
+
+@pytest.mark.parametrize('granularity', ['document', 'paragraph'])
+def test_partitioned_dedup_matches_global(tmp_path, granularity):
+    documents = random_documents(200, seed=3)
+    num_partitions = 3
+    paths = []
+    # Map phase: compact shards and their n-gram keys
+    for shard in range(4):
+        path = str(tmp_path / f'shard{shard}.compact')
+        key_writer = NGramKeyWriter(path, num_partitions, granularity, n=3)
+        key_writer.open()
+        with open(path, 'w', encoding='utf-8') as fd:
+            for attrs, sentences in documents[shard::4]:
+                fd.write(f'{len(sentences)}\t{attrs}\n' + ''.join(f'{sentence}\n' for sentence in sentences))
+                key_writer.write(sentences)
+        key_writer.close()
+        paths.append(path)
+    # Reduce phase: every partition is resolved on its own, and every shard is deduplicated on its own
+    for partition in range(num_partitions):
+        count_partition(paths, partition)
+    partitioned = ''
+    for path in paths:
+        NGramDeduplicator(n=3, granularity=granularity).deduplicate_shard(path, num_partitions, path + '.dedup')
+        with open(path + '.dedup', encoding='utf-8') as fd:
+            partitioned += fd.read()
+    global_path = str(tmp_path / 'global.dedup')
+    NGramDeduplicator(n=3, granularity=granularity, memory=2 ** 30).deduplicate_files(paths, global_path,
+                                                                                      corpora_tags=False)
+    with open(global_path, encoding='utf-8') as fd:
+        assert partitioned == fd.read()
+
+
+# Shard deduplicated on its own (--only-reduce-ind-onion), with the decisions of onion -m -n 1 -t 0.5 (paragraphs):
+#   "a b c x": a, b and c were seen (3/4 > 0.5); "x y": x was seen in a duplicate (1/2 is not above 0.5); "i j k": i
+#   and j were seen (2/3 > 0.5). On whole documents, the second one would be a duplicate (a, b, c and e, 4/7 > 0.5)
+IND_SHARD = [['a b c d', 'e f'], ['a b c x', 'e g h'], ['x y', 'g h i j'], ['i j k']]
+IND_SHARD_DUPLICATES = [[0, 0], [1, 0], [0, 0], [1]]
+
+
+def document_filter(tmp_path, options):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output-path', type=str)
+    parser.add_argument('--input-format', type=str, default='sentence')
+    parser.add_argument('--output-format', type=str, default='sentence')
+    Cleaner.add_args(parser)
+    for component in Cleaner.get_components_classes():
+        component.add_args(parser)
+    args = parser.parse_args(['--output-path', str(tmp_path), '--only-reduce-ind-onion'] + options)
+    args.logger = PipelineLogger(logging.getLogger(__name__))
+    return DocumentFilter(args)
+
+
+def write_ind_shard(tmp_path):
+    os.makedirs(tmp_path / 'tmp')
+    path = str(tmp_path / 'tmp' / 'shard.compact')
+    with open(path, 'w', encoding='utf-8') as fd:
+        for idx, sentences in enumerate(IND_SHARD):
+            fd.write(f'{len(sentences)}\tid="{idx}"\n' + ''.join(f'{sentence}\n' for sentence in sentences))
+    return path
+
+
+def sentence_marks(path):
+    # Mark of every sentence of onion's output (tags are skipped, sentences end at empty lines)
+    documents = []
+    marks = None
+    with open(path, encoding='utf-8') as fd:
+        for line in fd:
+            mark, _, token = line.rstrip('\n').partition('\t')
+            if token.startswith('<doc'):
+                documents.append([])
+            elif token == '</doc>' or token == '':
+                if marks is not None:
+                    documents[-1].append(max(marks))
+                marks = None
+            else:
+                marks = (marks or []) + [int(mark)]
+    return documents
+
+
+@pytest.mark.parametrize('granularity', ['document', 'paragraph'])
+def test_native_ind_dedup_matches_onion_units(tmp_path, granularity):
+    # The per-shard native backend uses onion's n-gram length and unit, whatever --dedup-granularity is
+    path = write_ind_shard(tmp_path)
+    document_filter(tmp_path, ['--dedup-backend', 'native', '--dedup-granularity', granularity]) \
+        .run_single_onion_dedup_txt(path)
+    assert sentence_marks(path + '.dedup') == IND_SHARD_DUPLICATES
+
+
+@pytest.mark.skipif(not os.path.exists(os.path.join('lib', 'onion-1.2', 'bin', 'onion')),
+                    reason='onion is not installed')
+def test_native_ind_dedup_matches_onion(tmp_path):
+    path = write_ind_shard(tmp_path)
+    document_filter(tmp_path, ['--dedup-backend', 'onion']).run_single_onion_dedup_txt(path)
+    os.rename(path + '.dedup', path + '.onion-dedup')
+    document_filter(tmp_path, ['--dedup-backend', 'native']).run_single_onion_dedup_txt(path)
+    assert sentence_marks(path + '.onion-dedup') == sentence_marks(path + '.dedup') == IND_SHARD_DUPLICATES
@@ -0,0 +1,105 @@
+import argparse
+import logging
+import random
+import xml.etree.ElementTree as ET
+import pytest
+from corpus_cleaner.cleaner import Cleaner
+from corpus_cleaner.components.a_data_parser.data_parser import simple_doc_attributes
+from corpus_cleaner.components.a_data_parser.document_parser import DocumentParser
+from corpus_cleaner.components.a_data_parser.wikipedia_parser import WikipediaParser
+from corpus_cleaner.par_utils import PipelineLogger
+
+HEADERS = [
+    '<doc id="1" url="https://ca.wikipedia.org/wiki?curid=1" title="Àlgebra">',
+    '<doc id="2" url="u" title="">',
+    '<doc\tid="3"  url="u"   title="a > b" >',
+    '<doc id="4" url="u" title="Tom &amp; Jerry">',
+    '<doc id="5" url="u" title="&quot;cometes&quot; i &#39;apòstrofs&#39;">',
+    '<doc id="6" url="u" title="l\'apòstrof">',
+    "<doc id='7' url='u' title='cometes \"dobles\"'>",
+    '<doc id="8" url="u" title="tab\there">',
+    '<doc id="9" url="u" title="línia\nnova">',
+    '<doc id="10" url="u" title="a" title="b">',
+    '<doc id="11" url="u" title="x < y">',
+    '<doc id="12" url="u" title="barra \\ invertida">',
+    '<doc id="13" url="u" xml:lang="ca">',
+    '<doc id = "14" url="u" title="espais">',
+    '<doc id="15"url="u" title="enganxats">',
+    '<document id="16" url="u">',
+    '<doc id="17" url="u" data-x.y="z" _a="">',
+]
+
+
+def xml_attributes(header):
+    try:
+        return ET.fromstring(header + '</doc>').attrib
+    except ET.ParseError:
+        return None
+
+
+@pytest.mark.parametrize('header', HEADERS)
+def test_simple_doc_attributes_match_xml(header):
+    attributes = simple_doc_attributes(header)
+    if attributes is not None:
+        assert attributes == xml_attributes(header)
+
+
+def test_simple_doc_attributes_fall_back():
+    # Headers with entities, single quotes, control characters, '<', backslashes, namespaces or repeated attributes go
+    # to the XML parser (which may reject them)
+    simple = [header for header in HEADERS if simple_doc_attributes(header) is not None]
+    assert [header.split('"')[1] for header in simple] == ['1', '2', '3', '6', '17']
+    assert simple_doc_attributes(HEADERS[2]) == {'id': '3', 'url': 'u', 'title': 'a > b'}
+    assert xml_attributes(HEADERS[3])['title'] == 'Tom & Jerry'
+    assert xml_attributes(HEADERS[7])['title'] == 'tab here'
+
+
+def test_random_headers_match_xml():
+    rng = random.Random(0)
+    pieces = ['a', 'é', ' ', '\t', '"', "'", '&', '&amp;', '&lt;', '&#65;', '<', '>', '=', '\\', '\n', '/', 'id', 'x.y']
+    simple = 0
+    for _ in range(5000):
+        values = [''.join(rng.choice(pieces) for _ in range(rng.randint(0, 4))) for _ in range(rng.randint(0, 3))]
+        names = [rng.choice(['id', 'url', 'title', 'a.b', '1x']) for _ in values]
+        header = '<doc' + ''.join(f' {name}="{value}"' for name, value in zip(names, values)) + rng.choice(['>', ' >'])
+        attributes = simple_doc_attributes(header)
+        if attributes is not None:
+            simple += 1
+            assert attributes == xml_attributes(header), header
+    assert simple > 100
+
+
+def get_args(input_path):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input-path', type=str)
+    parser.add_argument('--input-format', type=str, default='sentence')
+    Cleaner.add_args(parser)
+    for component in Cleaner.get_components_classes():
+        component.add_args(parser)
+    args = parser.parse_args(['--input-path', str(input_path), '--encoding', 'utf-8'])
+    args.logger = PipelineLogger(logging.getLogger(__name__))
+    return args
+
+
+def test_wikipedia_parser_headers(tmp_path):
+    headers = [HEADERS[0], HEADERS[2], HEADERS[3], HEADERS[4], HEADERS[6], HEADERS[7]]
+    (tmp_path / 'wiki_00').write_text(''.join(f'{header}\nTítol\nText.\n</doc>\n' for header in headers),
+                                      encoding='utf-8')
+    documents = list(WikipediaParser(get_args(tmp_path)).treat_file(0, str(tmp_path / 'wiki_00')))
+    assert [(document.id, document.url, document.title) for document in documents] == \
+        [(attributes['id'], attributes['url'], attributes['title'])
+         for attributes in map(xml_attributes, headers)]
+
+
+def test_document_parser_headers(tmp_path):
+    headers = ['<doc id="1" url="https://example.com/a?b=1&c=2" title="x">',
+               '<doc id="2" url="https://example.com/b" title="Tom &amp; Jerry">',
+               '<doc id="3" url="https://example.com/c" title="a &lt; b">',
+               '<doc id="4" title="sense url">']
+    (tmp_path / 'docs.txt').write_text(''.join(f'{header}\n<p>Paràgraf {idx}</p>\n</doc>\n'
+                                               for idx, header in enumerate(headers)) + '<doc>\n', encoding='utf-8')
+    documents = list(DocumentParser(get_args(tmp_path)).treat_file(0, str(tmp_path / 'docs.txt')))
+    # The raw '&' of the first url is escaped before the XML fallback
+    assert [(document.id, document.url, document.content) for document in documents] == \
+        [('1', 'https://example.com/a?b=1&c=2', 'Paràgraf 0\n'), ('2', 'https://example.com/b', 'Paràgraf 1\n'),
+         ('3', 'https://example.com/c', 'Paràgraf 2\n'), (None, None, 'Paràgraf 3\n')]
@@ -0,0 +1,49 @@
+import pickle
+import pytest
+from corpus_cleaner.document import Document
+from corpus_cleaner.operations import OperationLog, operation_code
+
+
+def full_document():
+    document = Document(content='Hola món.\nAdéu.', filename='input/a.txt', sentences=['Hola món.', 'Adéu.'],
+                        sentences_orig=['Hola  món.', 'Adéu.'], title='Títol', url='https://example.com', id_='7',
+                        keywords='a, b', heads='HTTP/1.1 200 OK', language='ca', language_confidence=0.75,
+                        chunk=(2, 0, 3), keep_original=True)
+    document.operations.add(operation_code('Test-op'), 1, 0.5)
+    return document
+
+
+def state(document):
+    return {slot: getattr(document, slot) for slot in Document.__slots__ if slot != 'operations'}
+
+
+@pytest.mark.parametrize('protocol', [2, pickle.HIGHEST_PROTOCOL])
+def test_pickle_round_trip(protocol):
+    for document in [full_document(), Document(content='')]:
+        unpickled = pickle.loads(pickle.dumps(document, protocol=protocol))
+        assert state(unpickled) == state(document)
+        if document.operations is None:
+            assert unpickled.operations is None
+        else:
+            assert unpickled.operations.sentence_operations(2) == document.operations.sentence_operations(2)
+
+
+def test_slots():
+    document = full_document()
+    assert not hasattr(document, '__dict__')
+    with pytest.raises(AttributeError):
+        document.unknown = 1
+    # The original content is only kept in debug mode
+    assert document.content_orig == document.content
+    assert Document(content='x').content_orig is None and Document(content='x').operations is None
+
+
+def test_pickled_batch_shares_strings():
+    # Interned fields are the same objects in all the documents, so a batch pickles them once
+    documents = [Document(content=str(idx), filename=''.join(['input/', 'a.txt']), language=''.join(['c', 'a']))
+                 for idx in range(100)]
+    assert all(document.filename is documents[0].filename for document in documents)
+    unpickled = pickle.loads(pickle.dumps(documents))
+    assert all(document.filename is unpickled[0].filename and document.language is unpickled[0].language
+               for document in unpickled)
+    assert len(pickle.dumps(documents)) < 100 * len(pickle.dumps(documents[0]))
@@ -0,0 +1,31 @@
+import argparse
+from corpus_cleaner.components.a_data_parser.document_chunker import ChunkReassembler, chunk_document, split_chunks
+from corpus_cleaner.document import Document
+
+
+def split(document, ordinal):
+    chunks = list(chunk_document(document, 12, ordinal))
+    for chunk in chunks:
+        chunk.sentences = chunk.content.splitlines()
+    return chunks
+
+
+def test_split_chunks():
+    content = 'first line\nsecond line\na much longer third line\n'
+    chunks = split_chunks(content, 12)
+    assert ''.join(chunks) == content
+    assert all(len(chunk) <= 12 for chunk in chunks)
+    assert chunks[:2] == ['first line\n', 'second line\n']
+
+
+def test_reassembly_with_dropped_chunks():
+    # Documents without ids (eg. TextfileParser): the last chunks of `a` and the first chunk of `b` are discarded
+    a = split(Document(content='aaa\n' * 9, filename='f.txt'), 0)
+    b = split(Document(content='bbb\n' * 9, filename='f.txt'), 1)
+    c = Document(content='ccc\n', filename='f.txt', sentences=['ccc'])
+    assert [chunk.chunk for chunk in a] == [(0, 0, 3), (0, 1, 3), (0, 2, 3)]
+    documents = [a[0], None, None, None, b[1], b[2], c]
+    reassembled = list(ChunkReassembler(argparse.Namespace(debug=False))(documents))
+    assert [document.sentences for document in reassembled] == [['aaa'] * 3, ['bbb'] * 6, ['ccc']]
+    assert [document.content for document in reassembled] == ['aaa\n' * 3, 'bbb\n' * 6, 'ccc\n']
+    assert all(document.chunk is None for document in reassembled)
@@ -0,0 +1,79 @@
+import argparse
+import random
+import pytest
+import corpus_cleaner.filter_order as filter_order_module
+from corpus_cleaner.components.c_pre_filterer.pre_filterer import PreFilterer
+from corpus_cleaner.components.e_sentence_filter.sentence_filter import SentenceFilter
+from corpus_cleaner.document import Document
+from corpus_cleaner.filter_order import AdaptiveFilterOrder
+
+
+class FakeClock:
+    # Every filter advances the clock by its cost, so that the measured costs are deterministic
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+    def filter(self, name, cost, rejects):
+        def filter_(item):
+            self.now += cost
+            return not rejects(item), item
+        filter_.__name__ = name
+        return filter_
+
+
+def test_reorder_by_cost_per_rejection(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(filter_order_module.time, 'perf_counter', clock.perf_counter)
+    filters = [clock.filter('never', 1.0, lambda item: False),
+               clock.filter('expensive', 10.0, lambda item: item % 2 == 0),
+               clock.filter('cheap', 1.0, lambda item: item % 3 == 0),
+               clock.filter('never_cheap', 0.1, lambda item: False)]
+    filter_order = AdaptiveFilterOrder(filters, sample_size=12, name='test')
+    items = list(range(100))
+    results = [filter_order(item) for item in items]
+    # Cost per rejection: cheap 12/4, expensive 120/6; filters that never rejected go last, by cost
+    assert [filter_.__name__ for filter_ in filter_order.filters] == ['cheap', 'expensive', 'never_cheap', 'never']
+    assert [keep for keep, _, _ in results] == [item % 2 != 0 and item % 3 != 0 for item in items]
+    # The first rejecting filter is reported (in the configured order while sampling, in the new order after)
+    assert results[6][1].__name__ == 'expensive' and results[18][1].__name__ == 'cheap'
+    assert results[6][2] == 6
+
+
+def test_no_sample_keeps_order():
+    filters = [lambda item: (item > 0, 'a'), lambda item: (item > 1, 'b')]
+    filter_order = AdaptiveFilterOrder(filters, sample_size=0, name='test')
+    assert not filter_order.sampling
+    assert [filter_order(item)[:1] for item in range(3)] == [(False,), (False,), (True,)]
+    assert filter_order.filters == filters
+
+
+def get_args(options):
+    parser = argparse.ArgumentParser()
+    PreFilterer.add_args(parser)
+    SentenceFilter.add_args(parser)
+    parser.add_argument('--debug', action='store_true')
+    parser.add_argument('--input-format', type=str, default='sentence')
+    # --none_filter activates the document filters of PreFilterer
+    return parser.parse_args(['--none_filter', '--lang-filter', 'ca'] + options)
+
+
+def random_documents(n_documents, seed=0):
+    rng = random.Random(seed)
+    words = ['Hola', 'món', 'frase', 'llarga', 'ÀÉÍ', 'AAAA', '1234', '56', '!!??', '--', '...', 'Привет', 'és']
+    return [' '.join(rng.choice(words) for _ in range(rng.randint(1, 20))) for _ in range(n_documents)]
+
+
+@pytest.mark.parametrize('sample', [1, 50])
+def test_pre_filterer_reordering_keeps_output(sample):
+    reference = PreFilterer(get_args(['--filter-order-sample', '0']))
+    pre_filterer = PreFilterer(get_args(['--filter-order-sample', str(sample)]))
+    assert len(pre_filterer.filters) > 3
+    expected = [reference.apply(Document(content=content)) for content in random_documents(1000)]
+    res = [pre_filterer.apply(Document(content=content)) for content in random_documents(1000)]
+    assert not pre_filterer.filter_order.sampling
+    assert 0 < sum(document is not None for document in expected) < len(expected)
+    assert [document.content if document is not None else None for document in res] == \
+        [document.content if document is not None else None for document in expected]
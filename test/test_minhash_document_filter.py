@@ -0,0 +1,74 @@
+import argparse
+import logging
+import os
+import random
+import types
+import pytest
+from corpus_cleaner.cleaner import Cleaner
+from corpus_cleaner.components.a_data_parser.onion_parser import parse_onion_blocks
+from corpus_cleaner.components.g_document_filter.minhash_document_filter import MinHashDocumentFilter
+from corpus_cleaner.components.i_output_formatter.compact_output_formatter import CompactOutputFormatter
+from corpus_cleaner.document import Document
+from corpus_cleaner.par_utils import PipelineLogger
+
+
+def get_args(tmp_path, options):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input-path', type=str)
+    parser.add_argument('--output-path', type=str)
+    parser.add_argument('--input-format', type=str, default='sentence')
+    parser.add_argument('--output-format', type=str, default='sentence')
+    Cleaner.add_args(parser)
+    for component in Cleaner.get_components_classes():
+        component.add_args(parser)
+    args = parser.parse_args(['--output-path', str(tmp_path)] + options)
+    Cleaner.check_args(args)
+    for component in Cleaner.get_components_classes():
+        component.check_args(args)
+    args.logger = PipelineLogger(logging.getLogger(__name__))
+    return args
+
+
+def near_duplicate_documents():
+    rng = random.Random(0)
+    vocabulary = [f'w{idx}' for idx in range(1000)]
+    first = [rng.choice(vocabulary) for _ in range(100)]
+    second = [rng.choice(vocabulary) for _ in range(100)]
+    unrelated = [rng.choice(vocabulary) for _ in range(100)]
+    texts = {
+        '0': first,
+        # One word changed: Jaccard similarity of the 5-gram sets ~0.90
+        '1': first[:90] + ['changed'] + first[91:],
+        '2': list(first),
+        '3': second,
+        # One word appended: ~0.99
+        '4': second + ['appended'],
+        # Half of the first document: ~0.31
+        '5': first[:50] + unrelated[:50],
+        '6': unrelated,
+    }
+    return [Document(content='', sentences=[' '.join(words[:50]), ' '.join(words[50:])], id_=id_)
+            for id_, words in texts.items()]
+
+
+@pytest.mark.parametrize('options', [
+    ['--dedup', 'minhash'],
+    ['--components', 'EncodingFixer', 'DocumentFilter', 'MinHashDocumentFilter']])
+def test_minhash_replaces_document_filter(tmp_path, options):
+    args = get_args(tmp_path, options)
+    assert 'DocumentFilter' not in args.components and 'MinHashDocumentFilter' in args.components
+    cleaner = Cleaner(args, logging.getLogger(__name__), types.SimpleNamespace(resume=False))
+    assert cleaner.reducer is MinHashDocumentFilter
+
+
+def test_minhash_keeps_first_of_near_duplicates(tmp_path):
+    args = get_args(tmp_path, ['--dedup', 'minhash', '--dedup-backend', 'native'])
+    os.makedirs(tmp_path / 'tmp')
+    path = str(tmp_path / 'tmp' / 'host-1.compact')
+    CompactOutputFormatter(args, output_path=path).apply(near_duplicate_documents())
+    document_filter = MinHashDocumentFilter(args)
+    assert document_filter._compute_keep_mask().tolist() == [True, False, False, True, False, True, True]
+    # Discarded documents are marked as duplicates in the onion-style output
+    document_filter.keep = None
+    lines = [line.encode('utf-8') for line in ''.join(document_filter._marked_lines()).splitlines()]
+    assert [document.id for document in parse_onion_blocks([lines], debug=False)] == ['0', '3', '5', '6']
@@ -0,0 +1,118 @@
+import argparse
+import logging
+import random
+import time
+import pytest
+import corpus_cleaner.components.a_data_parser.onion_parser as onion_parser_module
+from corpus_cleaner.components.a_data_parser.onion_parser import OnionParser, _parse_chunk, parse_onion_blocks, \
+    read_line_blocks, split_onion_file
+from corpus_cleaner.compression import BlockWriter
+from corpus_cleaner.document import Document
+from corpus_cleaner.par_utils import PipelineLogger
+
+
+def random_onion(n_documents, debug, seed=0):
+    # Onion's output format (or the debug one, without the duplicate marks)
+    rng = random.Random(seed)
+    mark = (lambda: '') if debug else (lambda: rng.choice(['0\t', '0\t', '1\t']))
+    lines = [f'{mark()}<corpora>\n']
+    for idx in range(n_documents):
+        lines.append(f'{mark()}<doc id="{idx}" title="títol {idx}">\n')
+        paragraphs = [[rng.choice(['a', 'b', 'ñ', 'word', '-', '.']) for _ in range(rng.randint(1, 5))]
+                      for _ in range(rng.randint(0, 4))]
+        for par_idx, words in enumerate(paragraphs):
+            if par_idx > 0:
+                lines.append(f'{mark()}\n')
+            paragraph_mark = mark()
+            lines.extend(f'{paragraph_mark if rng.random() < 0.9 else mark()}{word}\n' for word in words)
+        lines.append(f'{mark()}</doc>\n')
+    lines.append(f'{mark()}</corpora>\n')
+    return ''.join(lines)
+
+
+def reference_parse(text, debug):
+    # Line by line parsing of the original OnionParser. Unlike it, a document is also closed when its last paragraph
+    # was removed (otherwise, its sentences were merged into the next document)
+    res = []
+    doc_sentences = []
+    par_words = []
+    attrs = None
+    for line in text.splitlines(keepends=True):
+        line_index = None
+        if not debug:
+            line_index, line = line.split('\t', 1)
+        if line.startswith('<doc'):
+            attrs = line[len('<doc'):].strip()[:-1]
+        elif line in ['</doc>\n', '\n']:
+            if par_words:
+                doc_sentences.append(' '.join(par_words))
+                par_words = []
+            if line == '</doc>\n':
+                if doc_sentences:
+                    res.append((Document.parse_str(attrs).id, doc_sentences))
+                doc_sentences = []
+        elif line in ['<corpora>\n', '</corpora>\n']:
+            continue
+        elif debug or line_index == '0':
+            par_words.append(line.strip('\n'))
+    return res
+
+
+def summary(documents):
+    return [(document.id, list(document.sentences)) for document in documents]
+
+
+def onion_parser(path, compressed_input=None):
+    args = argparse.Namespace(debug=False, input_path=None, output_path=str(path), extensions=None, encoding=None,
+                              encoding_threshold=None, encoding_error_policy=None, url_doc=None,
+                              max_document_chars=None, compressed_input=compressed_input,
+                              logger=PipelineLogger(logging.getLogger(__name__)))
+    return OnionParser(args)
+
+
+@pytest.mark.parametrize('debug', [False, True])
+def test_parse_onion_blocks_matches_reference(monkeypatch, tmp_path, debug):
+    # Small blocks, so that lines (and multi-byte characters) are split across blocks
+    monkeypatch.setattr(onion_parser_module, 'READ_SIZE', 7)
+    text = random_onion(500, debug)
+    path = tmp_path / 'output.dedup'
+    path.write_text(text, encoding='utf-8')
+    with open(path, 'rb') as fd:
+        documents = list(parse_onion_blocks(read_line_blocks(fd), debug))
+    assert summary(documents) == reference_parse(text, debug)
+
+
+def test_parse_chunks_match_onion_parser(tmp_path):
+    text = random_onion(500, debug=False, seed=1)
+    path = tmp_path / 'output.dedup'
+    path.write_text(text, encoding='utf-8')
+    parser = onion_parser(tmp_path)
+    expected = reference_parse(text, debug=False)
+    assert summary(parser.treat_file(0, str(path))) == expected
+    assert summary(parser.parse_stream(text.splitlines(keepends=True))) == expected
+    chunks = split_onion_file(str(path), chunk_size=500)
+    assert len(chunks) > 1
+    documents = [document for start, end in chunks
+                 for document in _parse_chunk((str(path), start, end, False, True, 'strict'))]
+    assert summary(documents) == expected
+    assert summary(parser.parse_parallel(processes=2, chunk_size=500)[0]) == expected
+
+
+def slow_first_chunks(args):
+    # The first chunk of every file finishes last
+    if args[1] == 0:
+        time.sleep(0.5)
+    return _parse_chunk(args)
+
+
+def test_parse_parallel_keeps_order(monkeypatch, tmp_path):
+    monkeypatch.setattr(onion_parser_module, '_parse_chunk', slow_first_chunks)
+    texts = [random_onion(300, debug=False, seed=seed) for seed in range(2, 4)]
+    (tmp_path / 'a.dedup').write_text(texts[0], encoding='utf-8')
+    # Compressed files are parsed as a single chunk
+    with BlockWriter(str(tmp_path / 'b.dedup.gz'), compression='gzip', mode='w') as writer:
+        writer.write(texts[1])
+    parser = onion_parser(tmp_path, compressed_input=True)
+    assert len(split_onion_file(str(tmp_path / 'a.dedup'), chunk_size=300)) > 6
+    assert [summary(documents) for documents in parser.parse_parallel(processes=3, chunk_size=300)] == \
+        [reference_parse(text, debug=False) for text in texts]
@@ -0,0 +1,39 @@
+import math
+import pickle
+import corpus_cleaner.operations as operations
+from corpus_cleaner.operations import WHOLE_DOCUMENT, OperationLog, operation_code, operation_name
+
+
+def test_codes_round_trip_to_names():
+    names = ['EncodingFixer-fix', 'PreFilterer-_filter_by_length', 'SentenceFilter-_filter_by_lang']
+    codes = [operation_code(name) for name in names]
+    assert [operation_code(name) for name in names] == codes
+    assert [operation_name(code) for code in codes] == names
+
+
+def test_sentence_operations():
+    log = OperationLog()
+    log.add(operation_code('A-doc'))
+    log.add(operation_code('B-value'), 1, 0.25)
+    log.add(operation_code('C-other'), 0, ('ca', 0.9))
+    log.add(operation_code('D-nan'), 1, math.nan)
+    # Sentences beyond the number of sentences (eg. removed ones) are ignored
+    log.add(operation_code('E-out'), 5)
+    assert len(log) == 5
+    assert log.sentence_operations(2) == [['A-doc', "C-other:('ca', 0.9)"], ['A-doc', 'B-value:0.25', 'D-nan']]
+
+
+def test_pickle_across_registries(monkeypatch):
+    # Another process registers the operations in a different order, so the codes differ but not the names
+    log = OperationLog()
+    log.add(operation_code('X-first'), WHOLE_DOCUMENT)
+    log.add(operation_code('Y-second'), 0, 1.5)
+    log.add(operation_code('X-first'), 1)
+    expected = log.sentence_operations(2)
+    pickled = pickle.dumps(log)
+    monkeypatch.setattr(operations, '_NAMES', ['Y-second', 'Z-other'])
+    monkeypatch.setattr(operations, '_CODES', {'Y-second': 0, 'Z-other': 1})
+    unpickled = pickle.loads(pickled)
+    assert unpickled.sentence_operations(2) == expected
+    assert operations._NAMES == ['Y-second', 'Z-other', 'X-first']
+    assert unpickled.codes.tolist() == [2, 0, 2]
@@ -0,0 +1,103 @@
+import argparse
+import json
+import logging
+import pytest
+from corpus_cleaner.cleaner import Cleaner
+from corpus_cleaner.compression import open_text
+from corpus_cleaner.components.i_output_formatter.indexed_output_formatter import IndexedDataset, \
+    IndexedOutputFormatter
+from corpus_cleaner.components.i_output_formatter.sentence_output_formatter import SentenceOutputFormatter
+from corpus_cleaner.document import Document
+from corpus_cleaner.par_utils import PipelineLogger
+
+
+def get_args(tmp_path, options=()):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output-path', type=str)
+    parser.add_argument('--input-format', type=str, default='sentence')
+    parser.add_argument('--output-format', type=str, default='sentence')
+    Cleaner.add_args(parser)
+    for component in Cleaner.get_components_classes():
+        component.add_args(parser)
+    args = parser.parse_args(['--output-path', str(tmp_path)] + list(options))
+    args.logger = PipelineLogger(logging.getLogger(__name__))
+    return args
+
+
+def documents():
+    sentences = [['u1', 'dos 2'], [], ['tres', 'quatre'], ['cinc'], ['sis', 'set', 'vuit 8']]
+    return [Document(content='', sentences=document) for document in sentences] + [None]
+
+
+def shard_bytes(sentences):
+    return sum(len(f'{sentence}\n'.encode('utf-8')) for sentence in sentences)
+
+
+@pytest.mark.parametrize('compression', ['none', 'gzip'])
+def test_sentence_shards_manifest(tmp_path, compression):
+    args = get_args(tmp_path, ['--output-shard-size', '3', '--output-shard-unit', 'sentences',
+                               '--output-compression', compression])
+    SentenceOutputFormatter(args).apply(documents())
+    with open(tmp_path / 'output.shards.json') as f:
+        manifest = json.load(f)
+    # Shards are closed after the document reaching 3 sentences; the empty document is not counted
+    extension = '.gz' if compression == 'gzip' else ''
+    expected = [['u1', 'dos 2', 'tres', 'quatre'], ['cinc', 'sis', 'set', 'vuit 8']]
+    assert manifest == dict(unit='sentences', size=3, shards=[
+        dict(path=f'output-00000.txt{extension}', bytes=shard_bytes(expected[0]), documents=2, sentences=4),
+        dict(path=f'output-00001.txt{extension}', bytes=shard_bytes(expected[1]), documents=2, sentences=4)])
+    for shard, sentences in zip(manifest['shards'], expected):
+        with open_text(str(tmp_path / shard['path'])) as fd:
+            assert fd.read().splitlines() == sentences
+    assert not (tmp_path / 'output.txt').exists()
+
+
+def test_byte_shards_concatenate_to_output(tmp_path):
+    SentenceOutputFormatter(get_args(tmp_path)).apply(documents())
+    with open(tmp_path / 'output.txt') as fd:
+        output = fd.read()
+    sharded_path = tmp_path / 'sharded'
+    sharded_path.mkdir()
+    SentenceOutputFormatter(get_args(sharded_path, ['--output-shard-size', '9'])).apply(documents())
+    with open(sharded_path / 'output.shards.json') as f:
+        shards = json.load(f)['shards']
+    assert [shard['documents'] for shard in shards] == [1, 1, 2]
+    sharded_output = ''
+    for shard in shards:
+        with open(sharded_path / shard['path']) as fd:
+            content = fd.read()
+        assert len(content.encode('utf-8')) == shard['bytes']
+        sharded_output += content
+    assert sharded_output == output
+
+
+def test_indexed_dataset_read_back(tmp_path):
+    IndexedOutputFormatter(get_args(tmp_path, ['--output-format', 'indexed'])).apply(
+        documents() + [Document(content='', sentences=['ñ€😀', ''])])
+    dataset = IndexedDataset(str(tmp_path / 'output.bin'))
+    # Empty documents are not written
+    expected = [['u1', 'dos 2'], ['tres', 'quatre'], ['cinc'], ['sis', 'set', 'vuit 8'], ['ñ€😀', '']]
+    assert len(dataset) == len(expected)
+    assert [dataset[idx] for idx in range(len(dataset))] == expected
+    assert dataset[-1] == expected[-1]
+    assert dataset.num_sentences() == 10
+    assert [dataset.get_sentence(idx) for idx in range(dataset.num_sentences())] == sum(expected, [])
+    assert dataset.get_document(3).content == 'sis\nset\nvuit 8'
+    with pytest.raises(IndexError):
+        dataset[len(expected)]
+
+
+def test_indexed_dataset_empty(tmp_path):
+    IndexedOutputFormatter(get_args(tmp_path, ['--output-format', 'indexed'])).apply([None])
+    dataset = IndexedDataset(str(tmp_path / 'output'))
+    assert len(dataset) == 0 and dataset.num_sentences() == 0
+
+
+def test_indexed_dataset_shards(tmp_path):
+    IndexedOutputFormatter(get_args(tmp_path, ['--output-format', 'indexed', '--output-shard-size', '2',
+                                               '--output-shard-unit', 'documents'])).apply(documents())
+    with open(tmp_path / 'output.shards.json') as f:
+        shards = json.load(f)['shards']
+    assert [shard['path'] for shard in shards] == ['output-00000.bin', 'output-00001.bin']
+    assert [IndexedDataset(str(tmp_path / shard['path']))[idx] for shard in shards for idx in range(2)] == \
+        [['u1', 'dos 2'], ['tres', 'quatre'], ['cinc'], ['sis', 'set', 'vuit 8']]
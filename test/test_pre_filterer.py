@@ -0,0 +1,85 @@
+import argparse
+import pytest
+import corpus_cleaner.components.c_pre_filterer.pre_filterer as pre_filterer_module
+from corpus_cleaner.components.c_pre_filterer.pre_filterer import PreFilterer
+from corpus_cleaner.components.e_sentence_filter.sentence_filter import SentenceFilter
+from corpus_cleaner.document import Document
+
+
+class FakeLanguageModel:
+    # Votes for the language with more words in the text ('gat' is Catalan and 'perro' Spanish), with their proportion
+    def __init__(self):
+        self.texts = []
+
+    def predict(self, text):
+        self.texts.append(text)
+        words = text.replace('.', ' ').split()
+        ca = words.count('gat') / len(words)
+        es = words.count('perro') / len(words)
+        return ('__label__ca',) if ca >= es else ('__label__es',), [max(ca, es)]
+
+
+@pytest.fixture
+def language_model(monkeypatch):
+    model = FakeLanguageModel()
+    monkeypatch.setattr(pre_filterer_module.fasttext, 'load_model', lambda path: model)
+    return model
+
+
+def get_pre_filterer(options):
+    parser = argparse.ArgumentParser()
+    PreFilterer.add_args(parser)
+    SentenceFilter.add_args(parser)
+    parser.add_argument('--debug', action='store_true')
+    parser.add_argument('--input-format', type=str, default='sentence')
+    args = parser.parse_args(['--lang-filter', 'ca', '--lang-filter-document', '--lang-filter-window-size', '60'] +
+                             options)
+    return PreFilterer(args)
+
+
+def test_lang_windows(language_model):
+    pre_filterer = get_pre_filterer(['--lang-filter-windows', '4'])
+    text = ' '.join(f'paraula{idx}' for idx in range(100))
+    windows = pre_filterer._lang_windows(text)
+    assert len(windows) == 4
+    # From the head to the tail, without partial words
+    assert text.startswith(windows[0]) and text.endswith(windows[-1])
+    for window in windows:
+        assert 0 < len(window) <= 60 and f' {window} ' in f' {text} '
+
+
+def test_windows_agree(language_model):
+    pre_filterer = get_pre_filterer([])
+    document = Document(content=' '.join(['gat'] * 40 + ['perro'] + ['gat'] * 40))
+    assert pre_filterer._filter_by_lang(document) == (True, None)
+    # Only the windows are identified; the one in the middle includes the Spanish word
+    assert len(language_model.texts) == 3 and all(len(text) <= 60 for text in language_model.texts)
+    assert document.language == 'ca'
+    votes = [FakeLanguageModel().predict(text)[1][0] for text in language_model.texts]
+    assert votes[0] == votes[2] == 1 and votes[1] < 1
+    assert document.language_confidence == pytest.approx(sum(votes) / 3)
+
+
+def test_windows_disagree_fall_back_to_whole_text(language_model):
+    pre_filterer = get_pre_filterer([])
+    content = ' '.join(['gat'] * 50 + ['perro'] * 30)
+    document = Document(content=content)
+    assert pre_filterer._filter_by_lang(document) == (True, None)
+    assert len(language_model.texts) == 4 and language_model.texts[-1] == content
+    assert (document.language, document.language_confidence) == ('ca', 50 / 80)
+    # The whole text decides, even against the majority of the windows
+    document = Document(content=' '.join(['gat'] * 25 + ['perro'] * 55 + ['gat'] * 40))
+    assert pre_filterer._filter_by_lang(document) == (True, None)
+    assert (document.language, document.language_confidence) == ('ca', 65 / 120)
+
+
+@pytest.mark.parametrize('options,content', [
+    # Not longer than --lang-filter-windows windows
+    ([], ' '.join(['perro'] * 25)),
+    # Windows deactivated
+    (['--lang-filter-window-size', '0'], ' '.join(['perro'] * 100))])
+def test_whole_text(language_model, options, content):
+    pre_filterer = get_pre_filterer(options)
+    document = Document(content=content)
+    assert pre_filterer._filter_by_lang(document) == (False, '(1.0, es)')
+    assert language_model.texts == [content]
@@ -0,0 +1,82 @@
+import collections
+import random
+import pytest
+from corpus_cleaner.components.g_document_filter.repeated_sentence_filter import RepeatedSentenceFilter
+
+DOCUMENTS = [['hola món', 'bon dia', 'adéu'], ['bon dia', 'hola món'], ['bon dia', 'adéu siau'], ['bon dia']]
+
+
+def vertical(documents):
+    # Onion's marked vertical format, without duplicates
+    lines = ['0\t<corpora>\n']
+    for idx, sentences in enumerate(documents):
+        lines.append(f'0\t<doc id="{idx}">\n')
+        for sentence in sentences:
+            lines.extend(f'0\t{word}\n' for word in sentence.split())
+            lines.append('0\t\n')
+        lines.append('0\t</doc>\n')
+    lines.append('0\t</corpora>\n')
+    return lines
+
+
+def test_filter_stream_consumes_lines_once(tmp_path):
+    input_file = tmp_path / 'input.dedup'
+    input_file.write_text(''.join(vertical(DOCUMENTS)), encoding='utf-8')
+    output_file = tmp_path / 'output.dedup.sentences'
+    RepeatedSentenceFilter(2, tmp_dir=str(tmp_path)).filter(str(input_file), str(output_file))
+    consumed = []
+
+    def lines():
+        consumed.append(True)
+        yield from vertical(DOCUMENTS)
+
+    streamed = list(RepeatedSentenceFilter(2, tmp_dir=str(tmp_path)).filter_stream(lines(), 1000))
+    assert len(consumed) == 1
+    assert ''.join(streamed) == output_file.read_text(encoding='utf-8')
+    # Third and fourth "bon dia" are marked, and the spill is removed with the rest of the temporary files
+    assert streamed.count('1\tbon\n') == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['input.dedup', 'output.dedup.sentences']
+
+
+def random_marked_lines(n_documents, seed=0):
+    # Few distinct sentences, and some words already marked as duplicates by onion
+    rng = random.Random(seed)
+    lines = ['0\t<corpora>\n']
+    for idx in range(n_documents):
+        lines.append(f'0\t<doc id="{idx}">\n')
+        for _ in range(rng.randint(0, 5)):
+            lines.extend(f'{int(rng.random() < 0.1)}\t{rng.choice("abc")}\n' for _ in range(rng.randint(1, 3)))
+            lines.append('0\t\n')
+        lines.append('0\t</doc>\n')
+    lines.append('0\t</corpora>\n')
+    return lines
+
+
+def naive_marks(lines, threshold):
+    # Occurrences of every sentence (its words not marked by onion) beyond the first `threshold` ones are marked
+    counts = collections.Counter()
+    res = []
+    sentence = []
+    for line in lines:
+        token = line.rstrip('\n').split('\t')[1]
+        if token != '' and not token.startswith('<'):
+            sentence.append(line)
+            continue
+        words = tuple(word.rstrip('\n').split('\t')[1] for word in sentence if word.startswith('0'))
+        counts[words] += 1
+        if len(words) > 0 and counts[words] > threshold:
+            sentence = ['1' + word[1:] for word in sentence]
+        res.extend(sentence + [line])
+        sentence = []
+    return res
+
+
+@pytest.mark.parametrize('threshold', [1, 2, 5])
+@pytest.mark.parametrize('memory,processes', [(2000000000, 1), (20000, 1), (20000, 2)])
+def test_repeat_counts_match_naive(tmp_path, threshold, memory, processes):
+    # A small memory budget splits the sentences into several partitions
+    lines = random_marked_lines(500)
+    repeated_sentence_filter = RepeatedSentenceFilter(threshold, memory=memory, processes=processes,
+                                                      tmp_dir=str(tmp_path))
+    assert repeated_sentence_filter._num_partitions(len(lines)) > 1 or memory > 20000
+    assert list(repeated_sentence_filter.filter_stream(iter(lines), len(lines))) == naive_marks(lines, threshold)
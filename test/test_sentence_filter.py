@@ -0,0 +1,210 @@
+import argparse
+import logging
+import random
+import re
+import pytest
+from corpus_cleaner.components.c_pre_filterer.pre_filterer import PreFilterer
+from corpus_cleaner.components.e_sentence_filter.sentence_filter import SentenceFilter
+from corpus_cleaner.document import Document
+from corpus_cleaner.filter_order import AdaptiveFilterOrder
+from corpus_cleaner.par_utils import PipelineLogger
+
+CODE_KEYWORDS_PATTERN = re.compile('\\b(var|function|const|if|else|script)\\b')
+CODE_CHARS_PATTERN = re.compile('[;=&\\[\\](){}/\\\\]')
+
+
+def get_args(options):
+    parser = argparse.ArgumentParser()
+    PreFilterer.add_args(parser)
+    SentenceFilter.add_args(parser)
+    parser.add_argument('--debug', action='store_true')
+    return parser.parse_args(options)
+
+
+class ReferenceSentenceFilter:
+    # Sentence by sentence filters of the original SentenceFilter (length, code, digits and duplicates)
+    def __init__(self, args):
+        self.args = args
+
+    def _filter_by_len(self, sentence):
+        len_sentence = len(sentence)
+        len_words = len(sentence.split(' '))
+        if len_sentence > self.args.char_length_filter_sentence and len_words > self.args.word_length_filter_sentence:
+            return True, None
+        return False, f'({len_sentence} chars, {len_words} words)'
+
+    def _filter_by_code(self, sentence):
+        value = len(CODE_KEYWORDS_PATTERN.findall(sentence)) / len(sentence.split()) + \
+                len(CODE_CHARS_PATTERN.findall(sentence)) / len(sentence)
+        if value > self.args.code_threshold:
+            return False, round(value, 2)
+        return True, None
+
+    def _filter_by_digits(self, sentence):
+        sentence_chars = ''.join(sentence.split())
+        value = sum(c.isdigit() for c in sentence_chars) / len(sentence_chars)
+        if value >= self.args.digits_filter_sentence:
+            return False, round(value, 2)
+        return True, None
+
+    def _filter_by_duplicate(self, sentence):
+        return sentence not in self.sentences_duplicate, None
+
+    def filter(self, sentences):
+        """
+        :return: (cleaned sentences, or '' for the rejected ones, and the operation of every sentence) tuple.
+        """
+        filters = [self._filter_by_len, self._filter_by_code, self._filter_by_digits]
+        if self.args.dedup_same_doc_sentences:
+            filters.append(self._filter_by_duplicate)
+        self.sentences_duplicate = set(sentence for sentence in sentences if sentences.count(sentence) > 1)
+        res, operations = [], []
+        for sentence in sentences:
+            operation = []
+            for filter_ in filters:
+                keep, value = filter_(sentence)
+                if not keep:
+                    operation.append(f'SentenceFilter-{filter_.__name__}' + f':{value}')
+                    break
+            res.append('' if operation else sentence)
+            operations.append(operation)
+        return res, operations
+
+
+def random_sentences(rng):
+    # Sentences with at least one word (the original filters divided by zero otherwise)
+    words = ['a', 'paraula', 'if', 'var', '1', '12345', '²', 'x=1;', '(f)', '{}', 'és', 'llarga']
+    sentences = [' '.join(rng.choice(words) for _ in range(rng.randint(1, 8))) for _ in range(rng.randint(1, 6))]
+    if rng.random() < 0.3:
+        sentences.append(rng.choice(sentences))
+    return sentences
+
+
+@pytest.mark.parametrize('options', [[], ['--dedup-same-doc-sentences'], ['--filter-order-sample', '5'],
+                                     ['--char-length-filter-sentence', '5', '--word-length-filter-sentence', '1',
+                                      '--code-threshold', '0.5', '--digits-filter-sentence', '0.3',
+                                      '--dedup-same-doc-sentences']])
+def test_sentence_filter_matches_reference(options):
+    args = get_args(options)
+    sentence_filter = SentenceFilter(args)
+    reference = ReferenceSentenceFilter(args)
+    rng = random.Random(0)
+    for _ in range(2000):
+        sentences = random_sentences(rng)
+        cleaned, _ = reference.filter(sentences)
+        # Without debug mode, the rejected sentences are removed, and documents without sentences are discarded
+        expected = [sentence for sentence in cleaned if sentence]
+        document = sentence_filter.apply(Document(content='', sentences=list(sentences)))
+        if not expected:
+            assert document is None, sentences
+        else:
+            assert list(document.sentences) == expected, sentences
+
+
+def test_sentence_filter_debug_matches_reference():
+    args = get_args(['--debug', '--dedup-same-doc-sentences', '--char-length-filter-sentence', '5',
+                     '--word-length-filter-sentence', '1'])
+    sentence_filter = SentenceFilter(args)
+    reference = ReferenceSentenceFilter(args)
+    rng = random.Random(1)
+    for _ in range(2000):
+        sentences = random_sentences(rng)
+        expected, expected_operations = reference.filter(sentences)
+        document = sentence_filter.apply(Document(content='', sentences=list(sentences), keep_original=True))
+        assert list(document.sentences) == expected, sentences
+        assert document.operations.sentence_operations(len(sentences)) == expected_operations, sentences
+
+
+@pytest.mark.parametrize('ratio,min_sentences', [(0.5, 4), (0.2, 1), (0.0, 10)])
+def test_early_rejection_matches_reference(ratio, min_sentences):
+    args = get_args(['--max-rejected-sentence-ratio', str(ratio), '--min-sentences-rejected-ratio',
+                     str(min_sentences)])
+    sentence_filter = SentenceFilter(args)
+    reference = ReferenceSentenceFilter(args)
+    rng = random.Random(2)
+    rejected_documents = 0
+    for _ in range(2000):
+        sentences = sum((random_sentences(rng) for _ in range(rng.randint(1, 3))), [])
+        cleaned, _ = reference.filter(sentences)
+        expected = [sentence for sentence in cleaned if sentence]
+        num_rejected = len(sentences) - len(expected)
+        if len(sentences) >= min_sentences and num_rejected > ratio * len(sentences):
+            # Whole document rejected, even if some sentences would have been kept
+            rejected_documents += len(expected) > 0
+            expected = []
+        document = sentence_filter.apply(Document(content='', sentences=list(sentences)))
+        if not expected:
+            assert document is None, sentences
+        else:
+            assert list(document.sentences) == expected, sentences
+    assert rejected_documents > 0
+
+
+@pytest.mark.parametrize('num_rejected,rejected', [(4, False), (5, False), (6, True)])
+def test_early_rejection_threshold(num_rejected, rejected):
+    # Rejected when strictly more than half of the 10 sentences are rejected (too short)
+    args = get_args(['--max-rejected-sentence-ratio', '0.5', '--min-sentences-rejected-ratio', '10'])
+    sentences = ['a'] * num_rejected + [f'una frase prou llarga {idx}' for idx in range(10 - num_rejected)]
+    document = SentenceFilter(args).apply(Document(content='', sentences=list(sentences)))
+    assert document is None if rejected else list(document.sentences) == sentences[num_rejected:]
+    # Below the minimum number of sentences, the rule doesn't apply
+    args.min_sentences_rejected_ratio = 11
+    document = SentenceFilter(args).apply(Document(content='', sentences=list(sentences)))
+    assert list(document.sentences) == sentences[num_rejected:]
+
+
+def test_early_rejection_debug():
+    args = get_args(['--debug', '--max-rejected-sentence-ratio', '0.5', '--min-sentences-rejected-ratio', '4'])
+    sentences = ['a', 'b', 'una frase prou llarga', 'c', 'una altra frase prou llarga']
+    document = SentenceFilter(args).apply(Document(content='', sentences=list(sentences), keep_original=True))
+    # Every sentence is emptied, and gets the whole-document operation with the observed ratio
+    assert list(document.sentences) == [''] * 5
+    operations = document.operations.sentence_operations(5)
+    assert all(operation[0] == 'SentenceFilter-_filter_by_rejected_ratio:0.6' for operation in operations)
+
+
+def lang_skip_filter(monkeypatch, options):
+    # The language models are not needed: sentences with 'xx' are in the wrong language
+    def identify_lang(self, idx):
+        return ('xx' not in self.sentences[idx].split()), '(0.5, en)'
+
+    monkeypatch.setattr(SentenceFilter, '_identify_lang', identify_lang)
+    args = get_args(['--lang-filter', 'ca', '--lang-skip-sentence-threshold', '0.8', '--lang-skip-sample-every', '3',
+                     '--char-length-filter-sentence', '0', '--word-length-filter-sentence', '0', '--code-threshold',
+                     '-1', '--digits-filter-sentence', '0', '--dedup-same-doc-sentences'] + options)
+    args.logger = PipelineLogger(logging.getLogger(__name__))
+    sentence_filter = SentenceFilter(args)
+    sentence_filter.filters.insert(0, sentence_filter._filter_by_lang)
+    sentence_filter.filter_order = AdaptiveFilterOrder(sentence_filter.filters, args.filter_order_sample,
+                                                       'SentenceFilter')
+    return sentence_filter
+
+
+def lang_skip_documents():
+    sentences = [f'frase {idx} xx' if idx in (0, 1, 3) else f'frase {idx}' for idx in range(7)]
+    return [Document(content='', sentences=list(sentences), language='ca', language_confidence=0.95),
+            Document(content='', sentences=list(sentences), language='ca', language_confidence=0.5),
+            Document(content='', sentences=list(sentences), language='es', language_confidence=0.99),
+            Document(content='', sentences=list(sentences), language='ca')]
+
+
+def test_lang_skip_sample_stats(monkeypatch, caplog):
+    sentence_filter = lang_skip_filter(monkeypatch, ['--filter-order-sample', '0'])
+    caplog.set_level(logging.INFO)
+    documents = list(sentence_filter(lang_skip_documents()))
+    # In the confident document, sentences 0, 3 and 6 are sampled (and 0 and 3 rejected), and sentence 1 is kept
+    kept = ['frase 2', 'frase 4', 'frase 5', 'frase 6']
+    assert [list(document.sentences) for document in documents] == [['frase 1 xx'] + kept] + [kept] * 3
+    assert 'skipped the language filter on 4 sentences of 1 documents' in caplog.text
+    assert '2 out of 3 sampled sentences were rejected (66.67%), so about 3 of the skipped sentences' in caplog.text
+    # The statistics are reset after being logged
+    assert (sentence_filter.lang_skip_documents, sentence_filter.lang_skip_sentences, sentence_filter.lang_skip_sampled,
+            sentence_filter.lang_skip_sampled_rejected) == (0, 0, 0, 0)
+
+
+def test_lang_skip_stats_leave_out_filter_order_sampling(monkeypatch):
+    # The first 5 sentences are evaluated by all the filters to measure them, so they are not counted
+    sentence_filter = lang_skip_filter(monkeypatch, ['--filter-order-sample', '5'])
+    sentence_filter.apply(lang_skip_documents()[0])
+    assert (sentence_filter.lang_skip_sentences, sentence_filter.lang_skip_sampled,
+            sentence_filter.lang_skip_sampled_rejected) == (1, 1, 0)
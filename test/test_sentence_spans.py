@@ -0,0 +1,32 @@
+import random
+import re
+import sentence_splitter
+from corpus_cleaner.sentence_spans import SentenceSpans
+
+KEYWORDS_PATTERN = re.compile('\\b(var|function|const|if|else|script)\\b')
+
+
+def random_texts(n=2000, seed=0):
+    rng = random.Random(seed)
+    words = ['Hola', 'món.', 'Adéu!', 'var', 'x=1;', '12', '²', 'Sr.', 'dia', '"Bon', 'dia."', '(a)', 'és']
+    separators = [' '] * 10 + ['  ', '\n', '\n\n', '\t', ' \n ']
+    for _ in range(n):
+        yield ''.join(rng.choice(words) + rng.choice(separators) for _ in range(rng.randint(0, 15)))
+
+
+def test_from_text_matches_from_sentences():
+    splitter = sentence_splitter.SentenceSplitter(language='ca')
+    mapped = 0
+    for text in random_texts():
+        sentences = splitter.split(text)
+        spans = SentenceSpans.from_text(text, sentences)
+        reference = SentenceSpans.from_sentences(sentences)
+        assert list(spans) == sentences, text
+        for attr in ('lengths', 'words', 'space_tokens', 'non_space', 'digits'):
+            assert getattr(spans, attr).tolist() == getattr(reference, attr).tolist(), (text, attr)
+        assert spans.count_matches(KEYWORDS_PATTERN).tolist() == reference.count_matches(KEYWORDS_PATTERN).tolist()
+        if '  ' not in text:
+            # The offsets point into the text, unless the splitter collapsed repeated spaces
+            assert spans.text is text, text
+            mapped += 1
+    assert mapped > 0
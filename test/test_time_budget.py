@@ -0,0 +1,60 @@
+import argparse
+import signal
+import time
+import pytest
+from corpus_cleaner.components.cleaner_component_mapper import CleanerComponentMapper
+from corpus_cleaner.document import Document
+from corpus_cleaner.time_budget import TimeBudget
+
+
+class Sleeper(CleanerComponentMapper):
+    # Busy loop (interrupted by the timer) for the number of seconds in the content of the document
+    def apply(self, document):
+        end = time.monotonic() + float(document.content)
+        while time.monotonic() < end:
+            pass
+        return document
+
+
+def run(time_budget, documents, n_mappers=3):
+    args = argparse.Namespace(debug=False, time_budget=time_budget)
+    for mapper in [Sleeper(args) for _ in range(n_mappers)]:
+        documents = mapper(documents)
+    return list(documents)
+
+
+def test_component_budget_interrupts_component():
+    time_budget = TimeBudget(component_budget=0.2)
+    t0 = time.monotonic()
+    res = run(time_budget, [Document(content='0'), Document(content='5'), Document(content='0.1')])
+    assert time.monotonic() - t0 < 2
+    # Dropped documents are not passed to the next components
+    assert [document.content for document in res] == ['0', '0.1']
+    assert time_budget.dropped == 1
+
+
+def test_document_budget_spans_components():
+    # Every component is within the component budget, but not the three of them within the document budget
+    time_budget = TimeBudget(document_budget=0.5, component_budget=1)
+    res = run(time_budget, [Document(content='0.3'), Document(content='0')])
+    assert [document.content for document in res] == ['0']
+
+
+def test_one_timer_per_document(monkeypatch):
+    calls = []
+    setitimer = signal.setitimer
+    monkeypatch.setattr(signal, 'setitimer', lambda *args: calls.append(args) or setitimer(*args))
+    res = run(TimeBudget(document_budget=10, component_budget=5), [Document(content='0') for _ in range(100)])
+    assert len(res) == 100
+    # One timer per document, and disarmed at the end of the stream
+    assert len(calls) == 101
+    assert calls[-1] == (signal.ITIMER_REAL, 0)
+    assert signal.getsignal(signal.SIGALRM) == signal.SIG_DFL
+
+
+def test_no_budget_skips_wrapper(monkeypatch):
+    def component(*args):
+        raise AssertionError('The budget should not be checked')
+
+    monkeypatch.setattr(TimeBudget, 'component', component)
+    assert len(run(TimeBudget(), [Document(content='0') for _ in range(10)])) == 10
@@ -0,0 +1,70 @@
+import random
+import re
+import pytest
+from corpus_cleaner.configs.langs import langs
+from corpus_cleaner.transforms import EmailReplacer, TagRemover, UrlReplacer
+
+# Original regular expressions of PreFilterer, which the transforms must reproduce
+TAGS_PATTERN = re.compile(' *(<.*?> ?)+ *')
+P_TAGS_PATTERN = re.compile(r'(\s*)(<p>)+')
+URLS_PATTERN2 = re.compile(r'(\[URL\]\.?\w*\s*)+')
+URL_ALPHABET = ['a', 'b', 'ñ', 'Ç', 'X', 'é', 'Z', '1', '.', '..', '@', '(', '(@', ')', ' ', '\n', '-', '_', '+', '&',
+                '=', '%', '\\', '—', '?', '#', ':', '/', 'http', 'http://', 'https://', 'www.', 'com', 'es', 'abcdefgh',
+                '[URL]', '[URL].']
+
+
+def lang_chars(lang):
+    return ''.join(char for char in langs[lang]['alphabet'] if char.isalpha())
+
+
+def emails_pattern(chars):
+    return re.compile(rf'[{chars}0-9_.+-]+@[a-zA-Z0-9-]+\.[a-z0-9-.]+')
+
+
+def urls_pattern(chars):
+    return re.compile(rf'\((@)?((http|https)://)?([{chars}0-9./?\\\\@\-—_=#])+\.[a-z]{{2,6}}'
+                      rf'([{chars}0-9&/\\\\+~*?%:!@—_=#()-])*')
+
+
+def random_texts(alphabet, n=20000, max_len=20, seed=0):
+    rng = random.Random(seed)
+    for _ in range(n):
+        yield ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_len)))
+
+
+def test_tag_remover_matches_regexes():
+    tag_remover = TagRemover()
+    alphabet = ['<', '>', ' ', '  ', '\n', '\t', '\r', 'a', 'b', 'p', '<p', '<p>', '<b>', '</p>', '>>']
+    for text in random_texts(alphabet):
+        expected = TAGS_PATTERN.subn(' ', P_TAGS_PATTERN.sub('\n', text))
+        assert tag_remover.remove(text) == expected, text
+
+
+def test_tag_remover_examples():
+    tag_remover = TagRemover()
+    assert tag_remover('<p>Hola <b>món</b> !') == '\nHola món !'
+    assert tag_remover('sense etiquetes') == 'sense etiquetes'
+    assert tag_remover('<' * 10000 + 'x') == '<' * 10000 + 'x'
+
+
+@pytest.mark.parametrize('lang', ['es', 'ca'])
+def test_email_replacer_matches_regex(lang):
+    email_replacer = EmailReplacer(lang_chars(lang))
+    pattern = emails_pattern(lang_chars(lang))
+    for text in random_texts(URL_ALPHABET, max_len=14, seed=1):
+        assert email_replacer.replace(text) == pattern.subn(' [EMAIL] ', text), text
+
+
+@pytest.mark.parametrize('lang', ['es', 'ca'])
+def test_url_replacer_matches_regexes(lang):
+    url_replacer = UrlReplacer(lang_chars(lang))
+    pattern = urls_pattern(lang_chars(lang))
+    for text in random_texts(URL_ALPHABET, max_len=14, seed=2):
+        assert url_replacer.replace(text) == URLS_PATTERN2.subn(' [URL] ', pattern.sub(' [URL] ', text)), text
+
+
+def test_replacers_examples():
+    chars = lang_chars('ca')
+    assert EmailReplacer(chars)('escriu a joan.puig@exemple.cat avui') == 'escriu a  [EMAIL]  avui'
+    # The second pattern also takes the whitespace after the placeholder
+    assert UrlReplacer(chars)('vegeu (http://www.exemple.cat/pàgina) i') == 'vegeu   [URL] i'